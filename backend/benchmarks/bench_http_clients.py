@@ -0,0 +1,104 @@
+"""Compare a fresh aiohttp session per call against the shared ClientRegistry pool.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_http_clients --requests 200 --concurrency 10
+
+The stub server runs on loopback without TLS, so the per-request saving shown
+here is a lower bound: against real providers every new connection also pays
+DNS resolution and a TLS handshake.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, List
+import aiohttp
+from aiohttp import web
+from services.http_clients import ClientRegistry
+
+class StubServer:
+    def __init__(self):
+        self.peers = set()
+        self.requests = 0
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.requests += 1
+        await request.read()
+        return web.json_response({"ok": True})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/search", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/search"
+
+    def reset(self):
+        self.peers.clear()
+        self.requests = 0
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+async def run(call: Callable[[], Awaitable[None]], total: int, concurrency: int) -> List[float]:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies
+
+def report(label: str, latencies: List[float], elapsed: float, server: StubServer):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(
+        f"{label:<18} requests={server.requests:<5} connections={len(server.peers):<5} "
+        f"mean={statistics.mean(latencies) * 1000:7.2f}ms p50={statistics.median(latencies) * 1000:7.2f}ms "
+        f"p95={p95 * 1000:7.2f}ms wall={elapsed:6.2f}s"
+    )
+
+async def main(total: int, concurrency: int):
+    server = StubServer()
+    await server.start()
+    payload = {"q": "jane.doe@example.com"}
+
+    async def session_per_request():
+        async with aiohttp.ClientSession() as session:
+            async with session.post(server.url, json=payload) as response:
+                await response.json()
+
+    registry = ClientRegistry()
+    await registry.start()
+
+    async def pooled():
+        async with registry.session().post(server.url, json=payload) as response:
+            await response.json()
+
+    try:
+        for label, call in (("session-per-call", session_per_request), ("pooled-registry", pooled)):
+            server.reset()
+            start = time.perf_counter()
+            latencies = await run(call, total, concurrency)
+            report(label, latencies, time.perf_counter() - start, server)
+    finally:
+        await registry.close()
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
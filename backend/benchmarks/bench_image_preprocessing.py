@@ -0,0 +1,121 @@
+"""Report bytes sent and end-to-end latency with and without image preprocessing.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_image_preprocessing --corpus path/to/cards --uplink-mbps 10
+
+Without --corpus a synthetic set of phone-style photos (12 MP, EXIF-rotated,
+card on a textured background) is generated. Each image is posted as the
+base64 data URL the transcription request would carry to a local stub that
+holds the response for as long as the upload would take at --uplink-mbps.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import random
+import statistics
+import time
+from typing import List, Tuple
+from aiohttp import web
+from PIL import Image, ImageDraw
+from config import IMAGE_MAX_DIMENSION, IMAGE_OUTPUT_QUALITY
+from services.http_clients import ClientRegistry
+from services.image_processing import preprocess_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+def synthetic_corpus(count: int) -> List[Tuple[str, bytes]]:
+    rng = random.Random(42)
+    corpus = []
+    for index in range(count):
+        width, height = 4000, 3000
+        photo = Image.effect_noise((width, height), 40).convert("RGB")
+        draw = ImageDraw.Draw(photo)
+        card_width, card_height = rng.randint(1800, 2600), rng.randint(1000, 1500)
+        left, top = rng.randint(200, width - card_width - 200), rng.randint(200, height - card_height - 200)
+        draw.rectangle((left, top, left + card_width, top + card_height), fill=(245, 245, 240))
+        for line in range(5):
+            draw.text((left + 120, top + 150 + line * 180), f"Card {index} line {line} jane.doe@example.com", fill=(20, 20, 20))
+
+        exif = Image.Exif()
+        exif[0x0112] = rng.choice([1, 3, 6, 8])  # Orientation
+        output = io.BytesIO()
+        photo.save(output, format="JPEG", quality=92, exif=exif)
+        corpus.append((f"synthetic-{index}.jpg", output.getvalue()))
+    return corpus
+
+def load_corpus(path: str) -> List[Tuple[str, bytes]]:
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(path, name), "rb") as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+async def start_stub(uplink_bytes_per_second: float) -> Tuple[web.AppRunner, str]:
+    async def handle(request: web.Request) -> web.Response:
+        body = await request.read()
+        await asyncio.sleep(len(body) / uplink_bytes_per_second)
+        return web.json_response({"ok": True})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+async def send(registry: ClientRegistry, url: str, image: bytes, media_type: str) -> int:
+    data_url = f"data:{media_type};base64,{base64.b64encode(image).decode('ascii')}"
+    payload = {"model": "gpt-4o", "messages": [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": data_url}}]}]}
+    async with registry.session().post(url, json=payload) as response:
+        await response.read()
+    return len(data_url)
+
+async def main(corpus: List[Tuple[str, bytes]], uplink_mbps: float, output_format: str):
+    runner, url = await start_stub(uplink_mbps * 1_000_000 / 8)
+    registry = ClientRegistry()
+    results = {"raw": [], "preprocessed": []}
+    try:
+        for name, content in corpus:
+            start = time.perf_counter()
+            sent = await send(registry, url, content, "image/jpeg")
+            results["raw"].append((sent, time.perf_counter() - start, 0.0))
+
+            start = time.perf_counter()
+            processed, media_type = await asyncio.to_thread(
+                preprocess_image, content, IMAGE_MAX_DIMENSION, output_format, IMAGE_OUTPUT_QUALITY
+            )
+            preprocess_time = time.perf_counter() - start
+            sent = await send(registry, url, processed, media_type)
+            results["preprocessed"].append((sent, time.perf_counter() - start, preprocess_time))
+    finally:
+        await registry.close()
+        await runner.cleanup()
+
+    print(f"{len(corpus)} images, uplink {uplink_mbps} Mbit/s, output {output_format} q{IMAGE_OUTPUT_QUALITY} max {IMAGE_MAX_DIMENSION}px")
+    for label, rows in results.items():
+        sent = [row[0] for row in rows]
+        latency = [row[1] for row in rows]
+        preprocess = [row[2] for row in rows]
+        print(
+            f"{label:<13} mean_bytes_sent={statistics.mean(sent) / 1024:9.1f}KiB "
+            f"total={sum(sent) / (1024 * 1024):8.2f}MiB "
+            f"mean_latency={statistics.mean(latency) * 1000:8.1f}ms "
+            f"p95_latency={sorted(latency)[int(len(latency) * 0.95) - 1] * 1000:8.1f}ms "
+            f"mean_preprocess={statistics.mean(preprocess) * 1000:6.1f}ms"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Directory of card images; a synthetic corpus is generated if omitted")
+    parser.add_argument("--count", type=int, default=10, help="Size of the synthetic corpus")
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "WEBP"])
+    args = parser.parse_args()
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    asyncio.run(main(corpus, args.uplink_mbps, args.format))
@@ -0,0 +1,122 @@
+"""Duplicate-lookup latency and accuracy of the lead index from 10k to 1M leads.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_lead_index --sizes 10000,100000,1000000
+
+For each size the index is backfilled with synthetic leads. It is then
+queried with three kinds of lead: exact duplicates (same email), fuzzy
+duplicates (a misread name, a company suffix dropped, no email and a new
+phone number) and people who are not in the index. The report covers
+lookup latency percentiles, recall on the duplicates, the false-match rate
+on new people and the peak resident memory of the process.
+"""
+import argparse
+import random
+import resource
+import string
+import tempfile
+import time
+from typing import List, Tuple
+from models.lead import Lead
+from services.lead_index import LeadIndex, indexed_lead
+
+FIRST_NAMES = [
+    "james", "mary", "robert", "patricia", "john", "jennifer", "michael", "linda", "david", "elizabeth",
+    "william", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah", "charles", "karen",
+    "wei", "li", "priya", "arjun", "fatima", "omar", "sofia", "mateo", "yuki", "hiroshi", "olga", "ivan",
+    "amara", "kwame", "ingrid", "lars", "chloe", "lucas", "ana", "diego",
+]
+SYLLABLES = ["ka", "lo", "mi", "ren", "dor", "sa", "vik", "tan", "bel", "no", "ra", "sten", "ul", "gar", "pe", "zin"]
+COMPANY_SUFFIXES = ["Inc", "LLC", "Ltd", "GmbH", "Corp", ""]
+
+def word(rng: random.Random, parts: int) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+def synthetic_leads(count: int, rng: random.Random) -> List[Lead]:
+    surnames = [word(rng, rng.randint(2, 3)) for _ in range(max(2000, count // 50))]
+    companies = [f"{word(rng, rng.randint(2, 3))} {word(rng, 2)}" for _ in range(max(1000, count // 20))]
+    leads = []
+    for index in range(count):
+        first, last = rng.choice(FIRST_NAMES).capitalize(), rng.choice(surnames)
+        company = rng.choice(companies)
+        # construct() skips validation, which would otherwise dominate the backfill at 1M leads
+        leads.append(Lead.construct(
+            name=f"{first} {last}",
+            email=f"{first.lower()}.{last.lower()}.{index}@{company.split()[0].lower()}.com",
+            phone=f"+1{rng.randint(2000000000, 9999999999)}",
+            company=f"{company} {rng.choice(COMPANY_SUFFIXES)}".strip(),
+        ))
+    return leads
+
+def misread(value: str, rng: random.Random) -> str:
+    position = rng.randrange(len(value))
+    return value[:position] + rng.choice(string.ascii_lowercase.replace(value[position].lower(), "")) + value[position + 1:]
+
+def queries(leads: List[Lead], count: int, rng: random.Random) -> List[Tuple[str, Lead]]:
+    result = []
+    for _ in range(count):
+        source = rng.choice(leads)
+        kind = rng.choice(["exact", "fuzzy", "new"])
+        if kind == "exact":
+            lead = Lead.construct(name=source.name, email=source.email, phone=None, company=source.company)
+        elif kind == "fuzzy":
+            first, last = source.name.split()
+            company = source.company.rsplit(" ", 1)[0] if source.company.endswith(tuple(COMPANY_SUFFIXES[:-1])) else source.company
+            lead = Lead.construct(name=f"{first} {misread(last, rng)}", email=None, phone=f"+44{rng.randint(1000000000, 9999999999)}", company=company)
+        else:
+            lead = Lead.construct(
+                name=f"{rng.choice(FIRST_NAMES).capitalize()} {word(rng, 4)}",
+                email=f"{word(rng, 3).lower()}@example.org",
+                phone=f"+49{rng.randint(1000000000, 9999999999)}",
+                company=f"{word(rng, 3)} Labs",
+            )
+        result.append((kind, lead))
+    return result
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run(size: int, lookups: int, seed: int):
+    rng = random.Random(seed)
+    leads = synthetic_leads(size, rng)
+    with tempfile.TemporaryDirectory() as directory:
+        index = LeadIndex(f"{directory}/leads.sqlite3")
+        start = time.perf_counter()
+        index.bulk_add(leads)
+        build_seconds = time.perf_counter() - start
+
+        latencies = {"exact": [], "fuzzy": [], "new": []}
+        found = {"exact": 0, "fuzzy": 0, "new": 0}
+        for kind, lead in queries(leads, lookups, rng):
+            start = time.perf_counter()
+            (match,) = index.lookup([indexed_lead(lead)])
+            latencies[kind].append((time.perf_counter() - start) * 1e6)
+            found[kind] += match is not None
+        stats = index.stats()
+        index.close()
+
+    every = [latency for values in latencies.values() for latency in values]
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{size:>9,} leads  build {build_seconds:6.1f}s  "
+        f"lookup p50 {percentile(every, 0.5):6.1f}us  p99 {percentile(every, 0.99):7.1f}us  "
+        f"fuzzy p99 {percentile(latencies['fuzzy'], 0.99):7.1f}us  "
+        f"recall exact {found['exact'] / max(len(latencies['exact']), 1):.1%}  "
+        f"fuzzy {found['fuzzy'] / max(len(latencies['fuzzy']), 1):.1%}  "
+        f"false matches {found['new'] / max(len(latencies['new']), 1):.1%}  "
+        f"largest block {stats['largest_block']}  peak RSS {peak_rss_mb:,.0f}MB"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    for size in (int(value) for value in args.sizes.split(",")):
+        run(size, args.lookups, args.seed)
+
+if __name__ == "__main__":
+    main()
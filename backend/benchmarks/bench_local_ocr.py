@@ -0,0 +1,140 @@
+"""Accuracy, latency and model-call avoidance of the local OCR fast path.
+
+Run from the backend directory (needs pytesseract and the tesseract binary):
+
+    python -m benchmarks.bench_local_ocr --cards 60
+    python -m benchmarks.bench_local_ocr --corpus path/to/cards
+
+Without --corpus a synthetic set of cards is rendered, with the ground truth
+known. A third are clean prints, a third have low contrast and a third are
+blurred and slightly rotated, so the set exercises both acceptance and
+escalation. A real corpus is a directory of card images plus a labels.json
+that maps each file name to its expected fields.
+
+Every card goes through the same preprocessing and read_card call as a
+scan. The report covers the share of cards accepted locally (the scans that
+would not call the model), per-field accuracy on the accepted cards, and
+OCR latency percentiles.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+from config import IMAGE_MAX_DIMENSION, IMAGE_OUTPUT_FORMAT, IMAGE_OUTPUT_QUALITY, LOCAL_OCR_MIN_CONFIDENCE
+from services.image_processing import preprocess_image
+from services.local_ocr import find_tesseract, read_card
+from utils.normalization import normalize_email, normalize_phone, normalize_text
+
+FIELDS = ("name", "job_title", "company", "email", "phone")
+FIRST_NAMES = ["Jane", "Omar", "Priya", "Lucas", "Ingrid", "Kwame", "Sofia", "Hiroshi", "Chloe", "Diego"]
+LAST_NAMES = ["Doe", "Haddad", "Raman", "Moreau", "Larsen", "Mensah", "Rossi", "Tanaka", "Martin", "Alvarez"]
+TITLES = ["Chief Technology Officer", "Sales Director", "Product Manager", "Senior Engineer", "Founder"]
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Stark", "Wayne", "Hooli", "Vandelay"]
+SUFFIXES = ["Inc", "LLC", "Ltd", "GmbH"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+def render_card(fields: Dict[str, str], variant: str, rng: random.Random) -> bytes:
+    card = Image.new("RGB", (1050, 600), (250, 250, 246))
+    draw = ImageDraw.Draw(card)
+    ink = (20, 20, 20) if variant != "low_contrast" else (150, 150, 150)
+    rows = [
+        (fields["name"], 56, 70),
+        (fields["job_title"], 32, 150),
+        (fields["company"], 36, 210),
+        (fields["email"], 28, 380),
+        (fields["phone"], 28, 430),
+        (fields["website"], 28, 480),
+    ]
+    for text, size, top in rows:
+        draw.text((80, top), text, fill=ink, font=ImageFont.load_default(size=size))
+
+    if variant == "low_contrast":
+        card = ImageEnhance.Contrast(card).enhance(0.5)
+    elif variant == "degraded":
+        card = card.filter(ImageFilter.GaussianBlur(2.2)).rotate(rng.uniform(-4, 4), expand=True, fillcolor=(250, 250, 246))
+    output = io.BytesIO()
+    card.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+def synthetic_corpus(count: int) -> List[Tuple[str, bytes, Dict[str, str]]]:
+    rng = random.Random(11)
+    corpus = []
+    for index in range(count):
+        first, last, company = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(COMPANIES)
+        fields = {
+            "name": f"{first} {last}",
+            "job_title": rng.choice(TITLES),
+            "company": f"{company} {rng.choice(SUFFIXES)}",
+            "email": f"{first.lower()}.{last.lower()}@{company.lower()}.com",
+            "phone": f"+1 ({rng.randint(200, 989)}) {rng.randint(200, 989)}-{rng.randint(1000, 9999)}",
+            "website": f"www.{company.lower()}.com",
+        }
+        variant = ("clean", "low_contrast", "degraded")[index % 3]
+        corpus.append((f"{variant}-{index}.jpg", render_card(fields, variant, rng), fields))
+    return corpus
+
+def load_corpus(path: str) -> List[Tuple[str, bytes, Dict[str, str]]]:
+    with open(os.path.join(path, "labels.json")) as f:
+        labels = json.load(f)
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(IMAGE_EXTENSIONS) and name in labels:
+            with open(os.path.join(path, name), "rb") as f:
+                corpus.append((name, f.read(), labels[name]))
+    return corpus
+
+def same_value(field: str, expected: str, actual: str) -> bool:
+    if field == "email":
+        return normalize_email(expected) == normalize_email(actual)
+    if field == "phone":
+        return normalize_phone(expected) == normalize_phone(actual)
+    return normalize_text(expected) == normalize_text(actual)
+
+def main(corpus: List[Tuple[str, bytes, Dict[str, str]]]):
+    latencies = []
+    accepted = 0
+    correct = {field: 0 for field in FIELDS}
+    expected_counts = {field: 0 for field in FIELDS}
+    by_variant: Dict[str, List[bool]] = {}
+    for name, content, expected in corpus:
+        processed, _ = preprocess_image(content, IMAGE_MAX_DIMENSION, IMAGE_OUTPUT_FORMAT, IMAGE_OUTPUT_QUALITY)
+        start = time.perf_counter()
+        result = read_card(processed)
+        latencies.append((time.perf_counter() - start) * 1000)
+        by_variant.setdefault(name.split("-")[0], []).append(result.accepted)
+        if not result.accepted:
+            continue
+        accepted += 1
+        for field in FIELDS:
+            if expected.get(field):
+                expected_counts[field] += 1
+                correct[field] += same_value(field, expected[field], result.fields.get(field, ""))
+
+    latencies.sort()
+    print(f"{len(corpus)} cards, acceptance threshold {LOCAL_OCR_MIN_CONFIDENCE}")
+    print(f"  avoided the model: {accepted / len(corpus):.1%}")
+    for variant, outcomes in sorted(by_variant.items()):
+        print(f"    {variant:<13} {sum(outcomes) / len(outcomes):.1%} accepted")
+    print("  field accuracy on accepted cards:")
+    for field in FIELDS:
+        if expected_counts[field]:
+            print(f"    {field:<10} {correct[field] / expected_counts[field]:.1%}")
+    print(
+        f"  OCR latency: p50 {statistics.median(latencies):.0f}ms  "
+        f"p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.0f}ms"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Directory of card images with a labels.json of expected fields")
+    parser.add_argument("--cards", type=int, default=60, help="Synthetic cards to render when no corpus is given")
+    args = parser.parse_args()
+    if not find_tesseract():
+        sys.exit("Local OCR is unavailable: install pytesseract and the tesseract binary.")
+    main(load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.cards))
@@ -0,0 +1,55 @@
+"""Prompt tokens of the public-data summary before and after compaction.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_prompt_compaction
+    python -m benchmarks.bench_prompt_compaction --budget 800 --show executive
+
+Each fixture in benchmarks/fixtures/public_data holds the Serper and
+Perplexity payloads for one contact, in the shape the providers return them
+(the people and companies are fictional). For each one the report compares
+the previous prompt data (the payloads dumped as indented JSON) with the
+compacted text. Token counts come from tiktoken when it is installed and
+from the local estimate otherwise. Compaction time is reported too.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from config import SUMMARY_PROMPT_TOKEN_BUDGET
+from services.prompt_compaction import compact_public_data, estimate_tokens, tiktoken
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "public_data")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=SUMMARY_PROMPT_TOKEN_BUDGET)
+    parser.add_argument("--show", help="Print the compacted text of this fixture")
+    args = parser.parse_args()
+
+    print(f"token counts from {'tiktoken (o200k_base)' if tiktoken else 'the local estimate'}, budget {args.budget}")
+    total_before = total_after = 0
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.json"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as f:
+            source_data = json.load(f)
+
+        before = estimate_tokens(json.dumps(source_data, indent=2))
+        start = time.perf_counter()
+        compacted = compact_public_data(source_data, args.budget)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        total_before += before
+        total_after += compacted.tokens
+        print(
+            f"  {name:<14} {before:>6} -> {compacted.tokens:>5} tokens  "
+            f"({1 - compacted.tokens / before:.0%} fewer, {compacted.dropped_items} items over budget)  "
+            f"{elapsed_ms:.2f}ms"
+        )
+        if name == args.show:
+            print(compacted.text)
+    if total_before:
+        print(f"  {'total':<14} {total_before:>6} -> {total_after:>5} tokens  ({1 - total_after / total_before:.0%} fewer)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Startup time and memory per worker of the API.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --workers 1,4,8 --runs 5
+
+First, `import main` is timed in fresh interpreters (the median of --runs),
+with the heaviest modules it pulls in. Then, for each worker count, the app
+is started the way it is deployed (`python main.py` with WORKERS set, on a
+temporary DATA_DIR) and the report covers the time until it answers its
+first request and the memory of each worker process: once when it is first
+up, and again after --settle seconds, once the OpenAI SDK has been loaded in
+the background. Memory is the proportional set size from /proc, so pages
+shared between processes are not counted twice; it is only reported on
+Linux.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from benchmarks.load_test import BACKEND_DIR, free_port, process_tree, wait_for
+
+APP_PACKAGES = ("main", "config", "routers", "services", "utils", "models", "encodings", "site")
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+print(" ".join(name for name in ("openai", "httpx", "pytesseract", "tiktoken") if name in sys.modules))
+"""
+
+def import_time(runs: int) -> None:
+    timings = []
+    loaded = ""
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        timings.append(float(output[0]))
+        loaded = output[1] if len(output) > 1 else ""
+    print(f"import main   median {statistics.median(timings) * 1000:7.0f}ms  min {min(timings) * 1000:7.0f}ms  "
+          f"optional SDKs loaded at import: {loaded or 'none'}")
+
+    report = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stderr
+    # Third-party packages by cumulative import time, charged to whichever module imported them first
+    packages: Dict[str, int] = {}
+    for line in report.splitlines()[1:]:
+        _, cumulative, name = (part.strip() for part in line.split("|"))
+        package = name.split(".")[0]
+        if cumulative.isdigit() and package not in APP_PACKAGES:
+            packages[package] = max(packages.get(package, 0), int(cumulative))
+    for name, microseconds in sorted(packages.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {name:<24} {microseconds / 1000:7.0f}ms")
+
+def memory_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("Pss:")) / 1024
+    except (OSError, StopIteration):
+        return None
+
+def worker_memory(pid: int, workers: int) -> Tuple[List[float], float]:
+    # (each worker, everything else); with one worker uvicorn serves from the main process, with more the
+    # main process only supervises the spawned workers, next to multiprocessing's resource tracker
+    if workers == 1:
+        return [memory_mb(pid) or 0.0], 0.0
+    worker_pids, other_pids = [], []
+    for process in process_tree(pid):
+        try:
+            with open(f"/proc/{process}/cmdline", "rb") as f:
+                spawned = b"spawn_main" in f.read()
+        except OSError:
+            continue
+        (worker_pids if spawned else other_pids).append(process)
+    return [memory_mb(process) or 0.0 for process in worker_pids], sum(memory_mb(process) or 0.0 for process in other_pids)
+
+def start_app(workers: int, settle: float) -> None:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ, HOST="127.0.0.1", PORT=str(port), WORKERS=str(workers), DATA_DIR=data_dir, LOG_LEVEL="WARNING")
+        start = time.perf_counter()
+        app = subprocess.Popen([sys.executable, "main.py"], cwd=BACKEND_DIR, env=env)
+        try:
+            wait_for(f"http://127.0.0.1:{port}/metrics", timeout=60, process=app)
+            ready = time.perf_counter() - start
+            # The first answer can come from the first worker up; the rest are given a moment
+            time.sleep(0.5 if workers > 1 else 0)
+            up, _ = worker_memory(app.pid, workers)
+            time.sleep(settle)
+            settled, overhead = worker_memory(app.pid, workers)
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+
+    line = f"workers={workers:<3} first response {ready * 1000:7.0f}ms"
+    if os.path.isdir("/proc"):
+        line += (f"  per worker {statistics.mean(up):5.1f}MB at startup, {statistics.mean(settled):5.1f}MB settled"
+                 f"  supervisor {overhead:5.1f}MB  total {sum(settled) + overhead:6.1f}MB")
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--settle", type=float, default=3.0, help="Seconds to wait before measuring memory again")
+    args = parser.parse_args()
+
+    import_time(args.runs)
+    for workers in (int(value) for value in args.workers.split(",")):
+        start_app(workers, args.settle)
+
+if __name__ == "__main__":
+    main()
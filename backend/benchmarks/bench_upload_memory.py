@@ -0,0 +1,70 @@
+"""Peak Python heap for N concurrent image uploads on the old and new upload paths.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_upload_memory --uploads 8 --size-mb 10
+
+Each simulated request reads its UploadFile, builds the data URL sent to the
+model and then waits, as if the transcription call were in flight, until
+every request has reached that point. Peak memory is measured with
+tracemalloc. Preprocessing is skipped so only the read/encode path differs.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import tracemalloc
+from tempfile import SpooledTemporaryFile
+from typing import Awaitable, Callable, List
+from fastapi import UploadFile
+from services.image_processing import encode_data_url, read_image_upload
+
+def make_uploads(count: int, size: int) -> List[UploadFile]:
+    uploads = []
+    for index in range(count):
+        # Same spooling threshold Starlette uses for multipart files
+        spooled = SpooledTemporaryFile(max_size=1024 * 1024)
+        spooled.write(b"\xff\xd8\xff\xe0" + os.urandom(size - 4))
+        spooled.seek(0)
+        uploads.append(UploadFile(file=spooled, filename=f"card-{index}.jpg", size=size))
+    return uploads
+
+async def old_path(upload: UploadFile, in_flight: asyncio.Barrier):
+    image_content = await upload.read()
+    base64_image = base64.b64encode(image_content).decode("utf-8")
+    content = f"data:image/jpeg;base64,{base64_image}"
+    await in_flight.wait()
+    return len(content)
+
+async def new_path(upload: UploadFile, in_flight: asyncio.Barrier):
+    image_content = await read_image_upload(upload)
+    image_url = encode_data_url(image_content, "image/jpeg")
+    await in_flight.wait()
+    return len(image_url)
+
+async def measure(path: Callable[[UploadFile, asyncio.Barrier], Awaitable[int]], count: int, size: int) -> int:
+    uploads = make_uploads(count, size)
+    in_flight = asyncio.Barrier(count)
+    tracemalloc.start()
+    try:
+        await asyncio.gather(*(path(upload, in_flight) for upload in uploads))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for upload in uploads:
+            await upload.close()
+    return peak
+
+async def main(count: int, size_mb: float):
+    size = int(size_mb * 1024 * 1024)
+    print(f"{count} concurrent uploads of {size_mb}MB")
+    for label, path in (("read+b64+fstring", old_path), ("chunked+data_url", new_path)):
+        peak = await measure(path, count, size)
+        print(f"{label:<18} peak={peak / (1024 * 1024):8.1f}MiB per_request={peak / count / size:5.2f}x image size")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--size-mb", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.uploads, args.size_mb))
@@ -0,0 +1,381 @@
+"""Load test of the API against local stand-ins for every provider.
+
+Run from the backend directory:
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --scenarios scan --concurrency 1,8,32,64 --duration 30
+    python -m benchmarks.load_test --error-rate 0.05 --latency openai=2.5,perplexity=4
+    python -m benchmarks.load_test --compare benchmarks/results/load-20240603-101500.json
+
+The app is started with `python main.py` in a child process. Its OpenAI,
+Perplexity, Serper and Zoho endpoints point at a stub server, which runs in a
+second child process and replays the responses recorded in
+benchmarks/fixtures. Each provider answers after its configured latency
+(+-50% jitter). --error-rate is the share of calls answered with an error
+instead: half are 429s with Retry-After and half are 503s, so the rate
+limiter's retries and the circuit breaker are exercised as well.
+
+Each scenario (scan: POST /scan-business-card, gather: POST
+/gather-public-data, crm: POST /send-to-crm/zoho) is driven by a closed loop
+of N concurrent clients for --duration seconds, for every N in
+--concurrency. The report covers p50/p95/p99 latency, throughput, errors and
+the peak resident memory and open sockets of the app, its worker processes
+included (--env WORKERS=4 runs four of them). Results are saved as JSON
+under benchmarks/results. --compare prints the change against an earlier
+run.
+
+The transcription and enrichment caches are disabled unless --cache is
+given, so every request goes through the whole pipeline. The outbound rate
+limits for OpenAI, Perplexity and Serper are raised out of the way unless
+--keep-rate-limits is given. The Zoho adapter keeps its own limit of 10
+requests a second per connected account, which caps the crm scenario.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(BACKEND_DIR, "benchmarks", "fixtures")
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+SCENARIOS = ("scan", "gather", "crm")
+DEFAULT_LATENCY = {"openai": 1.2, "perplexity": 2.0, "serper": 0.4, "zoho": 0.3}
+API_HEADERS = {"api-key": "test"}
+# Shared by every level of a run, so no two requests send the same contact (the crm scenario would
+# otherwise turn into upserts of leads the index has already seen)
+request_numbers = itertools.count()
+
+def load_fixture(*path: str) -> Dict[str, Any]:
+    with open(os.path.join(FIXTURES, *path)) as f:
+        return json.load(f)
+
+class ProviderStub:
+    def __init__(self, latency: Dict[str, float], error_rate: float, seed: int):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.transcription = load_fixture("providers", "openai_transcription.json")
+        self.summary = load_fixture("providers", "openai_summary.json")
+        self.perplexity_response = load_fixture("providers", "perplexity.json")
+        self.zoho_response = load_fixture("providers", "zoho_leads.json")
+        self.serper_response = load_fixture("public_data", "executive.json")["serper_data"]
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/openai/v1/chat/completions", self.openai)
+        app.router.add_post("/perplexity/chat/completions", self.perplexity)
+        app.router.add_post("/serper/search", self.serper)
+        app.router.add_post("/zoho/crm/v2/Leads", self.zoho)
+        app.router.add_post("/zoho/crm/v2/Leads/upsert", self.zoho)
+        return app
+
+    async def openai(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        # Transcriptions ask for structured output; summaries do not
+        return await self.reply("openai", self.transcription if "response_format" in body else self.summary)
+
+    async def perplexity(self, request: web.Request) -> web.Response:
+        await request.read()
+        return await self.reply("perplexity", self.perplexity_response)
+
+    async def serper(self, request: web.Request) -> web.Response:
+        await request.read()
+        return await self.reply("serper", self.serper_response)
+
+    async def zoho(self, request: web.Request) -> web.Response:
+        records = (await request.json()).get("data") or [{}]
+        # One result per record sent, as Zoho answers a bulk insert
+        return await self.reply("zoho", {"data": self.zoho_response["data"][:1] * len(records)}, status=201)
+
+    async def reply(self, provider: str, payload: Dict[str, Any], status: int = 200) -> web.Response:
+        await asyncio.sleep(self.latency.get(provider, 0) * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < self.error_rate:
+            if self.rng.random() < 0.5:
+                return web.json_response({"error": {"message": "Rate limit reached"}}, status=429, headers={"Retry-After": "1"})
+            return web.json_response({"error": {"message": "Service unavailable"}}, status=503)
+        return web.json_response(payload, status=status)
+
+def serve_stub(port: int, latency: Dict[str, float], error_rate: float, seed: int):
+    web.run_app(ProviderStub(latency, error_rate, seed).app(), host="127.0.0.1", port=port, print=None, access_log=None)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(url: str, timeout: float, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"The app exited during startup with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    sys.exit(f"{url} did not come up within {timeout:.0f}s")
+
+def app_environment(stub_url: str, data_dir: str, args: argparse.Namespace) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        OPENAI_API_KEY="load-test",
+        PERPLEXITY_API_KEY="load-test",
+        SERPER_API_KEY="load-test",
+        OPENAI_BASE_URL=f"{stub_url}/openai/v1",
+        PERPLEXITY_BASE_URL=f"{stub_url}/perplexity",
+        SERPER_URL=f"{stub_url}/serper/search",
+        ZOHO_API_BASE_URL=f"{stub_url}/zoho",
+        DATA_DIR=data_dir,
+        LOG_LEVEL="WARNING",
+    )
+    if not args.cache:
+        env.update(TRANSCRIPTION_CACHE_BACKEND="none", ENRICHMENT_CACHE_BACKEND="none")
+    if not args.keep_rate_limits:
+        for provider in ("OPENAI", "PERPLEXITY", "SERPER"):
+            env.update({f"RATE_LIMIT_{provider}_RPS": "100000", f"RATE_LIMIT_{provider}_BURST": "100000"})
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        env[key] = value
+    return env
+
+def card_image(index: int) -> bytes:
+    # Distinct pixels per request, so a cache (if enabled) only hits where a real client would repeat
+    rng = random.Random(index)
+    image = Image.new("RGB", (1050, 600), (250, 250, 246))
+    draw = ImageDraw.Draw(image)
+    for row, size in enumerate((48, 28, 28, 24, 24)):
+        draw.rectangle((80, 80 + row * 90, 80 + rng.randint(300, 800), 80 + row * 90 + size), fill=(30, 30, 30))
+    draw.point([(rng.randrange(1050), rng.randrange(600)) for _ in range(50)], fill=(200, 0, 0))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+def build_request(scenario: str, index: int, images: List[bytes]) -> Dict[str, Any]:
+    if scenario == "scan":
+        return {"method": "POST", "url": "/scan-business-card", "headers": API_HEADERS,
+                "files": {"image": (f"card-{index}.jpg", images[index % len(images)], "image/jpeg")}}
+    if scenario == "gather":
+        return {"method": "POST", "url": "/gather-public-data", "headers": API_HEADERS,
+                "json": {"email": f"contact.{index}@example.com"}}
+    return {"method": "POST", "url": "/send-to-crm/zoho", "headers": {**API_HEADERS, "Authorization": "Bearer load-test"},
+            "json": {"name": f"Load Test {index}", "email": f"lead.{index}@example.com", "company": f"Company {index}"}}
+
+def process_tree(pid: int) -> List[int]:
+    # The app and its uvicorn workers; read from /proc, so memory and sockets are only reported on Linux
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parent = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+def sample_resources(pid: int) -> Tuple[Optional[float], Optional[int]]:
+    if not os.path.isdir("/proc"):
+        return None, None
+    rss_kb, sockets = 0, 0
+    for process in process_tree(pid):
+        try:
+            with open(f"/proc/{process}/status") as f:
+                rss_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            for fd in os.listdir(f"/proc/{process}/fd"):
+                sockets += os.readlink(f"/proc/{process}/fd/{fd}").startswith("socket:")
+        except (OSError, StopIteration):
+            continue
+    return rss_kb / 1024, sockets
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def drive(base_url: str, scenario: str, concurrency: int, duration: float, images: List[bytes], pid: Optional[int]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    peak_rss, peak_sockets = 0.0, 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def worker():
+            # Every client sends at least one request, then keeps going until the time is up
+            while True:
+                request = build_request(scenario, next(request_numbers), images)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(**request)
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+                if time.perf_counter() >= stop_at:
+                    return
+
+        async def sampler():
+            nonlocal peak_rss, peak_sockets
+            while True:
+                rss, sockets = await asyncio.to_thread(sample_resources, pid)
+                if rss is not None:
+                    peak_rss, peak_sockets = max(peak_rss, rss), max(peak_sockets, sockets)
+                await asyncio.sleep(0.25)
+
+        sampling = asyncio.ensure_future(sampler()) if pid is not None else None
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        if sampling is not None:
+            sampling.cancel()
+
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "rps": round(ok / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "statuses": dict(statuses),
+        "peak_rss_mb": round(peak_rss, 1) if pid is not None else None,
+        "peak_sockets": peak_sockets if pid is not None else None,
+    }
+
+def print_result(result: Dict[str, Any]):
+    resources = ""
+    if result["peak_rss_mb"] is not None:
+        resources = f"  rss {result['peak_rss_mb']:7.1f}MB  sockets {result['peak_sockets']:4d}"
+    print(
+        f"{result['scenario']:<7} c={result['concurrency']:<4} {result['requests']:>6} req  {result['rps']:8.2f} rps  "
+        f"p50 {result['p50_ms']:8.1f}ms  p95 {result['p95_ms']:8.1f}ms  p99 {result['p99_ms']:8.1f}ms  "
+        f"errors {result['errors']:>4}{resources}"
+    )
+
+def compare(results: List[Dict[str, Any]], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(result["scenario"], result["concurrency"]): result for result in json.load(f)["results"]}
+    print(f"\nchange against {baseline_path}:")
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        changes = []
+        for field in ("rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"):
+            if result.get(field) is not None and before.get(field):
+                changes.append(f"{field} {(result[field] - before[field]) / before[field]:+.1%}")
+        print(f"  {result['scenario']:<7} c={result['concurrency']:<4} " + "  ".join(changes))
+
+def parse_latency(value: str) -> Dict[str, float]:
+    latency = dict(DEFAULT_LATENCY)
+    for item in filter(None, value.split(",")):
+        provider, _, seconds = item.partition("=")
+        latency[provider.strip()] = float(seconds)
+    return latency
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per scenario and concurrency level")
+    parser.add_argument("--latency", type=parse_latency, default=dict(DEFAULT_LATENCY), help="Mean provider latency in seconds, e.g. openai=1.2,serper=0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="Keep the transcription and enrichment caches enabled")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="Keep the configured outbound rate limits")
+    parser.add_argument("--env", action="append", default=[], help="Extra KEY=VALUE for the app, e.g. WORKERS=4")
+    parser.add_argument("--app-url", help="Drive an app that is already running instead of starting one")
+    parser.add_argument("--output", help="Where to save the results (default: benchmarks/results/load-<time>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    images = [card_image(index) for index in range(64)]
+
+    stub = app = None
+    data_dir = tempfile.TemporaryDirectory()
+    try:
+        if args.app_url:
+            base_url, pid = args.app_url.rstrip("/"), None
+        else:
+            stub_port, app_port = free_port(), free_port()
+            stub = multiprocessing.Process(target=serve_stub, args=(stub_port, args.latency, args.error_rate, args.seed), daemon=True)
+            stub.start()
+            env = app_environment(f"http://127.0.0.1:{stub_port}", data_dir.name, args)
+            env.update(HOST="127.0.0.1", PORT=str(app_port))
+            # Started the way it is deployed, so --env WORKERS=4 runs four worker processes
+            app = subprocess.Popen([sys.executable, "main.py"], cwd=BACKEND_DIR, env=env)
+            base_url, pid = f"http://127.0.0.1:{app_port}", app.pid
+            wait_for(f"{base_url}/metrics", timeout=60, process=app)
+
+        print(f"latency {args.latency}  error rate {args.error_rate:.0%}  cache {'on' if args.cache else 'off'}")
+        results = []
+        for scenario in scenarios:
+            # One unmeasured request first, so connection setup and lazy imports are not in the numbers
+            asyncio.run(drive(base_url, scenario, 1, 0, images, None))
+            for level in levels:
+                result = asyncio.run(drive(base_url, scenario, level, args.duration, images, pid))
+                print_result(result)
+                results.append(result)
+    finally:
+        if app is not None:
+            app.terminate()
+            app.wait(timeout=30)
+        if stub is not None:
+            stub.terminate()
+        data_dir.cleanup()
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("load-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    run = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "cache": args.cache,
+            "keep_rate_limits": args.keep_rate_limits,
+            "env": args.env,
+            "duration": args.duration,
+            "git_revision": git_revision(),
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"saved to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    main()
@@ -6,20 +6,188 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
+# Provider endpoints; overridden to point the app at local stand-ins (see benchmarks/load_test.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+PERPLEXITY_BASE_URL = os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai")
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
 
 # Zoho CRM configuration
 ZOHO_CLIENT_ID = os.getenv("ZOHO_CLIENT_ID")
 ZOHO_CLIENT_SECRET = os.getenv("ZOHO_CLIENT_SECRET")
 ZOHO_REDIRECT_URI = os.getenv("ZOHO_REDIRECT_URI")
+ZOHO_API_BASE_URL = os.getenv("ZOHO_API_BASE_URL", "https://www.zohoapis.com")
+ZOHO_ACCOUNTS_URL = os.getenv("ZOHO_ACCOUNTS_URL", "https://accounts.zoho.com")
 
-# SALESFORCE_CLIENT_ID = os.getenv("SALESFORCE_CLIENT_ID")
-# SALESFORCE_CLIENT_SECRET = os.getenv("SALESFORCE_CLIENT_SECRET")
-# SALESFORCE_REDIRECT_URI = os.getenv("SALESFORCE_REDIRECT_URI")
+# Salesforce CRM configuration
+SALESFORCE_CLIENT_ID = os.getenv("SALESFORCE_CLIENT_ID")
+SALESFORCE_CLIENT_SECRET = os.getenv("SALESFORCE_CLIENT_SECRET")
+SALESFORCE_REDIRECT_URI = os.getenv("SALESFORCE_REDIRECT_URI")
+SALESFORCE_LOGIN_URL = os.getenv("SALESFORCE_LOGIN_URL", "https://login.salesforce.com")
+# Used when the token response does not carry an instance_url
+SALESFORCE_INSTANCE_URL = os.getenv("SALESFORCE_INSTANCE_URL")
+SALESFORCE_API_VERSION = os.getenv("SALESFORCE_API_VERSION", "v59.0")
 
-# HUBSPOT_CLIENT_ID = os.getenv("HUBSPOT_CLIENT_ID")
-# HUBSPOT_CLIENT_SECRET = os.getenv("HUBSPOT_CLIENT_SECRET")
-# HUBSPOT_REDIRECT_URI = os.getenv("HUBSPOT_REDIRECT_URI")
+# HubSpot CRM configuration
+HUBSPOT_CLIENT_ID = os.getenv("HUBSPOT_CLIENT_ID")
+HUBSPOT_CLIENT_SECRET = os.getenv("HUBSPOT_CLIENT_SECRET")
+HUBSPOT_REDIRECT_URI = os.getenv("HUBSPOT_REDIRECT_URI")
+HUBSPOT_AUTH_URL = os.getenv("HUBSPOT_AUTH_URL", "https://app.hubspot.com/oauth/authorize")
+HUBSPOT_API_BASE_URL = os.getenv("HUBSPOT_API_BASE_URL", "https://api.hubapi.com")
 
-# DYNAMICS_CLIENT_ID = os.getenv("DYNAMICS_CLIENT_ID")
-# DYNAMICS_CLIENT_SECRET = os.getenv("DYNAMICS_CLIENT_SECRET")
-# DYNAMICS_REDIRECT_URI = os.getenv("DYNAMICS_REDIRECT_URI")
\ No newline at end of file
+# Microsoft Dynamics CRM configuration
+DYNAMICS_CLIENT_ID = os.getenv("DYNAMICS_CLIENT_ID")
+DYNAMICS_CLIENT_SECRET = os.getenv("DYNAMICS_CLIENT_SECRET")
+DYNAMICS_REDIRECT_URI = os.getenv("DYNAMICS_REDIRECT_URI")
+DYNAMICS_TENANT_ID = os.getenv("DYNAMICS_TENANT_ID", "common")
+DYNAMICS_LOGIN_URL = os.getenv("DYNAMICS_LOGIN_URL", "https://login.microsoftonline.com")
+# Organization URL, e.g. https://contoso.crm.dynamics.com
+DYNAMICS_ORG_URL = os.getenv("DYNAMICS_ORG_URL")
+
+# Outbound HTTP connection pooling
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+
+# Per-source deadlines for public data enrichment (seconds)
+SERPER_TIMEOUT = float(os.getenv("SERPER_TIMEOUT", "5"))
+PERPLEXITY_TIMEOUT = float(os.getenv("PERPLEXITY_TIMEOUT", "20"))
+
+# Server (`python main.py`). With more than one worker process, everything they share (caches, the lead
+# index, the job queue, OAuth tokens) lives in SQLite under DATA_DIR, and rate limits are split between them
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8000"))
+# WEB_CONCURRENCY is what `uvicorn --workers` reads by default, for deployments that start uvicorn themselves
+WORKERS = max(1, int(os.getenv("WORKERS") or os.getenv("WEB_CONCURRENCY") or "1"))
+
+# Local state (SQLite caches and stores)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# In-process caches are not shared between workers, so several workers default to the SQLite backends
+DEFAULT_CACHE_BACKEND = "sqlite" if WORKERS > 1 else "memory"
+
+# Business card transcription cache: "memory", "sqlite" or "none"
+TRANSCRIPTION_CACHE_BACKEND = os.getenv("TRANSCRIPTION_CACHE_BACKEND", DEFAULT_CACHE_BACKEND)
+TRANSCRIPTION_CACHE_PATH = os.getenv("TRANSCRIPTION_CACHE_PATH", os.path.join(DATA_DIR, "cache.sqlite3"))
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "1000"))
+TRANSCRIPTION_CACHE_TTL = float(os.getenv("TRANSCRIPTION_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Public data enrichment cache: per-source freshness, then a shared stale-while-revalidate window (seconds)
+ENRICHMENT_CACHE_BACKEND = os.getenv("ENRICHMENT_CACHE_BACKEND", DEFAULT_CACHE_BACKEND)
+ENRICHMENT_CACHE_PATH = os.getenv("ENRICHMENT_CACHE_PATH", os.path.join(DATA_DIR, "cache.sqlite3"))
+ENRICHMENT_CACHE_MAX_ENTRIES = int(os.getenv("ENRICHMENT_CACHE_MAX_ENTRIES", "10000"))
+ENRICHMENT_CACHE_STALE_TTL = float(os.getenv("ENRICHMENT_CACHE_STALE_TTL", str(24 * 3600)))
+SERPER_CACHE_TTL = float(os.getenv("SERPER_CACHE_TTL", str(24 * 3600)))
+PERPLEXITY_CACHE_TTL = float(os.getenv("PERPLEXITY_CACHE_TTL", str(7 * 24 * 3600)))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Batch business card scanning
+BATCH_SCAN_MAX_FILES = int(os.getenv("BATCH_SCAN_MAX_FILES", "500"))
+BATCH_SCAN_CONCURRENCY = int(os.getenv("BATCH_SCAN_CONCURRENCY", "8"))
+BATCH_SCAN_MAX_BYTES = int(os.getenv("BATCH_SCAN_MAX_BYTES", str(200 * 1024 * 1024)))
+# Upper bound on concurrent gpt-4o calls across all requests in this process (per worker)
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "4"))
+
+# Image preprocessing before vision transcription
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1280"))
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "JPEG")  # JPEG or WEBP
+IMAGE_OUTPUT_QUALITY = int(os.getenv("IMAGE_OUTPUT_QUALITY", "80"))
+# Worker processes already spread preprocessing over the CPUs; a process pool in each of them would only add memory
+IMAGE_PREPROCESS_EXECUTOR = os.getenv("IMAGE_PREPROCESS_EXECUTOR", "thread" if WORKERS > 1 else "process")  # process or thread
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) // WORKERS))))
+
+# Background scan job queue
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "2"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "60"))
+# A running job whose lease expires (e.g. the worker died) is picked up again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+# Bulk CRM pushes: number of provider-sized chunks sent in parallel
+CRM_BATCH_CONCURRENCY = int(os.getenv("CRM_BATCH_CONCURRENCY", "4"))
+
+# OAuth token store
+TOKEN_STORE_PATH = os.getenv("TOKEN_STORE_PATH", os.path.join(DATA_DIR, "tokens.sqlite3"))
+# Fernet key for encrypting tokens at rest; a key file is generated next to the store if unset
+TOKEN_STORE_KEY = os.getenv("TOKEN_STORE_KEY")
+# Tokens expiring within this window are refreshed ahead of time (seconds)
+TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+TOKEN_REFRESH_INTERVAL = float(os.getenv("TOKEN_REFRESH_INTERVAL", "60"))
+# Tokens held in memory are re-read from the store after this long, to see refreshes by other workers (seconds)
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+# A worker refreshing a token holds it for at most this long before another worker may try (seconds)
+TOKEN_REFRESH_LEASE = float(os.getenv("TOKEN_REFRESH_LEASE", "30"))
+# How long the `state` issued when an OAuth flow starts stays valid for the callback (seconds)
+OAUTH_STATE_TTL = float(os.getenv("OAUTH_STATE_TTL", "600"))
+
+# Outbound rate limiting: token bucket per provider and API key, refilled at RATE_LIMIT_<PROVIDER>_RPS
+# with bursts up to RATE_LIMIT_<PROVIDER>_BURST. CRM defaults come from each adapter's published limits.
+# Limits are for the whole deployment; each of the WORKERS processes enforces an even share.
+RATE_LIMIT_DEFAULTS = {
+    "openai": (8.0, 16),
+    "perplexity": (1.0, 5),
+    "serper": (5.0, 10),
+}
+RATE_LIMITS = {
+    provider: (
+        float(os.getenv(f"RATE_LIMIT_{provider.upper()}_RPS", str(rps))),
+        int(os.getenv(f"RATE_LIMIT_{provider.upper()}_BURST", str(burst))),
+    )
+    for provider, (rps, burst) in RATE_LIMIT_DEFAULTS.items()
+}
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+RATE_LIMIT_BASE_DELAY = float(os.getenv("RATE_LIMIT_BASE_DELAY", "0.5"))
+RATE_LIMIT_MAX_DELAY = float(os.getenv("RATE_LIMIT_MAX_DELAY", "30"))
+# A provider is taken out of rotation after this many consecutive failures, then probed again
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30"))
+
+# Lead deduplication index
+LEAD_INDEX_PATH = os.getenv("LEAD_INDEX_PATH", os.path.join(DATA_DIR, "leads.sqlite3"))
+# Combined name/company similarity (0-1) at which two leads without a shared email or phone are the same person
+LEAD_MATCH_THRESHOLD = float(os.getenv("LEAD_MATCH_THRESHOLD", "0.88"))
+# Most recent leads compared per blocking key, which bounds the cost of a lookup in a crowded block
+LEAD_INDEX_MAX_CANDIDATES = int(os.getenv("LEAD_INDEX_MAX_CANDIDATES", "200"))
+# Country calling code assumed for phone numbers written without one
+DEFAULT_PHONE_COUNTRY_CODE = os.getenv("DEFAULT_PHONE_COUNTRY_CODE", "1")
+# "upsert" turns a CRM insert of a known lead into an upsert; "insert" only flags it in the response
+CRM_DEDUP_MODE = os.getenv("CRM_DEDUP_MODE", "upsert")
+
+# Optional local OCR fast path (needs pytesseract and the tesseract binary); runs on the preprocessing executor
+LOCAL_OCR_ENABLED = os.getenv("LOCAL_OCR_ENABLED", "false").lower() == "true"
+LOCAL_OCR_LANGUAGE = os.getenv("LOCAL_OCR_LANGUAGE", "eng")
+# Cards read locally below this confidence (0-1), or missing a required field, go to the model
+LOCAL_OCR_MIN_CONFIDENCE = float(os.getenv("LOCAL_OCR_MIN_CONFIDENCE", "0.85"))
+LOCAL_OCR_REQUIRED_FIELDS = [field.strip() for field in os.getenv("LOCAL_OCR_REQUIRED_FIELDS", "name,email").split(",") if field.strip()]
+
+# Public data is compacted before it goes into the summary prompt
+SUMMARY_PROMPT_TOKEN_BUDGET = int(os.getenv("SUMMARY_PROMPT_TOKEN_BUDGET", "1200"))
+# Organic search results kept per lookup, in ranking order
+SUMMARY_MAX_SEARCH_RESULTS = int(os.getenv("SUMMARY_MAX_SEARCH_RESULTS", "6"))
+
+# Logging, tracing and profiling
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Requests slower than this are logged with their per-stage timings
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "10"))
+# Lets a request opt into cProfile with an "X-Profile: 1" header; profiles are written to PROFILE_DIR
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+# Lead outbox: every scanned lead is appended to a local log, which the sync engine drains to a CRM
+LEAD_OUTBOX_PATH = os.getenv("LEAD_OUTBOX_PATH", os.path.join(DATA_DIR, "outbox.sqlite3"))
+# CRM the outbox is synced to (zoho, salesforce, hubspot or dynamics) with the tenant's stored credentials;
+# unset, leads are only kept for export
+OUTBOX_SYNC_CRM = os.getenv("OUTBOX_SYNC_CRM") or None
+OUTBOX_SYNC_TENANT = os.getenv("OUTBOX_SYNC_TENANT", "default")
+OUTBOX_SYNC_BATCH_SIZE = int(os.getenv("OUTBOX_SYNC_BATCH_SIZE", "100"))
+OUTBOX_SYNC_INTERVAL = float(os.getenv("OUTBOX_SYNC_INTERVAL", "5"))
+# A lead the CRM rejected this many times is set aside as failed and no longer holds the checkpoint back;
+# attempts that found the CRM unavailable (open circuit, 429, 5xx, no response) do not count
+OUTBOX_SYNC_MAX_ATTEMPTS = int(os.getenv("OUTBOX_SYNC_MAX_ATTEMPTS", "8"))
+OUTBOX_SYNC_MAX_DELAY = float(os.getenv("OUTBOX_SYNC_MAX_DELAY", "600"))
+# One worker process syncs at a time; if it dies, another one takes over when its lease runs out
+OUTBOX_SYNC_LEASE_SECONDS = float(os.getenv("OUTBOX_SYNC_LEASE_SECONDS", "120"))
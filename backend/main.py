@@ -1,8 +1,61 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from config import BATCH_SCAN_MAX_BYTES, HOST, LOG_LEVEL, PORT, WORKERS
 from routers import business_card, crm
+from services.http_clients import clients
+from services.image_processing import (
+    transcription_cache,
+    shutdown_preprocess_executor,
+    MAX_IMAGE_SIZE,
+    MULTIPART_OVERHEAD,
+)
+from services.jobs import job_queue, job_workers
+from services.lead_index import lead_index
+from services.lead_outbox import lead_outbox, outbox_sync
+from services.local_ocr import detect_local_ocr
+from services.public_data import enrichment_cache
+from services.telemetry import configure_logging, metrics, METRICS_CONTENT_TYPE
+from services.token_store import token_store
+from utils.body_limit import RequestBodyLimitMiddleware
+from utils.tracing import TracingMiddleware
+
+configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await clients.start()
+    await lead_index.load()
+    await detect_local_ocr()
+    job_workers.start()
+    token_store.start_refresher()
+    outbox_sync.start()
+    yield
+    await outbox_sync.stop()
+    await token_store.stop_refresher()
+    token_store.close()
+    await job_workers.stop()
+    job_queue.close()
+    await clients.close()
+    transcription_cache.close()
+    shutdown_preprocess_executor()
+    enrichment_cache.close()
+    lead_index.close()
+    lead_outbox.close()
+
+app = FastAPI(title="Business Card Scanner API", lifespan=lifespan)
 
-app = FastAPI(title="Business Card Scanner API")
+# Added first so CORS stays the outermost layer and 413 responses still carry CORS headers
+app.add_middleware(
+    RequestBodyLimitMiddleware,
+    limits={
+        "/scan-business-card": MAX_IMAGE_SIZE + MULTIPART_OVERHEAD,
+        "/scan-business-card/batch": BATCH_SCAN_MAX_BYTES,
+        "/scan-business-card/jobs": MAX_IMAGE_SIZE + MULTIPART_OVERHEAD,
+        "/scan-business-card/stream": MAX_IMAGE_SIZE + MULTIPART_OVERHEAD,
+    },
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,9 +65,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so rejected and preflight requests are timed and carry a request ID too
+app.add_middleware(TracingMiddleware)
+
 app.include_router(business_card.router)
 app.include_router(crm.router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    # Prometheus scrape target; per process, so each worker is scraped (or aggregated) separately
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    # An import string rather than the app object, so that with WORKERS > 1 each worker process imports its own
+    uvicorn.run("main:app", host=HOST, port=PORT, workers=WORKERS, log_level=LOG_LEVEL.lower())
\ No newline at end of file
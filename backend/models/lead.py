@@ -8,4 +8,9 @@ class Lead(BaseModel):
     company: Optional[str] = None
     position: Optional[str] = None
     linkedin_profile: Optional[HttpUrl] = None
-    public_data: Optional[Dict[str, Any]] = {}
\ No newline at end of file
+    public_data: Optional[Dict[str, Any]] = {}
+
+class LeadMatch(BaseModel):
+    lead_id: int
+    matched_on: str
+    score: float
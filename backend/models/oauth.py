@@ -4,4 +4,6 @@ from typing import Optional
 class OAuthCredentials(BaseModel):
     access_token: str
     refresh_token: Optional[str]
-    expires_at: Optional[int]
\ No newline at end of file
+    expires_at: Optional[int]
+    # API host for providers that assign one per organization (e.g. Salesforce)
+    instance_url: Optional[str]
@@ -1,9 +1,31 @@
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Header
+import asyncio
+import io
+import zipfile
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, Any
-from models.lead import Lead
-from services.image_processing import transcribe_business_card
-from services.public_data import gather_public_data, summarize_public_data
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+from config import BATCH_SCAN_MAX_FILES, BATCH_SCAN_MAX_BYTES, BATCH_SCAN_CONCURRENCY, JOB_POLL_INTERVAL
+from models.lead import Lead, LeadMatch
+from services.image_processing import (
+    transcribe_image,
+    read_image_upload,
+    read_upload,
+    validate_image_content,
+    transcription_cache,
+    local_ocr_stats,
+    MAX_IMAGE_SIZE,
+)
+from services.jobs import job_queue, job_workers, register_job_handler, TERMINAL_STATUSES
+from services.lead_index import lead_index
+from services.lead_outbox import lead_outbox, outbox_sync
+from services.public_data import gather_public_data, summarize_public_data, stream_summary, enrichment_cache
+from services.rate_limit import rate_limits
+from utils.auth import get_api_key
+from utils.normalization import normalize_transcription
+from utils.streaming import csv_line, ndjson_line, sse_event, CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE, SSE_HEADERS
 
 router = APIRouter()
 
@@ -11,41 +33,103 @@ class BusinessCardScanResponse(BaseModel):
     lead: Lead
     public_data_summary: str
     message: str
+    # Set when the person is already in the lead index, i.e. was pushed to a CRM before
+    duplicate_of: Optional[LeadMatch] = None
 
 class PublicDataRequest(BaseModel):
     email: Optional[EmailStr] = None
     linkedin_profile: Optional[str] = None
 
-async def get_api_key(api_key: str = Header(...)):
-    expected_api_key = "test"
-    if api_key != expected_api_key:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-
 @router.post("/scan-business-card", response_model=BusinessCardScanResponse)
 async def scan_business_card(
     image: UploadFile = File(...),
     api_key: str = Depends(get_api_key)
 ):
     try:
-        transcription_result = await transcribe_business_card(image)
+        image_content = await read_image_upload(image)
+        return await process_business_card(image_content)
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing business card: {str(e)}")
+
+@router.post("/scan-business-card/stream")
+async def scan_business_card_stream(
+    image: UploadFile = File(...),
+    api_key: str = Depends(get_api_key)
+):
+    # Transcription runs before the stream opens so a bad card still gets a plain HTTP error status
+    try:
+        image_content = await read_image_upload(image)
+        transcription_result = await transcribe_image(image_content)
         cleaned_data = clean_and_validate_transcription(transcription_result)
-        
-        public_data = transcription_result.get('public_data', {})
-        public_data_summary = await summarize_public_data(public_data)
-        
-        lead = create_lead(cleaned_data, public_data)
-        
-        return BusinessCardScanResponse(
-            lead=lead,
-            public_data_summary=public_data_summary,
-            message="Business card scanned and public data gathered successfully."
-        )
+        lead = create_lead(cleaned_data, {})
 
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing business card: {str(e)}")
 
+    return StreamingResponse(stream_business_card(cleaned_data, lead), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+@router.post("/scan-business-card/batch")
+async def scan_business_cards_batch(
+    images: List[UploadFile] = File(..., description="Card images, or zip archives of card images"),
+    format: str = Query("ndjson", regex="^(ndjson|sse)$"),
+    api_key: str = Depends(get_api_key)
+):
+    # Read every upload before streaming starts; the form files are closed once the handler returns
+    cards: List[Tuple[str, bytes]] = []
+    total_size = 0
+    for upload in images:
+        if is_zip_upload(upload):
+            archive = await read_upload(upload, BATCH_SCAN_MAX_BYTES)
+            extracted = await asyncio.to_thread(extract_zip_images, archive, BATCH_SCAN_MAX_BYTES - total_size)
+        else:
+            extracted = [(upload.filename, await read_upload(upload, MAX_IMAGE_SIZE))]
+        cards.extend(extracted)
+        total_size += sum(len(data) for _, data in extracted)
+
+        if total_size > BATCH_SCAN_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_SCAN_MAX_BYTES / (1024 * 1024)}MB of images.")
+
+        if len(cards) > BATCH_SCAN_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"A batch may contain at most {BATCH_SCAN_MAX_FILES} cards.")
+
+    if not cards:
+        raise HTTPException(status_code=400, detail="No business card images found in the upload.")
+
+    media_type = SSE_MEDIA_TYPE if format == "sse" else NDJSON_MEDIA_TYPE
+    return StreamingResponse(stream_batch_results(cards, format), media_type=media_type)
+
+@router.post("/scan-business-card/jobs", status_code=202)
+async def submit_scan_job(
+    image: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None),
+    api_key: str = Depends(get_api_key)
+) -> Dict[str, Any]:
+    image_content = await read_image_upload(image)
+    # A retried submit with the same Idempotency-Key returns the original job instead of scanning twice
+    job, created = await job_queue.submit("scan_business_card", image_content, idempotency_key)
+    if created:
+        job_workers.notify()
+    return {**job, "status_url": f"/jobs/{job['job_id']}", "events_url": f"/jobs/{job['job_id']}/events"}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, api_key: str = Depends(get_api_key)):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(stream_job_events(job), media_type=SSE_MEDIA_TYPE)
+
 @router.post("/gather-public-data")
 async def gather_public_data_route(
     request: PublicDataRequest,
@@ -62,38 +146,232 @@ async def gather_public_data_route(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error gathering and summarizing public data: {str(e)}")
 
+@router.post("/gather-public-data/stream")
+async def gather_public_data_stream(
+    request: PublicDataRequest,
+    api_key: str = Depends(get_api_key)
+):
+    async def events() -> AsyncIterator[str]:
+        try:
+            public_data = await gather_public_data(request.email, request.linkedin_profile, summarize=False)
+            yield sse_event({"public_data": public_data}, event="public_data")
+            summary = ""
+            async for delta in stream_summary(public_data):
+                summary += delta
+                yield sse_event({"delta": delta}, event="summary")
+            # Same shape as the non-streaming response
+            yield sse_event({"public_data": public_data, "summary": summary.strip()}, event="done")
+        except Exception as e:
+            yield sse_event({"status_code": 500, "detail": f"Error gathering and summarizing public data: {str(e)}"}, event="error")
+
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+@router.get("/transcription-cache/stats")
+async def transcription_cache_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    # Every hit is a gpt-4o vision call that was not made
+    return transcription_cache.stats.as_dict()
+
+@router.get("/local-ocr/stats")
+async def local_ocr_stats_endpoint(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    # How many scans were read on the CPU instead of by the model
+    return local_ocr_stats.as_dict()
+
+@router.get("/enrichment-cache/stats")
+async def enrichment_cache_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    return enrichment_cache.stats()
+
+@router.get("/rate-limits/stats")
+async def rate_limit_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    # One entry per provider and API key: queue depth, throttling, retries and circuit state
+    return rate_limits.stats()
+
+@router.get("/lead-index/stats")
+async def lead_index_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    return lead_index.stats()
+
+@router.get("/lead-outbox/stats")
+async def lead_outbox_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    # Checkpoint and lag of the CRM sync, and how many leads it set aside as failed
+    return await outbox_sync.stats()
+
+@router.get("/leads/export")
+async def export_leads(
+    since: int = Query(0, ge=0, description="Cursor of the last lead already exported"),
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    limit: Optional[int] = Query(None, ge=1),
+    api_key: str = Depends(get_api_key)
+):
+    # Every scanned lead after `since`, oldest first. The export ends at the lead that was newest when it
+    # started (or after `limit` leads); X-Next-Cursor is the `since` for the next export.
+    until = await lead_outbox.last_cursor(since, limit)
+    headers = {"X-Next-Cursor": str(until)}
+    if format == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="leads-{since}-{until}.csv"'
+        return StreamingResponse(stream_export_csv(since, until), media_type=CSV_MEDIA_TYPE, headers=headers)
+    return StreamingResponse(stream_export_ndjson(since, until), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+async def process_business_card(image_content: bytes) -> BusinessCardScanResponse:
+    transcription_result = await transcribe_image(image_content)
+    cleaned_data = clean_and_validate_transcription(transcription_result)
+
+    public_data = await gather_public_data(cleaned_data.get("email"), cleaned_data.get("linkedin_profile"))
+    public_data_summary = public_data.get("combined_summary") or await summarize_public_data(public_data)
+
+    lead = create_lead(cleaned_data, public_data)
+    await record_lead(lead)
+
+    return BusinessCardScanResponse(
+        lead=lead,
+        public_data_summary=public_data_summary,
+        message="Business card scanned and public data gathered successfully.",
+        duplicate_of=await lead_index.find(lead),
+    )
+
+async def stream_business_card(cleaned_data: Dict[str, Any], lead: Lead) -> AsyncIterator[str]:
+    # Events: "lead" as soon as the card is read, "public_data" once enrichment is in, one "summary"
+    # per token, then "done" carrying the same body as POST /scan-business-card ("error" on failure)
+    try:
+        yield sse_event({"lead": lead, "duplicate_of": await lead_index.find(lead)}, event="lead")
+
+        public_data = await gather_public_data(cleaned_data.get("email"), cleaned_data.get("linkedin_profile"), summarize=False)
+        yield sse_event({"public_data": public_data}, event="public_data")
+
+        summary = ""
+        async for delta in stream_summary(public_data):
+            summary += delta
+            yield sse_event({"delta": delta}, event="summary")
+        public_data["combined_summary"] = summary.strip()
+
+        lead = create_lead(cleaned_data, public_data)
+        yield sse_event(BusinessCardScanResponse(
+            lead=lead,
+            public_data_summary=public_data["combined_summary"],
+            message="Business card scanned and public data gathered successfully.",
+            duplicate_of=await lead_index.find(lead),
+        ), event="done")
+    except HTTPException as he:
+        yield sse_event({"status_code": he.status_code, "detail": he.detail}, event="error")
+    except Exception as e:
+        yield sse_event({"status_code": 500, "detail": f"Error processing business card: {str(e)}"}, event="error")
+    finally:
+        # However the stream ends, the card is recorded: enriched if that got done, as read otherwise.
+        # Shielded, since a client that disconnects mid-stream cancels this generator.
+        await asyncio.shield(record_lead(lead))
+
+async def record_lead(lead: Lead):
+    # Into the outbox, for the CRM sync and exports, even when the lead is never pushed by hand
+    await lead_outbox.append(lead)
+    outbox_sync.notify()
+
+EXPORT_CSV_COLUMNS = ("cursor", "created_at", "name", "email", "phone", "company", "position", "linkedin_profile", "public_data_summary")
+
+async def stream_export_ndjson(since: int, until: int) -> AsyncIterator[str]:
+    async for cursor, created_at, lead in lead_outbox.export(since, until):
+        yield ndjson_line({"cursor": cursor, "created_at": created_at, "lead": lead})
+
+async def stream_export_csv(since: int, until: int) -> AsyncIterator[str]:
+    # One row per lead; the raw public data does not fit a flat file, so only its summary is included
+    yield csv_line(EXPORT_CSV_COLUMNS)
+    async for cursor, created_at, lead in lead_outbox.export(since, until):
+        summary = (lead.get("public_data") or {}).get("combined_summary")
+        yield csv_line([cursor, datetime.fromtimestamp(created_at, timezone.utc).isoformat(), *(lead.get(field) for field in EXPORT_CSV_COLUMNS[2:-1]), summary])
+
+async def stream_batch_results(cards: List[Tuple[str, bytes]], format: str) -> AsyncIterator[str]:
+    semaphore = asyncio.Semaphore(BATCH_SCAN_CONCURRENCY)
+
+    async def scan(index: int, filename: str, content: bytes) -> Dict[str, Any]:
+        async with semaphore:
+            result = {"index": index, "filename": filename}
+            try:
+                validate_image_content(content)
+                scan_response = await process_business_card(content)
+                result.update(status="ok", result=scan_response)
+            except HTTPException as he:
+                result.update(status="error", status_code=he.status_code, detail=he.detail)
+            except Exception as e:
+                result.update(status="error", status_code=500, detail=f"Error processing business card: {str(e)}")
+            return result
+
+    tasks = [asyncio.ensure_future(scan(index, *card)) for index, card in enumerate(cards)]
+    succeeded = 0
+    try:
+        # Emit each card as soon as it finishes rather than in upload order
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            succeeded += result["status"] == "ok"
+            yield sse_event(result, event="card") if format == "sse" else ndjson_line(result)
+
+        summary = {"status": "done", "total": len(cards), "succeeded": succeeded, "failed": len(cards) - succeeded}
+        yield sse_event(summary, event="done") if format == "sse" else ndjson_line(summary)
+    finally:
+        # Client disconnects stop the remaining work instead of spending model calls on it
+        for task in tasks:
+            task.cancel()
+
+@register_job_handler("scan_business_card")
+async def run_scan_job(image_content: bytes) -> Dict[str, Any]:
+    return jsonable_encoder(await process_business_card(image_content))
+
+async def stream_job_events(job: Dict[str, Any]) -> AsyncIterator[str]:
+    # Polls the queue so updates made by workers in other processes are seen too
+    last_update = None
+    while True:
+        if job["updated_at"] != last_update:
+            last_update = job["updated_at"]
+            yield sse_event(job, event="status")
+        if job["status"] in TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+        job = await job_queue.get(job["job_id"])
+
+def is_zip_upload(upload: UploadFile) -> bool:
+    return upload.content_type in ("application/zip", "application/x-zip-compressed") or (
+        upload.filename or ""
+    ).lower().endswith(".zip")
+
+def extract_zip_images(content: bytes, max_size: int) -> List[Tuple[str, bytes]]:
+    # `max_size` caps the decompressed total, so a small archive of highly compressible entries cannot fill memory
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Uploaded archive is not a valid zip file.")
+
+    cards = []
+    total_size = 0
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            if len(cards) >= BATCH_SCAN_MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"A batch may contain at most {BATCH_SCAN_MAX_FILES} cards.")
+
+            # Checked against the declared size so oversized entries are never decompressed
+            if info.file_size > MAX_IMAGE_SIZE:
+                raise HTTPException(status_code=400, detail=f"{info.filename} exceeds the maximum image size of {MAX_IMAGE_SIZE / (1024 * 1024)}MB.")
+            # zipfile stops reading an entry at its declared size, so the declared sizes bound what is decompressed
+            total_size += info.file_size
+            if total_size > max_size:
+                raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_SCAN_MAX_BYTES / (1024 * 1024)}MB of images.")
+
+            cards.append((info.filename, archive.read(info)))
+    return cards
+
 def clean_and_validate_transcription(transcription: Dict[str, Any]) -> Dict[str, Any]:
-    cleaned_data = {}
-    
-    # Handle 'name' field
-    name = transcription.get("name", "").strip()
-    if name:
-        name_parts = name.split(maxsplit=1)
-        cleaned_data["first_name"] = name_parts[0]
-        cleaned_data["last_name"] = name_parts[1] if len(name_parts) > 1 else ""
-    else:
+    cleaned_data = normalize_transcription(transcription)
+
+    if not cleaned_data["first_name"]:
         cleaned_data["first_name"] = "Unknown"
-        cleaned_data["last_name"] = ""
-    
-    cleaned_data["name"] = f"{cleaned_data['first_name']} {cleaned_data['last_name']}".strip()
-    
+        cleaned_data["name"] = "Unknown"
+
     # Handle 'email' field with validation
-    email = transcription.get("email", "").strip()
-    if email:
+    if cleaned_data["email"]:
         try:
-            cleaned_data["email"] = EmailStr.validate(email)
+            cleaned_data["email"] = EmailStr.validate(cleaned_data["email"])
         except ValueError:
             cleaned_data["email"] = None
-    else:
-        cleaned_data["email"] = None
-
-    # Handle other fields
-    for field in ["phone", "company", "address", "job_title", "linkedin_profile", "website"]:
-        value = transcription.get(field, "").strip()
-        if value:
-            cleaned_data[field] = value
-    
-    return cleaned_data
+
+    # Drop empty fields so they are not sent on as nulls
+    return {field: value for field, value in cleaned_data.items() if value is not None}
 
 def create_lead(cleaned_data: Dict[str, Any], public_data: Dict[str, Any]) -> Lead:
     try:
@@ -1,9 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from services.crm_integration import send_lead_to_crm, initiate_oauth, exchange_code_for_token
+from services.crm_integration import (
+    send_lead_to_crm,
+    send_leads_to_crm,
+    send_succeeded,
+    upsert_lead_to_crm,
+    initiate_oauth,
+    exchange_code_for_token,
+)
+from config import CRM_DEDUP_MODE
 from models.lead import Lead
 from models.oauth import OAuthCredentials
-from utils.oauth import get_oauth_credentials
-from typing import Dict, Any
+from services.lead_index import lead_index
+from services.telemetry import span
+from services.token_store import token_store
+from utils.oauth import get_oauth_credentials, get_tenant_id
+from typing import Dict, Any, List
 
 router = APIRouter()
 
@@ -14,18 +25,86 @@ async def send_to_crm(
     credentials: OAuthCredentials = Depends(get_oauth_credentials)
 ) -> Dict[str, Any]:
     try:
-        result = await send_lead_to_crm(crm_name, lead, credentials)
-        return {"message": f"Lead sent to {crm_name} CRM", "result": result}
+        duplicate_of = await lead_index.find(lead)
+        with span("crm_push"):
+            if duplicate_of is not None and CRM_DEDUP_MODE == "upsert":
+                # The person was pushed before (maybe from another event); update that lead instead of adding a copy
+                result = await upsert_lead_to_crm(crm_name, lead, credentials)
+                pushed = result.get("status") == "success"
+            else:
+                result = await send_lead_to_crm(crm_name, lead, credentials)
+                pushed = send_succeeded(crm_name, result)
+        # Only leads the CRM accepted are known to it; a rejected one must not turn later scans into upserts
+        if pushed:
+            await lead_index.add(lead)
+        return {"message": f"Lead sent to {crm_name} CRM", "result": result, "duplicate_of": duplicate_of}
+    except HTTPException as he:
+        raise he
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending lead to CRM: {str(e)}")
 
+@router.put("/send-to-crm/{crm_name}")
+async def upsert_to_crm(
+    crm_name: str,
+    lead: Lead,
+    credentials: OAuthCredentials = Depends(get_oauth_credentials)
+) -> Dict[str, Any]:
+    try:
+        # Updates the CRM lead with the same email, or creates it if there is none
+        with span("crm_push"):
+            result = await upsert_lead_to_crm(crm_name, lead, credentials)
+        if result.get("status") == "success":
+            await lead_index.add(lead)
+        return {"message": f"Lead upserted in {crm_name} CRM", "result": result}
+    except HTTPException as he:
+        raise he
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error upserting lead in CRM: {str(e)}")
+
+@router.post("/send-to-crm/{crm_name}/batch")
+async def send_batch_to_crm(
+    crm_name: str,
+    leads: List[Lead],
+    credentials: OAuthCredentials = Depends(get_oauth_credentials)
+) -> Dict[str, Any]:
+    try:
+        # One result per input lead, in input order, each carrying its index
+        duplicates = await lead_index.find_many(leads)
+        upsert = [match is not None for match in duplicates] if CRM_DEDUP_MODE == "upsert" else None
+        with span("crm_push"):
+            results = await send_leads_to_crm(crm_name, leads, credentials, upsert=upsert)
+        for lead, result, duplicate_of in zip(leads, results, duplicates):
+            if result["status"] == "success":
+                await lead_index.add(lead)
+            if duplicate_of is not None:
+                result["duplicate_of"] = duplicate_of
+        succeeded = sum(1 for result in results if result["status"] == "success")
+        return {
+            "message": f"{succeeded} of {len(leads)} leads sent to {crm_name} CRM",
+            "succeeded": succeeded,
+            "failed": len(leads) - succeeded,
+            "results": results,
+        }
+    except HTTPException as he:
+        raise he
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error sending leads to CRM: {str(e)}")
+
 @router.get("/oauth/{crm_name}/initiate")
-async def oauth_initiate(crm_name: str) -> Dict[str, str]:
+async def oauth_initiate(crm_name: str, tenant_id: str = Depends(get_tenant_id)) -> Dict[str, str]:
     try:
-        auth_url = await initiate_oauth(crm_name)
+        # A single-use nonce travels through the provider as `state`; the callback maps it back to the tenant
+        state = await token_store.create_oauth_state(tenant_id, crm_name)
+        auth_url = await initiate_oauth(crm_name, state=state)
         return {"authUrl": auth_url}
+    except HTTPException as he:
+        raise he
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
@@ -34,12 +113,22 @@ async def oauth_initiate(crm_name: str) -> Dict[str, str]:
 @router.get("/oauth/{crm_name}/callback")
 async def oauth_callback(
     crm_name: str, 
-    code: str = Query(..., description="The authorization code returned by the OAuth provider")
+    code: str = Query(..., description="The authorization code returned by the OAuth provider"),
+    state: str = Query(..., description="The state issued when the flow was initiated")
 ) -> Dict[str, str]:
     try:
+        tenant_id = await token_store.consume_oauth_state(state, crm_name)
+        if tenant_id is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid or expired OAuth state. Start the flow again through /oauth/{crm_name}/initiate.",
+            )
         credentials = await exchange_code_for_token(crm_name, code)
+        await token_store.save(tenant_id, crm_name, credentials)
         return {"access_token": credentials.access_token}
+    except HTTPException as he:
+        raise he
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error exchanging code for token: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error exchanging code for token: {str(e)}")
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        lookups = self.hits + self.misses
+        stats["hit_ratio"] = round(self.hits / lookups, 4) if lookups else 0.0
+        return stats
+
+class NullCache:
+    def __init__(self):
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[Any]:
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        pass
+
+    async def delete(self, key: str):
+        pass
+
+    def close(self):
+        pass
+
+class MemoryCache:
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._entries[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def close(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCache:
+    # Enforcing the size cap needs a COUNT(*), so it only runs every few writes.
+    EVICTION_INTERVAL = 64
+
+    def __init__(self, path: str, table: str, max_entries: int, ttl: Optional[float] = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            # Readers in other worker processes are not blocked by a write
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any):
+        await asyncio.to_thread(self._set, key, json.dumps(value))
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete, key)
+
+    def _get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+        return json.loads(value)
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._writes += 1
+            if self._writes % self.EVICTION_INTERVAL == 0:
+                self._evict(now)
+
+    def _delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _evict(self, now: float):
+        expired = self._conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        self.stats.expirations += max(expired, 0)
+
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+            self.stats.evictions += overflow
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        # Returns (result, shared) where shared means another caller's upstream call was reused
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A caller giving up (e.g. a per-source deadline) must not cancel the call other waiters share
+        return await asyncio.shield(task), shared
+
+class StaleWhileRevalidateCache:
+    def __init__(self, backend, stale_ttl: float):
+        self.backend = backend
+        self.stale_ttl = stale_ttl
+        self.stale_served = 0
+        self.refreshes = 0
+        self.coalesced = 0
+        self._flight = SingleFlight()
+        self._background: Set[asyncio.Task] = set()
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float,
+        should_cache: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        entry = await self.backend.get(key)
+        if entry is not None:
+            age = time.time() - entry["stored_at"]
+            if age < ttl:
+                return entry["value"]
+            if age < ttl + self.stale_ttl:
+                self.stale_served += 1
+                self._refresh_in_background(key, loader, should_cache)
+                return entry["value"]
+
+        value, shared = await self._flight.do(key, lambda: self._load(key, loader, should_cache))
+        if shared:
+            self.coalesced += 1
+        return value
+
+    async def peek(self, key: str, ttl: float) -> Optional[Any]:
+        # For callers that produce the value themselves (e.g. a streamed summary) and store it with put()
+        entry = await self.backend.get(key)
+        if entry is None or time.time() - entry["stored_at"] >= ttl:
+            return None
+        return entry["value"]
+
+    async def put(self, key: str, value: Any):
+        await self.backend.set(key, {"value": value, "stored_at": time.time()})
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool]) -> Any:
+        value = await loader()
+        if should_cache(value):
+            await self.backend.set(key, {"value": value, "stored_at": time.time()})
+        return value
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool]):
+        async def refresh():
+            self.refreshes += 1
+            try:
+                await self._flight.do(key, lambda: self._load(key, loader, should_cache))
+            except Exception:
+                # The stale value was already served; the next lookup will try again
+                pass
+
+        task = asyncio.ensure_future(refresh())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.backend.stats.as_dict()
+        stats.update(stale_served=self.stale_served, refreshes=self.refreshes, coalesced=self.coalesced)
+        return stats
+
+    def close(self):
+        for task in self._background:
+            task.cancel()
+        self.backend.close()
+
+def create_cache(backend: str, path: str, table: str, max_entries: int, ttl: Optional[float] = None):
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, ttl=ttl)
+    elif backend == "sqlite":
+        return SQLiteCache(path=path, table=table, max_entries=max_entries, ttl=ttl)
+    elif backend == "none":
+        return NullCache()
+    else:
+        raise ValueError(f"Unsupported cache backend: {backend}")
@@ -1,40 +1,77 @@
-from .zoho import send_to_zoho, initiate_zoho_oauth, exchange_zoho_code_for_token
-# from .salesforce import send_to_salesforce, initiate_salesforce_oauth
-# from .hubspot import send_to_hubspot, initiate_hubspot_oauth
-# from .dynamics import send_to_dynamics, initiate_dynamics_oauth
-
-async def send_lead_to_crm(crm_name: str, lead, credentials):
-    if crm_name == "zoho":
-        return await send_to_zoho(lead, credentials)
-    # elif crm_name == "salesforce":
-    #     return await send_to_salesforce(lead, credentials)
-    # elif crm_name == "hubspot":
-    #     return await send_to_hubspot(lead, credentials)
-    # elif crm_name == "dynamics":
-    #     return await send_to_dynamics(lead, credentials)
-    else:
-        raise ValueError(f"Unsupported CRM: {crm_name}")
-
-async def initiate_oauth(crm_name: str):
-    if crm_name == "zoho":
-        return await initiate_zoho_oauth()
-    # elif crm_name == "salesforce":
-    #     return await initiate_salesforce_oauth()
-    # elif crm_name == "hubspot":
-    #     return await initiate_hubspot_oauth()
-    # elif crm_name == "dynamics":
-    #     return await initiate_dynamics_oauth()
-    else:
-        raise ValueError(f"Unsupported CRM: {crm_name}")
+import asyncio
+import importlib
+from typing import Any, Dict, List, Optional
+from config import CRM_BATCH_CONCURRENCY
+from models.lead import Lead
+from models.oauth import OAuthCredentials
+from .base import CRMAdapter
+from .batching import error_result
+
+# Adapters are imported on first use so providers that are never called cost nothing at startup
+ADAPTER_PATHS: Dict[str, str] = {
+    "zoho": ".zoho:ZohoAdapter",
+    "salesforce": ".salesforce:SalesforceAdapter",
+    "hubspot": ".hubspot:HubSpotAdapter",
+    "dynamics": ".dynamics:DynamicsAdapter",
+}
+
+_adapters: Dict[str, CRMAdapter] = {}
+
+def register_adapter(crm_name: str, path: str):
+    ADAPTER_PATHS[crm_name] = path
+    _adapters.pop(crm_name, None)
+
+def get_adapter(crm_name: str) -> CRMAdapter:
+    adapter = _adapters.get(crm_name)
+    if adapter is None:
+        path = ADAPTER_PATHS.get(crm_name)
+        if path is None:
+            raise ValueError(f"Unsupported CRM: {crm_name}")
+        module_name, class_name = path.split(":")
+        module = importlib.import_module(module_name, package=__name__)
+        adapter = getattr(module, class_name)()
+        _adapters[crm_name] = adapter
+    return adapter
+
+async def send_lead_to_crm(crm_name: str, lead: Lead, credentials: OAuthCredentials):
+    return await get_adapter(crm_name).send_lead(lead, credentials)
+
+def send_succeeded(crm_name: str, body: Any) -> bool:
+    return get_adapter(crm_name).send_result(body).get("status") == "success"
+
+async def send_leads_to_crm(crm_name: str, leads: List[Lead], credentials: OAuthCredentials, upsert: Optional[List[bool]] = None):
+    # `upsert` marks leads already known to the CRM; those are upserted one by one, the rest go out in bulk
+    adapter = get_adapter(crm_name)
+    if not upsert or not any(upsert):
+        return await adapter.send_leads(leads, credentials)
+
+    inserts = [index for index, flag in enumerate(upsert) if not flag]
+    updates = [index for index, flag in enumerate(upsert) if flag]
+    semaphore = asyncio.Semaphore(CRM_BATCH_CONCURRENCY)
+
+    async def upsert_one(lead: Lead) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                return await adapter.upsert_lead(lead, credentials)
+            except Exception as e:
+                return error_result(e)
+
+    insert_results, update_results = await asyncio.gather(
+        adapter.send_leads([leads[index] for index in inserts], credentials) if inserts else asyncio.sleep(0, []),
+        asyncio.gather(*(upsert_one(leads[index]) for index in updates)),
+    )
+    results: List[Dict[str, Any]] = [{} for _ in leads]
+    for index, result in zip(inserts, insert_results):
+        results[index] = {**result, "index": index}
+    for index, result in zip(updates, update_results):
+        results[index] = {"index": index, **result}
+    return results
+
+async def upsert_lead_to_crm(crm_name: str, lead: Lead, credentials: OAuthCredentials):
+    return await get_adapter(crm_name).upsert_lead(lead, credentials)
+
+async def initiate_oauth(crm_name: str, state: Optional[str] = None):
+    return await get_adapter(crm_name).initiate_oauth(state)
 
 async def exchange_code_for_token(crm_name: str, code: str):
-    if crm_name == "zoho":
-        return await exchange_zoho_code_for_token(code)
-    # elif crm_name == "salesforce":
-    #     return await exchange_salesforce_code_for_token(code)
-    # elif crm_name == "hubspot":
-    #     return await exchange_hubspot_code_for_token(code)
-    # elif crm_name == "dynamics":
-    #     return await exchange_dynamics_code_for_token(code)
-    else:
-        raise ValueError(f"Unsupported CRM: {crm_name}")
\ No newline at end of file
+    return await get_adapter(crm_name).exchange_code_for_token(code)
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from config import CRM_BATCH_CONCURRENCY
+from models.lead import Lead
+from models.oauth import OAuthCredentials
+from services.http_clients import clients
+from services.rate_limit import RateLimitPolicy, raise_for_throttling, rate_limits
+from .batching import error_result, send_in_batches
+
+IDEMPOTENT_METHODS = {"GET", "PUT", "PATCH", "DELETE"}
+
+@dataclass(frozen=True)
+class RateLimitInfo:
+    max_requests: int
+    per_seconds: float
+    max_concurrency: int
+
+class CRMAdapter(ABC):
+    name: str = ""
+    # Records accepted by one bulk request; 1 means the provider has no bulk insert
+    max_batch_size: int = 1
+    rate_limit: RateLimitInfo = RateLimitInfo(max_requests=10, per_seconds=1, max_concurrency=5)
+
+    auth_url: str = ""
+    token_url: str = ""
+    client_id: Optional[str] = None
+    client_secret: Optional[str] = None
+    redirect_uri: Optional[str] = None
+    scope: str = ""
+
+    def __init__(self):
+        rate_limits.configure(self.name, RateLimitPolicy(
+            rate=self.rate_limit.max_requests / self.rate_limit.per_seconds,
+            burst=self.rate_limit.max_requests,
+            max_concurrency=self.rate_limit.max_concurrency,
+        ))
+
+    @abstractmethod
+    async def send_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def send_result(self, body: Any) -> Dict[str, Any]:
+        # What send_lead returned (the provider's own answer), as a result like those of send_leads
+        ...
+
+    async def send_leads(self, leads: List[Lead], credentials: OAuthCredentials) -> List[Dict[str, Any]]:
+        # Providers without a bulk API fall back to individual inserts, still bounded and in input order
+        async def send_chunk(chunk: List[Lead]) -> List[Dict[str, Any]]:
+            return await asyncio.gather(*(self._send_one(lead, credentials) for lead in chunk))
+
+        return await send_in_batches(leads, send_chunk, self.max_batch_size, CRM_BATCH_CONCURRENCY)
+
+    @abstractmethod
+    async def upsert_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        ...
+
+    async def _send_one(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        try:
+            return self.send_result(await self.send_lead(lead, credentials))
+        except Exception as e:
+            return error_result(e)
+
+    def authorization_params(self, state: Optional[str] = None) -> Dict[str, str]:
+        params = {
+            "client_id": self.client_id,
+            "redirect_uri": self.redirect_uri,
+            "scope": self.scope,
+            "response_type": "code",
+        }
+        if state:
+            params["state"] = state
+        return {key: value for key, value in params.items() if value is not None}
+
+    async def initiate_oauth(self, state: Optional[str] = None) -> str:
+        return f"{self.auth_url}?{urlencode(self.authorization_params(state))}"
+
+    async def exchange_code_for_token(self, code: str) -> OAuthCredentials:
+        return await self._request_token({
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "redirect_uri": self.redirect_uri,
+            "code": code,
+            "grant_type": "authorization_code",
+        })
+
+    async def refresh_access_token(self, credentials: OAuthCredentials) -> OAuthCredentials:
+        if not credentials.refresh_token:
+            raise ValueError(f"No refresh token available for {self.name}")
+        refreshed = await self._request_token({
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": credentials.refresh_token,
+            "grant_type": "refresh_token",
+        })
+        # Most providers only issue the refresh token once
+        if refreshed.refresh_token is None:
+            refreshed.refresh_token = credentials.refresh_token
+        if refreshed.instance_url is None:
+            refreshed.instance_url = credentials.instance_url
+        return refreshed
+
+    async def _request_token(self, data: Dict[str, Any]) -> OAuthCredentials:
+        _, token_data = await self._request("POST", self.token_url, data=data)
+        if "access_token" not in token_data:
+            raise ValueError(f"{self.name} token request failed: {token_data.get('error_description') or token_data.get('error') or token_data}")
+        return credentials_from_token_response(token_data)
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        credentials: Optional[OAuthCredentials] = None,
+        idempotent: Optional[bool] = None,
+        **kwargs,
+    ) -> Tuple[int, Any]:
+        # Every provider call shares the limiter for this CRM and connected account
+        key = (credentials.refresh_token or credentials.access_token) if credentials else None
+        if credentials is not None:
+            kwargs.setdefault("headers", bearer_headers(credentials))
+
+        async def request() -> Tuple[int, Any]:
+            session = clients.session()
+            async with session.request(method, url, **kwargs) as response:
+                rate_limits.observe(self.name, response.headers, key=key)
+                raise_for_throttling(self.name, response.status, response.headers)
+                if response.status == 204:
+                    return response.status, None
+                return response.status, await response.json(content_type=None)
+
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        return await rate_limits.call(self.name, request, key=key, idempotent=idempotent)
+
+def credentials_from_token_response(token_data: Dict[str, Any]) -> OAuthCredentials:
+    # Providers return a lifetime in seconds; store the absolute expiry
+    expires_in = token_data.get("expires_in")
+    return OAuthCredentials(
+        access_token=token_data["access_token"],
+        refresh_token=token_data.get("refresh_token"),
+        expires_at=int(time.time()) + int(expires_in) if expires_in is not None else None,
+        instance_url=token_data.get("instance_url"),
+    )
+
+def bearer_headers(credentials: OAuthCredentials) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {credentials.access_token}",
+        "Content-Type": "application/json",
+    }
+
+def split_name(name: str) -> Tuple[str, str]:
+    parts = name.strip().split(maxsplit=1)
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return "", parts[0] if parts else ""
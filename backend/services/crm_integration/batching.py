@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+from services.rate_limit import is_outage
+
+T = TypeVar("T")
+
+async def send_in_batches(
+    items: List[T],
+    send_chunk: Callable[[List[T]], Awaitable[List[Dict[str, Any]]]],
+    max_batch_size: int,
+    concurrency: int,
+) -> List[Dict[str, Any]]:
+    # `send_chunk` returns one result per item, in the order the items were given
+    chunks = [items[start:start + max_batch_size] for start in range(0, len(items), max_batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(chunk: List[T]) -> List[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                results = await send_chunk(chunk)
+            except Exception as e:
+                return [error_result(e) for _ in chunk]
+            if len(results) != len(chunk):
+                return [{"status": "error", "message": "Provider returned a result count that does not match the batch"} for _ in chunk]
+            return results
+
+    chunk_results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+    results = []
+    for result in (result for chunk in chunk_results for result in chunk):
+        results.append({"index": len(results), **result})
+    return results
+
+def error_result(error: Exception) -> Dict[str, Any]:
+    # `outage` marks a failure of the provider rather than of the record; the record itself may be fine
+    return {"status": "error", "message": str(error), "outage": is_outage(error)}
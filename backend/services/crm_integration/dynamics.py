@@ -0,0 +1,89 @@
+from typing import Any, Dict, Optional
+from models.lead import Lead
+from models.oauth import OAuthCredentials
+from config import (
+    DYNAMICS_CLIENT_ID,
+    DYNAMICS_CLIENT_SECRET,
+    DYNAMICS_REDIRECT_URI,
+    DYNAMICS_TENANT_ID,
+    DYNAMICS_LOGIN_URL,
+    DYNAMICS_ORG_URL,
+)
+from .base import CRMAdapter, RateLimitInfo, bearer_headers, split_name
+
+class DynamicsAdapter(CRMAdapter):
+    name = "dynamics"
+    # The Web API only batches through multipart $batch requests; leads are created individually
+    max_batch_size = 1
+    rate_limit = RateLimitInfo(max_requests=6000, per_seconds=300, max_concurrency=52)
+
+    auth_url = f"{DYNAMICS_LOGIN_URL}/{DYNAMICS_TENANT_ID}/oauth2/v2.0/authorize"
+    token_url = f"{DYNAMICS_LOGIN_URL}/{DYNAMICS_TENANT_ID}/oauth2/v2.0/token"
+    client_id = DYNAMICS_CLIENT_ID
+    client_secret = DYNAMICS_CLIENT_SECRET
+    redirect_uri = DYNAMICS_REDIRECT_URI
+    scope = f"{DYNAMICS_ORG_URL}/user_impersonation offline_access"
+
+    async def send_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        url = f"{self._api_url()}/leads?$select=leadid"
+        _, body = await self._request("POST", url, credentials, headers=dynamics_headers(credentials), json=dynamics_lead_record(lead))
+        return body
+
+    def send_result(self, body: Any) -> Dict[str, Any]:
+        return dynamics_result(body, action="insert")
+
+    async def upsert_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        existing_id = await self._find_lead_id(lead, credentials) if lead.email else None
+        if existing_id is None:
+            return dynamics_result(await self.send_lead(lead, credentials), action="insert")
+
+        url = f"{self._api_url()}/leads({existing_id})"
+        headers = {**dynamics_headers(credentials), "If-Match": "*"}
+        status, body = await self._request("PATCH", url, credentials, headers=headers, json=dynamics_lead_record(lead))
+        if status in (200, 204):
+            return {"status": "success", "id": existing_id, "action": "update"}
+        return {"status": "error", "id": existing_id, "action": "update", "message": dynamics_error_message(body)}
+
+    async def _find_lead_id(self, lead: Lead, credentials: OAuthCredentials) -> Optional[str]:
+        email = str(lead.email).replace("'", "''")
+        params = {"$select": "leadid", "$filter": f"emailaddress1 eq '{email}'", "$top": "1"}
+        _, body = await self._request("GET", f"{self._api_url()}/leads", credentials, headers=dynamics_headers(credentials), params=params)
+        records = body.get("value") if isinstance(body, dict) else None
+        return records[0]["leadid"] if records else None
+
+    def _api_url(self) -> str:
+        if not DYNAMICS_ORG_URL:
+            raise ValueError("DYNAMICS_ORG_URL is not configured")
+        return f"{DYNAMICS_ORG_URL.rstrip('/')}/api/data/v9.2"
+
+def dynamics_headers(credentials: OAuthCredentials) -> Dict[str, str]:
+    return {
+        **bearer_headers(credentials),
+        "Accept": "application/json",
+        "OData-MaxVersion": "4.0",
+        "OData-Version": "4.0",
+        "Prefer": "return=representation",
+    }
+
+def dynamics_lead_record(lead: Lead) -> Dict[str, Any]:
+    first_name, last_name = split_name(lead.name)
+    return {
+        "subject": f"Business card: {lead.name}",
+        "firstname": first_name or None,
+        "lastname": last_name,
+        "emailaddress1": lead.email,
+        "telephone1": lead.phone,
+        "companyname": lead.company,
+        "jobtitle": lead.position,
+    }
+
+def dynamics_result(body: Any, action: str) -> Dict[str, Any]:
+    if isinstance(body, dict) and body.get("leadid"):
+        return {"status": "success", "id": body["leadid"], "action": action}
+    return {"status": "error", "message": dynamics_error_message(body)}
+
+def dynamics_error_message(body: Any) -> str:
+    error = body.get("error") if isinstance(body, dict) else None
+    if isinstance(error, dict):
+        return error.get("message") or str(error)
+    return str(body)
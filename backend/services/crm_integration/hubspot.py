@@ -0,0 +1,103 @@
+from typing import Any, Dict, List
+from models.lead import Lead
+from models.oauth import OAuthCredentials
+from config import (
+    HUBSPOT_CLIENT_ID,
+    HUBSPOT_CLIENT_SECRET,
+    HUBSPOT_REDIRECT_URI,
+    HUBSPOT_AUTH_URL,
+    HUBSPOT_API_BASE_URL,
+    CRM_BATCH_CONCURRENCY,
+)
+from .base import CRMAdapter, RateLimitInfo, split_name
+from .batching import send_in_batches
+
+HUBSPOT_CONTACTS_URL = f"{HUBSPOT_API_BASE_URL}/crm/v3/objects/contacts"
+
+class HubSpotAdapter(CRMAdapter):
+    name = "hubspot"
+    # Batch create/upsert accept up to 100 inputs
+    max_batch_size = 100
+    rate_limit = RateLimitInfo(max_requests=100, per_seconds=10, max_concurrency=10)
+
+    auth_url = HUBSPOT_AUTH_URL
+    token_url = f"{HUBSPOT_API_BASE_URL}/oauth/v1/token"
+    client_id = HUBSPOT_CLIENT_ID
+    client_secret = HUBSPOT_CLIENT_SECRET
+    redirect_uri = HUBSPOT_REDIRECT_URI
+    scope = "crm.objects.contacts.read crm.objects.contacts.write"
+
+    async def send_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        data = {"properties": hubspot_contact_properties(lead)}
+        _, body = await self._request("POST", HUBSPOT_CONTACTS_URL, credentials, json=data)
+        return body
+
+    def send_result(self, body: Any) -> Dict[str, Any]:
+        return hubspot_single_result(body, action="insert")
+
+    async def send_leads(self, leads: List[Lead], credentials: OAuthCredentials) -> List[Dict[str, Any]]:
+        async def send_chunk(chunk: List[Lead]) -> List[Dict[str, Any]]:
+            inputs = [{"properties": hubspot_contact_properties(lead)} for lead in chunk]
+            return await self._batch(f"{HUBSPOT_CONTACTS_URL}/batch/create", inputs, chunk, credentials)
+
+        return await send_in_batches(leads, send_chunk, self.max_batch_size, CRM_BATCH_CONCURRENCY)
+
+    async def upsert_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        if not lead.email:
+            return hubspot_single_result(await self.send_lead(lead, credentials), action="insert")
+        inputs = [{"idProperty": "email", "id": lead.email, "properties": hubspot_contact_properties(lead)}]
+        (result,) = await self._batch(f"{HUBSPOT_CONTACTS_URL}/batch/upsert", inputs, [lead], credentials)
+        return result
+
+    async def _batch(self, url: str, inputs: List[Dict[str, Any]], chunk: List[Lead], credentials: OAuthCredentials) -> List[Dict[str, Any]]:
+        idempotent = url.endswith("/batch/upsert")
+        status, body = await self._request("POST", url, credentials, idempotent=idempotent, json={"inputs": inputs})
+
+        results = body.get("results") if isinstance(body, dict) else None
+        if not isinstance(results, list):
+            message = body.get("message") if isinstance(body, dict) else None
+            return [{"status": "error", "message": message or f"HubSpot returned status {status}"} for _ in chunk]
+
+        # Batch results are not guaranteed to come back in input order, so match them on email. A lead with
+        # an email only takes a result carrying that email; the rest are left to leads without one.
+        by_email: Dict[str, List[Dict[str, Any]]] = {}
+        unmatched = []
+        for result in results:
+            email = ((result.get("properties") or {}).get("email") or "").lower()
+            if email:
+                by_email.setdefault(email, []).append(result)
+            else:
+                unmatched.append(result)
+
+        errors = body.get("errors") or []
+        error_message = errors[0].get("message") if errors and isinstance(errors[0], dict) else "Contact was not created"
+        mapped = []
+        for lead in chunk:
+            if lead.email:
+                matches = by_email.get(str(lead.email).lower())
+                result = matches.pop(0) if matches else None
+            else:
+                result = unmatched.pop(0) if unmatched else None
+            if result is None:
+                mapped.append({"status": "error", "message": error_message})
+            else:
+                action = "insert" if result.get("new", True) else "update"
+                mapped.append({"status": "success", "id": result.get("id"), "action": action})
+        return mapped
+
+def hubspot_contact_properties(lead: Lead) -> Dict[str, Any]:
+    first_name, last_name = split_name(lead.name)
+    properties = {
+        "firstname": first_name,
+        "lastname": last_name,
+        "email": lead.email,
+        "phone": lead.phone,
+        "company": lead.company,
+        "jobtitle": lead.position,
+    }
+    return {key: value for key, value in properties.items() if value}
+
+def hubspot_single_result(body: Dict[str, Any], action: str) -> Dict[str, Any]:
+    if isinstance(body, dict) and body.get("id"):
+        return {"status": "success", "id": body["id"], "action": action}
+    return {"status": "error", "message": body.get("message") if isinstance(body, dict) else str(body)}
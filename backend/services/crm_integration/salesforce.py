@@ -0,0 +1,101 @@
+from typing import Any, Dict, List, Optional
+from models.lead import Lead
+from models.oauth import OAuthCredentials
+from config import (
+    SALESFORCE_CLIENT_ID,
+    SALESFORCE_CLIENT_SECRET,
+    SALESFORCE_REDIRECT_URI,
+    SALESFORCE_LOGIN_URL,
+    SALESFORCE_INSTANCE_URL,
+    SALESFORCE_API_VERSION,
+    CRM_BATCH_CONCURRENCY,
+)
+from .base import CRMAdapter, RateLimitInfo, split_name
+from .batching import send_in_batches
+
+class SalesforceAdapter(CRMAdapter):
+    name = "salesforce"
+    # sObject Collections accept up to 200 records per request
+    max_batch_size = 200
+    rate_limit = RateLimitInfo(max_requests=25, per_seconds=1, max_concurrency=25)
+
+    auth_url = f"{SALESFORCE_LOGIN_URL}/services/oauth2/authorize"
+    token_url = f"{SALESFORCE_LOGIN_URL}/services/oauth2/token"
+    client_id = SALESFORCE_CLIENT_ID
+    client_secret = SALESFORCE_CLIENT_SECRET
+    redirect_uri = SALESFORCE_REDIRECT_URI
+    scope = "api refresh_token"
+
+    async def send_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        url = f"{self._data_url(credentials)}/sobjects/Lead/"
+        _, body = await self._request("POST", url, credentials, json=salesforce_lead_record(lead))
+        return body
+
+    def send_result(self, body: Any) -> Dict[str, Any]:
+        return salesforce_save_result(body)
+
+    async def send_leads(self, leads: List[Lead], credentials: OAuthCredentials) -> List[Dict[str, Any]]:
+        url = f"{self._data_url(credentials)}/composite/sobjects"
+
+        async def send_chunk(chunk: List[Lead]) -> List[Dict[str, Any]]:
+            data = {
+                "allOrNone": False,
+                "records": [{"attributes": {"type": "Lead"}, **salesforce_lead_record(lead)} for lead in chunk],
+            }
+            _, body = await self._request("POST", url, credentials, json=data)
+
+            # Collections return one save result per record, in request order
+            if not isinstance(body, list):
+                return [{"status": "error", "message": salesforce_error_message(body)} for _ in chunk]
+            return [salesforce_save_result(result) for result in body]
+
+        return await send_in_batches(leads, send_chunk, self.max_batch_size, CRM_BATCH_CONCURRENCY)
+
+    async def upsert_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        existing_id = await self._find_lead_id(lead, credentials) if lead.email else None
+        if existing_id is None:
+            result = salesforce_save_result(await self.send_lead(lead, credentials))
+            return {**result, "action": "insert"}
+
+        url = f"{self._data_url(credentials)}/sobjects/Lead/{existing_id}"
+        status, body = await self._request("PATCH", url, credentials, json=salesforce_lead_record(lead))
+        if status == 204:
+            return {"status": "success", "id": existing_id, "action": "update"}
+        return {"status": "error", "id": existing_id, "action": "update", "message": salesforce_error_message(body)}
+
+    async def _find_lead_id(self, lead: Lead, credentials: OAuthCredentials) -> Optional[str]:
+        email = str(lead.email).replace("\\", "\\\\").replace("'", "\\'")
+        url = f"{self._data_url(credentials)}/query"
+        params = {"q": f"SELECT Id FROM Lead WHERE Email = '{email}' LIMIT 1"}
+        _, body = await self._request("GET", url, credentials, params=params)
+        records = body.get("records") if isinstance(body, dict) else None
+        return records[0]["Id"] if records else None
+
+    def _data_url(self, credentials: OAuthCredentials) -> str:
+        instance_url = credentials.instance_url or SALESFORCE_INSTANCE_URL
+        if not instance_url:
+            raise ValueError("Salesforce instance URL is unknown; reconnect the account or set SALESFORCE_INSTANCE_URL")
+        return f"{instance_url.rstrip('/')}/services/data/{SALESFORCE_API_VERSION}"
+
+def salesforce_lead_record(lead: Lead) -> Dict[str, Any]:
+    first_name, last_name = split_name(lead.name)
+    return {
+        "FirstName": first_name or None,
+        "LastName": last_name,
+        "Email": lead.email,
+        "Phone": lead.phone,
+        # Company is required on Salesforce leads
+        "Company": lead.company or "Unknown",
+        "Title": lead.position,
+    }
+
+def salesforce_save_result(result: Any) -> Dict[str, Any]:
+    if isinstance(result, dict) and result.get("success"):
+        return {"status": "success", "id": result.get("id")}
+    return {"status": "error", "id": result.get("id") if isinstance(result, dict) else None, "message": salesforce_error_message(result)}
+
+def salesforce_error_message(body: Any) -> str:
+    errors = body.get("errors") if isinstance(body, dict) else body
+    if isinstance(errors, list) and errors and isinstance(errors[0], dict):
+        return errors[0].get("message") or str(errors[0])
+    return str(body)
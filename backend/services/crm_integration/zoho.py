@@ -1,58 +1,82 @@
-import aiohttp
+from typing import Any, Dict, List, Optional
 from models.lead import Lead
 from models.oauth import OAuthCredentials
-from config import ZOHO_CLIENT_ID, ZOHO_CLIENT_SECRET, ZOHO_REDIRECT_URI
+from config import ZOHO_CLIENT_ID, ZOHO_CLIENT_SECRET, ZOHO_REDIRECT_URI, ZOHO_API_BASE_URL, ZOHO_ACCOUNTS_URL, CRM_BATCH_CONCURRENCY
+from .base import CRMAdapter, RateLimitInfo
+from .batching import error_result, send_in_batches
 
-ZOHO_API_URL = "https://www.zohoapis.com/crm/v2/Leads"
-ZOHO_AUTH_URL = "https://accounts.zoho.com/oauth/v2/auth"
-ZOHO_TOKEN_URL = "https://accounts.zoho.com/oauth/v2/token"
+ZOHO_API_URL = f"{ZOHO_API_BASE_URL}/crm/v2/Leads"
+ZOHO_UPSERT_URL = f"{ZOHO_API_URL}/upsert"
+ZOHO_AUTH_URL = f"{ZOHO_ACCOUNTS_URL}/oauth/v2/auth"
+ZOHO_TOKEN_URL = f"{ZOHO_ACCOUNTS_URL}/oauth/v2/token"
 
-async def send_to_zoho(lead: Lead, credentials: OAuthCredentials):
-    headers = {
-        "Authorization": f"Bearer {credentials.access_token}",
-        "Content-Type": "application/json",
-    }
-    
-    data = {
-        "data": [
-            {
-                "Last_Name": lead.name,
-                "Email": lead.email,
-                "Phone": lead.phone,
-                "Company": lead.company,
-                "Designation": lead.position,
-            }
-        ]
-    }
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(ZOHO_API_URL, headers=headers, json=data) as response:
-            return await response.json()
-
-async def initiate_zoho_oauth():
-    params = {
-        "client_id": ZOHO_CLIENT_ID,
-        "redirect_uri": ZOHO_REDIRECT_URI,
-        "scope": "ZohoCRM.modules.ALL",
-        "response_type": "code",
-        "access_type": "offline",
+class ZohoAdapter(CRMAdapter):
+    name = "zoho"
+    # Zoho accepts at most 100 records per insert request
+    max_batch_size = 100
+    rate_limit = RateLimitInfo(max_requests=100, per_seconds=60, max_concurrency=10)
+
+    auth_url = ZOHO_AUTH_URL
+    token_url = ZOHO_TOKEN_URL
+    client_id = ZOHO_CLIENT_ID
+    client_secret = ZOHO_CLIENT_SECRET
+    redirect_uri = ZOHO_REDIRECT_URI
+    scope = "ZohoCRM.modules.ALL"
+
+    async def send_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        data = {"data": [zoho_lead_record(lead)]}
+        _, body = await self._request("POST", ZOHO_API_URL, credentials, json=data)
+        return body
+
+    def send_result(self, body: Any) -> Dict[str, Any]:
+        records = body.get("data") if isinstance(body, dict) else None
+        if not isinstance(records, list) or not records:
+            return {"status": "error", "message": body.get("message") if isinstance(body, dict) else str(body)}
+        return zoho_record_result(records[0])
+
+    async def send_leads(self, leads: List[Lead], credentials: OAuthCredentials) -> List[Dict[str, Any]]:
+        async def send_chunk(chunk: List[Lead]) -> List[Dict[str, Any]]:
+            return await self._post_records(ZOHO_API_URL, {"data": [zoho_lead_record(lead) for lead in chunk]}, credentials, len(chunk))
+
+        return await send_in_batches(leads, send_chunk, self.max_batch_size, CRM_BATCH_CONCURRENCY)
+
+    async def upsert_lead(self, lead: Lead, credentials: OAuthCredentials) -> Dict[str, Any]:
+        data = {"data": [zoho_lead_record(lead)], "duplicate_check_fields": ["Email"]}
+        status, body = await self._request("POST", ZOHO_UPSERT_URL, credentials, idempotent=True, json=data)
+        records = body.get("data") if isinstance(body, dict) else None
+        if not isinstance(records, list) or len(records) != 1:
+            return error_result(ValueError(f"Zoho returned status {status} without a single upsert result: {body}"))
+        return zoho_record_result(records[0])
+
+    async def _post_records(self, url: str, data: Dict[str, Any], credentials: OAuthCredentials, count: int) -> List[Dict[str, Any]]:
+        status, body = await self._request("POST", url, credentials, json=data)
+
+        # Zoho answers with one entry per record, in request order, even on partial failure
+        records = body.get("data") if isinstance(body, dict) else None
+        if not isinstance(records, list):
+            message = body.get("message") if isinstance(body, dict) else None
+            return [{"status": "error", "message": message or f"Zoho returned status {status}"} for _ in range(count)]
+        return [zoho_record_result(record) for record in records]
+
+    def authorization_params(self, state: Optional[str] = None) -> Dict[str, str]:
+        params = super().authorization_params(state)
+        params["access_type"] = "offline"
+        return params
+
+def zoho_lead_record(lead: Lead) -> Dict[str, Any]:
+    return {
+        "Last_Name": lead.name,
+        "Email": lead.email,
+        "Phone": lead.phone,
+        "Company": lead.company,
+        "Designation": lead.position,
     }
-    return f"{ZOHO_AUTH_URL}?{'&'.join([f'{k}={v}' for k, v in params.items()])}"
-
-async def exchange_zoho_code_for_token(code: str):
-    data = {
-        "client_id": ZOHO_CLIENT_ID,
-        "client_secret": ZOHO_CLIENT_SECRET,
-        "redirect_uri": ZOHO_REDIRECT_URI,
-        "code": code,
-        "grant_type": "authorization_code",
+
+def zoho_record_result(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "success" if record.get("status") == "success" else "error",
+        "id": (record.get("details") or {}).get("id"),
+        "action": record.get("action"),
+        "code": record.get("code"),
+        "message": record.get("message"),
     }
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(ZOHO_TOKEN_URL, data=data) as response:
-            token_data = await response.json()
-            return OAuthCredentials(
-                access_token=token_data["access_token"],
-                refresh_token=token_data.get("refresh_token"),
-                expires_at=token_data.get("expires_in")
-            )
\ No newline at end of file
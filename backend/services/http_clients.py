@@ -0,0 +1,86 @@
+import asyncio
+import importlib
+import aiohttp
+from typing import TYPE_CHECKING, Dict, Optional
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    PERPLEXITY_API_KEY,
+    PERPLEXITY_BASE_URL,
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_TIMEOUT,
+    OPENAI_MAX_IN_FLIGHT,
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+class ClientRegistry:
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._openai_clients: Dict[str, "AsyncOpenAI"] = {}
+        self._preload: Optional[asyncio.Future] = None
+        self.openai_slots = asyncio.Semaphore(OPENAI_MAX_IN_FLIGHT)
+
+    async def start(self):
+        self.session()
+        # The OpenAI SDK is imported in the background once the worker is up, so neither startup nor the
+        # first transcription waits for it
+        self._preload = asyncio.ensure_future(asyncio.to_thread(importlib.import_module, "openai"))
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                use_dns_cache=True,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            )
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    def openai(self) -> "AsyncOpenAI":
+        return self._openai_client("openai", OPENAI_API_KEY, OPENAI_BASE_URL)
+
+    def perplexity(self) -> "AsyncOpenAI":
+        return self._openai_client("perplexity", PERPLEXITY_API_KEY, PERPLEXITY_BASE_URL)
+
+    def _openai_client(self, name: str, api_key: Optional[str], base_url: Optional[str] = None) -> "AsyncOpenAI":
+        client = self._openai_clients.get(name)
+        if client is None:
+            # Imported on first use: the SDK (and httpx under it) is most of the app's import time, which
+            # every worker pays at startup
+            import httpx
+            from openai import AsyncOpenAI
+            # Each OpenAI-compatible client talks to a single host, so its pool size is the per-host limit.
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_LIMIT_PER_HOST,
+                    max_keepalive_connections=HTTP_POOL_LIMIT_PER_HOST,
+                    keepalive_expiry=HTTP_KEEPALIVE_TIMEOUT,
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            )
+            # Retries and backoff are owned by services.rate_limit, which sees every caller sharing the key
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            self._openai_clients[name] = client
+        return client
+
+    async def close(self):
+        if self._preload is not None:
+            await asyncio.gather(self._preload, return_exceptions=True)
+            self._preload = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        for client in self._openai_clients.values():
+            await client.close()
+        self._openai_clients.clear()
+
+clients = ClientRegistry()
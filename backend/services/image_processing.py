@@ -1,42 +1,150 @@
-import base64
+import asyncio
+import binascii
+import hashlib
+import io
 import json
-from typing import Dict, Any
+import logging
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
 from fastapi import UploadFile, HTTPException
-from openai import AsyncOpenAI
-from config import OPENAI_API_KEY
+from PIL import Image, ImageChops, ImageOps, UnidentifiedImageError
+from config import (
+    OPENAI_API_KEY,
+    TRANSCRIPTION_CACHE_BACKEND,
+    TRANSCRIPTION_CACHE_PATH,
+    TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    TRANSCRIPTION_CACHE_TTL,
+    IMAGE_MAX_DIMENSION,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+    IMAGE_PREPROCESS_EXECUTOR,
+    IMAGE_PREPROCESS_WORKERS,
+    LOCAL_OCR_ENABLED,
+    LOCAL_OCR_LANGUAGE,
+)
+from services.cache import create_cache
+from services.http_clients import clients
+from services.local_ocr import LocalOCRStats, local_ocr_available, read_card
+from services.rate_limit import rate_limits
+from services.telemetry import span
+from utils.normalization import TRANSCRIPTION_FIELDS
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+logger = logging.getLogger(__name__)
 
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Allowance for multipart boundaries and part headers around a single image
+MULTIPART_OVERHEAD = 64 * 1024
+# A multiple of 3 so every chunk encodes to base64 without padding
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+TRANSCRIPTION_MODEL = "gpt-4o"
+# Bump when the prompt or output shape changes so stale transcriptions are not served
+TRANSCRIPTION_CACHE_VERSION = "2"
+# Strict structured output: the model must return exactly these fields, null when absent
+TRANSCRIPTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "business_card",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {field: {"type": ["string", "null"]} for field in TRANSCRIPTION_FIELDS},
+            "required": list(TRANSCRIPTION_FIELDS),
+            "additionalProperties": False,
+        },
+    },
+}
+
+transcription_cache = create_cache(
+    TRANSCRIPTION_CACHE_BACKEND,
+    path=TRANSCRIPTION_CACHE_PATH,
+    table="transcriptions",
+    max_entries=TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    ttl=TRANSCRIPTION_CACHE_TTL,
+)
+
+# Card detection runs on a small copy; a bounding box is only trusted within these area bounds
+CARD_DETECTION_SIZE = 256
+CARD_MIN_AREA_RATIO = 0.2
+CARD_MAX_AREA_RATIO = 0.95
+CARD_BACKGROUND_THRESHOLD = 40
+CARD_CROP_MARGIN = 0.02
+
+_preprocess_executor: Optional[Executor] = None
+local_ocr_stats = LocalOCRStats()
+
+class TranscriptionParseError(ValueError):
+    pass
 
 async def transcribe_business_card(image: UploadFile) -> Dict[str, Any]:
+    image_content = await read_image_upload(image)
+    return await transcribe_image(image_content)
+
+async def transcribe_image(image_content: bytes) -> Dict[str, Any]:
     try:
-        await validate_image(image)
-        image_content = await image.read()
-        base64_image = base64.b64encode(image_content).decode("utf-8")
-
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an AI assistant tasked with transcribing business card information. Extract all relevant details and present them in a structured JSON format."
-                },
-                {
-                    "role": "user",
-                    "content": "Please transcribe the text from this business card image and provide the information in a structured JSON format. Include fields such as name, job_title, company, email, phone, website, address, and linkedin_profile if available. If a field is not present or cannot be determined, omit it from the JSON."
-                },
-                {
-                    "role": "user",
-                    "content": f"data:image/jpeg;base64,{base64_image}" 
-                }
-            ]
-        )
+        with span("preprocess"):
+            processed_image, media_type = await preprocess_image_async(image_content)
+        # Keyed on the normalized image, so a rescan that differs only in its metadata still hits
+        cache_key = transcription_cache_key(processed_image)
+        cached = await transcription_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if LOCAL_OCR_ENABLED:
+            with span("local_ocr"):
+                transcription = await transcribe_locally(processed_image)
+            if transcription is not None:
+                await transcription_cache.set(cache_key, transcription)
+                return transcription
+
+        with span("encode_image"):
+            image_url = encode_data_url(processed_image, media_type)
+        del processed_image
+
+        async def request():
+            async with clients.openai_slots:
+                raw = await clients.openai().chat.completions.with_raw_response.create(
+                    model=TRANSCRIPTION_MODEL,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "You are an AI assistant tasked with transcribing business card information. Extract all relevant details and present them in a structured JSON format."
+                        },
+                        {
+                            "role": "user",
+                            "content": "Please transcribe the text from this business card image. Fill in name, job_title, company, email, phone, website, address and linkedin_profile exactly as printed. Use null for any field that is not present or cannot be determined."
+                        },
+                        {
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "image_url",
+                                    "image_url": {"url": image_url}
+                                }
+                            ]
+                        }
+                    ],
+                    response_format=TRANSCRIPTION_RESPONSE_FORMAT,
+                )
+            rate_limits.observe("openai", raw.headers, key=OPENAI_API_KEY)
+            return raw.parse()
 
-        content = response.choices[0].message.content
-        transcription = parse_gpt_response(content)
-        
+        with span("transcribe"):
+            response = await rate_limits.call("openai", request, key=OPENAI_API_KEY)
+
+        message = response.choices[0].message
+        if getattr(message, "refusal", None):
+            raise HTTPException(status_code=422, detail=f"The model declined to transcribe this image: {message.refusal}")
+        try:
+            transcription = parse_gpt_response(message.content)
+        except TranscriptionParseError as e:
+            # Not cached, and a 502 rather than a fake "Unknown" lead so callers and the job queue retry
+            raise HTTPException(status_code=502, detail=str(e))
+
+        await transcription_cache.set(cache_key, transcription)
         return transcription
 
     except HTTPException as he:
@@ -44,15 +152,195 @@ async def transcribe_business_card(image: UploadFile) -> Dict[str, Any]:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error transcribing business card: {str(e)}")
 
-async def validate_image(image: UploadFile):
-    if image.content_type not in ALLOWED_IMAGE_TYPES:
+async def transcribe_locally(processed_image: bytes) -> Optional[Dict[str, Any]]:
+    # Clean, high-contrast cards are read on the CPU; anything doubtful falls through to the model
+    if not local_ocr_available():
+        return None
+    local_ocr_stats.attempted += 1
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(get_preprocess_executor(), read_card, processed_image, LOCAL_OCR_LANGUAGE)
+    except Exception as e:
+        local_ocr_stats.failed += 1
+        logger.warning("Local OCR failed, falling back to the model: %s", e)
+        return None
+    if not result.accepted:
+        local_ocr_stats.escalated += 1
+        return None
+    local_ocr_stats.accepted += 1
+    return result.fields
+
+async def preprocess_image_async(image_content: bytes) -> Tuple[bytes, str]:
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            get_preprocess_executor(),
+            preprocess_image,
+            image_content,
+            IMAGE_MAX_DIMENSION,
+            IMAGE_OUTPUT_FORMAT,
+            IMAGE_OUTPUT_QUALITY,
+        )
+    except Image.DecompressionBombError:
+        # A small file that decodes to an enormous image; Pillow refuses it before allocating the pixels
+        raise HTTPException(status_code=413, detail=f"Image dimensions exceed the maximum of {Image.MAX_IMAGE_PIXELS * 2} pixels.")
+    except (UnidentifiedImageError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {str(e)}")
+
+def get_preprocess_executor() -> Executor:
+    global _preprocess_executor
+    if _preprocess_executor is None:
+        if IMAGE_PREPROCESS_EXECUTOR == "process":
+            _preprocess_executor = ProcessPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS)
+        else:
+            _preprocess_executor = ThreadPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS)
+    return _preprocess_executor
+
+def shutdown_preprocess_executor():
+    global _preprocess_executor
+    if _preprocess_executor is not None:
+        _preprocess_executor.shutdown(wait=False, cancel_futures=True)
+        _preprocess_executor = None
+
+def preprocess_image(image_content: bytes, max_dimension: int, output_format: str, quality: int) -> Tuple[bytes, str]:
+    with Image.open(io.BytesIO(image_content)) as image:
+        # Let the JPEG decoder skip detail we would throw away; 2x headroom survives the card crop
+        image.draft("RGB", (max_dimension * 2, max_dimension * 2))
+        image = ImageOps.exif_transpose(image)
+        image = flatten_to_rgb(image)
+        image = crop_to_card(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format=output_format, quality=quality, optimize=output_format.upper() == "JPEG")
+    return output.getvalue(), f"image/{output_format.lower()}"
+
+def flatten_to_rgb(image: Image.Image) -> Image.Image:
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+def crop_to_card(image: Image.Image) -> Image.Image:
+    small = image.convert("L")
+    small.thumbnail((CARD_DETECTION_SIZE, CARD_DETECTION_SIZE))
+
+    # Estimate the background from the border pixels and keep whatever differs from it
+    width, height = small.size
+    border = [small.getpixel((x, y)) for x in range(width) for y in (0, height - 1)]
+    border += [small.getpixel((x, y)) for y in range(height) for x in (0, width - 1)]
+    background = sorted(border)[len(border) // 2]
+
+    diff = ImageChops.difference(small, Image.new("L", small.size, background))
+    mask = diff.point(lambda value: 255 if value > CARD_BACKGROUND_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+
+    left, top, right, bottom = bbox
+    area_ratio = ((right - left) * (bottom - top)) / float(width * height)
+    if not CARD_MIN_AREA_RATIO <= area_ratio <= CARD_MAX_AREA_RATIO:
+        return image
+
+    scale_x = image.width / float(width)
+    scale_y = image.height / float(height)
+    margin_x = image.width * CARD_CROP_MARGIN
+    margin_y = image.height * CARD_CROP_MARGIN
+    return image.crop((
+        max(0, int(left * scale_x - margin_x)),
+        max(0, int(top * scale_y - margin_y)),
+        min(image.width, int(right * scale_x + margin_x)),
+        min(image.height, int(bottom * scale_y + margin_y)),
+    ))
+
+def transcription_cache_key(image_content: bytes) -> str:
+    digest = hashlib.sha256(image_content).hexdigest()
+    return f"{TRANSCRIPTION_MODEL}:v{TRANSCRIPTION_CACHE_VERSION}:{digest}"
+
+async def read_image_upload(image: UploadFile) -> bytearray:
+    with span("upload"):
+        image_content = await read_upload(image, MAX_IMAGE_SIZE)
+        validate_image_content(image_content)
+    return image_content
+
+async def read_upload(upload: UploadFile, max_size: int) -> bytearray:
+    # The client-supplied size is not trusted; stop reading as soon as the limit is passed
+    content = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return content
+        content += chunk
+        if len(content) > max_size:
+            raise HTTPException(status_code=413, detail=f"{upload.filename or 'Upload'} exceeds the maximum size of {max_size / (1024 * 1024)}MB.")
+
+def validate_image_content(image_content: bytes) -> str:
+    check_image_size(len(image_content))
+    media_type = sniff_image_type(image_content)
+    check_image_type(media_type)
+    return media_type
+
+def sniff_image_type(image_content: bytes) -> Optional[str]:
+    header = bytes(image_content[:12])
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def check_image_type(media_type: Optional[str]):
+    if media_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(status_code=400, detail=f"Unsupported image format. Please upload one of: {', '.join(ALLOWED_IMAGE_TYPES)}.")
-    
-    if image.size > MAX_IMAGE_SIZE:
+
+def check_image_size(size: int):
+    if size > MAX_IMAGE_SIZE:
         raise HTTPException(status_code=400, detail=f"Image size exceeds the maximum limit of {MAX_IMAGE_SIZE / (1024 * 1024)}MB.")
 
-def parse_gpt_response(content: str) -> Dict[str, Any]:
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        return {"error": "Failed to parse response from GPT model"} 
+def encode_data_url(image_content: bytes, media_type: str) -> str:
+    # Encode straight into one preallocated buffer instead of bytes -> str -> f-string copies
+    prefix = f"data:{media_type};base64,".encode("ascii")
+    encoded = bytearray(len(prefix) + 4 * ((len(image_content) + 2) // 3))
+    encoded[:len(prefix)] = prefix
+
+    offset = len(prefix)
+    view = memoryview(image_content)
+    for start in range(0, len(view), BASE64_CHUNK_SIZE):
+        chunk = binascii.b2a_base64(view[start:start + BASE64_CHUNK_SIZE], newline=False)
+        encoded[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    return encoded.decode("ascii")
+
+def parse_gpt_response(content: Optional[str]) -> Dict[str, Any]:
+    # With strict structured output the content is a bare JSON object; the fallbacks cover models or
+    # deployments without json_schema support (code fences, prose around the object, trailing commas)
+    text = (content or "").strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+
+    data = None
+    for candidate in (text, re.sub(r",\s*([}\]])", r"\1", text)):
+        start = candidate.find("{")
+        if start == -1:
+            continue
+        try:
+            data, _ = json.JSONDecoder().raw_decode(candidate[start:])
+            break
+        except json.JSONDecodeError:
+            continue
+
+    if not isinstance(data, dict):
+        raise TranscriptionParseError("Failed to parse the transcription returned by the model")
+    # Some models wrap the card in a single top-level key ({"business_card": {...}}); a field whose own value
+    # is an object ({"name": {"first": ...}}) is not such a wrapper
+    if len(data) == 1:
+        ((key, value),) = data.items()
+        if isinstance(value, dict) and key not in TRANSCRIPTION_FIELDS and any(field in value for field in TRANSCRIPTION_FIELDS):
+            data = value
+    return {key: value for key, value in data.items() if value not in (None, "", [])}
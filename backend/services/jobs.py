@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from config import (
+    JOB_QUEUE_PATH,
+    JOB_WORKERS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BASE_DELAY,
+    JOB_RETRY_MAX_DELAY,
+    JOB_LEASE_SECONDS,
+    JOB_POLL_INTERVAL,
+)
+from services.telemetry import request_id_var
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+JobHandler = Callable[[bytes], Awaitable[Any]]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+def register_job_handler(kind: str):
+    def decorator(handler: JobHandler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+class JobQueue:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, idempotency_key TEXT UNIQUE, status TEXT NOT NULL, "
+                "payload BLOB, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "max_attempts INTEGER NOT NULL, run_at REAL NOT NULL, locked_until REAL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, run_at)")
+
+    async def submit(self, kind: str, payload: bytes, idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        return await asyncio.to_thread(self._submit, kind, bytes(payload), idempotency_key)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._claim)
+
+    # `attempt` is the attempt the worker claimed. Once its lease ran out and another worker claimed the job
+    # again, the outcome is ignored and these return False, so a stalled worker cannot overwrite a later one.
+    async def complete(self, job_id: str, attempt: int, result: Any) -> bool:
+        return await asyncio.to_thread(self._finish, job_id, attempt, "succeeded", json.dumps(result), None)
+
+    async def fail(self, job_id: str, attempt: int, error: str) -> bool:
+        return await asyncio.to_thread(self._finish, job_id, attempt, "failed", None, error)
+
+    async def retry(self, job_id: str, attempt: int, error: str, delay: float) -> bool:
+        return await asyncio.to_thread(self._retry, job_id, attempt, error, delay)
+
+    def _submit(self, kind: str, payload: bytes, idempotency_key: Optional[str]) -> Tuple[Dict[str, Any], bool]:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if idempotency_key is not None:
+                    existing = self._conn.execute(
+                        "SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                    ).fetchone()
+                    if existing is not None:
+                        self._conn.execute("COMMIT")
+                        return self._to_dict(existing), False
+
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, idempotency_key, status, payload, max_attempts, run_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                    (job_id, kind, idempotency_key, payload, JOB_MAX_ATTEMPTS, now, now, now),
+                )
+                row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row), True
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers can never claim the same row
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A lease that ran out means the worker died mid-job, possibly because of the job itself; one that
+                # did so on every attempt is failed instead of being handed to the next worker
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'The worker stopped while running the last attempt', "
+                    "payload = NULL, locked_until = NULL, updated_at = ? "
+                    "WHERE status = 'running' AND locked_until <= ? AND attempts >= max_attempts",
+                    (now, now),
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE (status IN ('queued', 'retrying') AND run_at <= ?) "
+                    "OR (status = 'running' AND locked_until <= ?) ORDER BY run_at LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ? WHERE id = ?",
+                    (now + JOB_LEASE_SECONDS, now, row["id"]),
+                )
+                row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._to_dict(row)
+        job["payload"] = row["payload"]
+        return job
+
+    def _finish(self, job_id: str, attempt: int, status: str, result: Optional[str], error: Optional[str]) -> bool:
+        with self._lock:
+            # The image is no longer needed once the job has settled
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, locked_until = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (status, result, error, time.time(), job_id, attempt),
+            )
+        return cursor.rowcount > 0
+
+    def _retry(self, job_id: str, attempt: int, error: str, delay: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'retrying', error = ?, run_at = ?, locked_until = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (error, now + delay, now, job_id, attempt),
+            )
+        return cursor.rowcount > 0
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JobWorkerPool:
+    def __init__(self, queue: JobQueue, concurrency: int):
+        self.queue = queue
+        self.concurrency = concurrency
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._run()) for _ in range(self.concurrency)]
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while True:
+            try:
+                job = await self.queue.claim()
+                if job is not None:
+                    await self._execute(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # e.g. "database is locked" with several worker processes; a job this worker held goes back to
+                # the queue when its lease runs out, and the worker keeps polling
+                logger.exception("Job worker failed")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job: Dict[str, Any]):
+        # Log lines from the handler carry the job ID where a request would carry its request ID
+        request_id_var.set(job["job_id"])
+        handler = JOB_HANDLERS.get(job["kind"])
+        if handler is None:
+            await self.queue.fail(job["job_id"], job["attempts"], f"No handler registered for job kind: {job['kind']}")
+            return
+
+        try:
+            result = await handler(job["payload"])
+        except asyncio.CancelledError:
+            # Shutting down; the lease expiring hands the job to the next worker
+            raise
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            # Client errors (bad image, invalid lead data) will not succeed on a retry
+            retryable = not (isinstance(e, HTTPException) and 400 <= e.status_code < 500)
+            if retryable and job["attempts"] < job["max_attempts"]:
+                # A provider that asked us to back off (503 with Retry-After) is not retried any sooner
+                delay = max(retry_delay(job["attempts"]), getattr(e, "retry_after", 0))
+                settled = await self.queue.retry(job["job_id"], job["attempts"], str(error), delay)
+            else:
+                settled = await self.queue.fail(job["job_id"], job["attempts"], str(error))
+        else:
+            settled = await self.queue.complete(job["job_id"], job["attempts"], result)
+        if not settled:
+            logger.warning("Job %s outlived its lease and was claimed again; this attempt's outcome was dropped", job["job_id"])
+
+def retry_delay(attempt: int) -> float:
+    # Jitter keeps retries from a burst of failures from landing together
+    delay = min(JOB_RETRY_MAX_DELAY, JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+job_queue = JobQueue(JOB_QUEUE_PATH)
+job_workers = JobWorkerPool(job_queue, JOB_WORKERS)
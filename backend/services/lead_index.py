@@ -0,0 +1,282 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import LEAD_INDEX_PATH, LEAD_MATCH_THRESHOLD, LEAD_INDEX_MAX_CANDIDATES
+from models.lead import Lead, LeadMatch
+from utils.normalization import normalize_email, normalize_phone, normalize_name, normalize_company
+
+# Name and company weights for the fuzzy pass. A name alone is never enough: two people of the same name
+# are only taken for one when the company matches too (or, before the fuzzy pass, the email or phone)
+NAME_WEIGHT = 0.6
+COMPANY_WEIGHT = 0.4
+
+@dataclass(slots=True)
+class IndexedLead:
+    lead_id: int
+    name: str
+    company: str
+    email: Optional[str]
+    phone: Optional[str]
+
+class LeadIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Reads (startup load, catching up with other workers) go through their own connection, which
+        # WAL never blocks behind a writer; lookups run on the event loop and must not wait on the writer lock
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader_lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leads ("
+                "lead_id INTEGER PRIMARY KEY, name TEXT NOT NULL, company TEXT NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # Every email and phone a lead has been seen with, so a merged lead stays reachable by all of them
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lead_keys (key TEXT PRIMARY KEY, lead_id INTEGER NOT NULL)"
+            )
+
+        # Lookups only touch these; SQLite is the durable copy they are rebuilt from at startup
+        self._records: Dict[int, IndexedLead] = {}
+        self._keys: Dict[str, int] = {}
+        self._blocks: Dict[str, List[int]] = defaultdict(list)
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._memory_lock = threading.Lock()
+        self._write_lock = asyncio.Lock()
+        # High-water marks of what is in memory, and the reader's view of the database when they were taken
+        self._last_lead_id = 0
+        self._last_key_rowid = 0
+        self._data_version: Optional[int] = None
+
+    async def load(self):
+        await asyncio.to_thread(self._ensure_loaded)
+
+    async def find(self, lead: Lead) -> Optional[LeadMatch]:
+        (match,) = await self.find_many([lead])
+        return match
+
+    async def find_many(self, leads: List[Lead]) -> List[Optional[LeadMatch]]:
+        # Off the event loop: catching up with other workers' writes reads SQLite. One hop for a whole batch.
+        candidates = [indexed_lead(lead) for lead in leads]
+        return await asyncio.to_thread(self.lookup, candidates)
+
+    def lookup(self, candidates: List[IndexedLead]) -> List[Optional[LeadMatch]]:
+        self._ensure_loaded()
+        self._sync()
+        with self._memory_lock:
+            return [self._match(candidate) for candidate in candidates]
+
+    async def add(self, lead: Lead) -> Tuple[int, Optional[LeadMatch]]:
+        # Indexes a new lead, or folds it into the lead it duplicates; returns (lead_id, match)
+        await self.load()
+        candidate = indexed_lead(lead)
+        async with self._write_lock:
+            return await asyncio.to_thread(self._add, candidate)
+
+    def bulk_add(self, leads: Iterable[Lead]) -> int:
+        # Backfill (e.g. an export of leads already in the CRM): indexed as-is, without a duplicate check
+        self._ensure_loaded()
+        candidates = [indexed_lead(lead) for lead in leads]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._sync()
+                for candidate, lead_id in zip(candidates, self._write(candidates, True)):
+                    candidate.lead_id = lead_id
+                last_key_rowid = self._last_rowid()
+            self._written(candidates, last_key_rowid)
+        return len(candidates)
+
+    def _add(self, candidate: IndexedLead) -> Tuple[int, Optional[LeadMatch]]:
+        with self._lock:
+            with self._conn:
+                # Holding the database write lock while matching means two workers cannot both insert the
+                # same new person; whatever another worker committed before this is caught up on first
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._sync()
+                match = self._match(candidate)
+                if match is not None:
+                    candidate.lead_id = match.lead_id
+                    self._write([candidate], False)
+                else:
+                    (candidate.lead_id,) = self._write([candidate], True)
+                last_key_rowid = self._last_rowid()
+            self._written([candidate], last_key_rowid)
+        return candidate.lead_id, match
+
+    def _match(self, candidate: IndexedLead) -> Optional[LeadMatch]:
+        for kind, value in (("email", candidate.email), ("phone", candidate.phone)):
+            lead_id = self._keys.get(f"{kind}:{value}") if value else None
+            if lead_id is not None:
+                return LeadMatch(lead_id=lead_id, matched_on=kind, score=1.0)
+
+        best: Optional[LeadMatch] = None
+        seen = set()
+        # The candidate is the fixed side so difflib indexes its name once per lookup, not once per comparison
+        name_matcher = SequenceMatcher(None, autojunk=False)
+        name_matcher.set_seq2(candidate.name)
+        for key in blocking_keys(candidate.name, candidate.company):
+            block = self._blocks.get(key)
+            if not block:
+                continue
+            for lead_id in block[-LEAD_INDEX_MAX_CANDIDATES:]:
+                if lead_id in seen:
+                    continue
+                seen.add(lead_id)
+                score = similarity(candidate, self._records[lead_id], name_matcher)
+                if score >= LEAD_MATCH_THRESHOLD and (best is None or score > best.score):
+                    best = LeadMatch(lead_id=lead_id, matched_on="name_company", score=round(score, 3))
+        return best
+
+    def _remember(self, lead: IndexedLead):
+        existing = self._records.get(lead.lead_id)
+        if existing is None:
+            self._records[lead.lead_id] = lead
+            for key in blocking_keys(lead.name, lead.company):
+                self._blocks[key].append(lead.lead_id)
+        for key in lead_keys(lead):
+            self._keys.setdefault(key, lead.lead_id)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self._sync()
+            self._loaded = True
+
+    def _sync(self):
+        # Reads only what was committed since the last look, by this process's writer or another
+        # worker's; PRAGMA data_version tells in microseconds whether there is anything at all
+        with self._reader_lock:
+            version = self._reader.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            leads = self._reader.execute(
+                "SELECT lead_id, name, company FROM leads WHERE lead_id > ? ORDER BY lead_id", (self._last_lead_id,)
+            ).fetchall()
+            keys = self._reader.execute(
+                "SELECT rowid, key, lead_id FROM lead_keys WHERE rowid > ? ORDER BY rowid", (self._last_key_rowid,)
+            ).fetchall()
+            with self._memory_lock:
+                for lead_id, name, company in leads:
+                    self._remember(IndexedLead(lead_id, name, company, None, None))
+                for _, key, lead_id in keys:
+                    self._keys.setdefault(key, lead_id)
+            if leads:
+                self._last_lead_id = leads[-1][0]
+            if keys:
+                self._last_key_rowid = keys[-1][0]
+            self._data_version = version
+
+    def _last_rowid(self) -> int:
+        return self._conn.execute("SELECT coalesce(max(rowid), 0) FROM lead_keys").fetchone()[0]
+
+    def _written(self, leads: List[IndexedLead], last_key_rowid: int):
+        # Everything up to these rows was synced inside the same write transaction, so the high-water
+        # marks can move past them and the next sync does not read this process's own writes back
+        with self._reader_lock, self._memory_lock:
+            for lead in leads:
+                self._remember(lead)
+            self._last_lead_id = max(self._last_lead_id, *(lead.lead_id for lead in leads))
+            self._last_key_rowid = max(self._last_key_rowid, last_key_rowid)
+
+    def _write(self, leads: List[IndexedLead], insert: bool) -> List[int]:
+        # Runs inside the caller's transaction, with self._lock held
+        now = time.time()
+        lead_ids = []
+        for lead in leads:
+            if insert:
+                cursor = self._conn.execute(
+                    "INSERT INTO leads (name, company, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (lead.name, lead.company, now, now),
+                )
+                lead_ids.append(cursor.lastrowid)
+            else:
+                self._conn.execute("UPDATE leads SET updated_at = ? WHERE lead_id = ?", (now, lead.lead_id))
+                lead_ids.append(lead.lead_id)
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO lead_keys (key, lead_id) VALUES (?, ?)",
+            [(key, lead_id) for lead, lead_id in zip(leads, lead_ids) for key in lead_keys(lead)],
+        )
+        return lead_ids
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leads": len(self._records),
+            "keys": len(self._keys),
+            "blocks": len(self._blocks),
+            "largest_block": max((len(block) for block in self._blocks.values()), default=0),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        with self._reader_lock:
+            self._reader.close()
+
+def indexed_lead(lead: Lead) -> IndexedLead:
+    return IndexedLead(
+        lead_id=0,
+        name=normalize_name(lead.name),
+        company=normalize_company(lead.company),
+        email=normalize_email(lead.email),
+        phone=normalize_phone(lead.phone),
+    )
+
+def lead_keys(lead: IndexedLead) -> List[str]:
+    keys = []
+    if lead.email:
+        keys.append(f"email:{lead.email}")
+    if lead.phone:
+        keys.append(f"phone:{lead.phone}")
+    return keys
+
+def blocking_keys(name: str, company: str) -> List[str]:
+    # Only leads sharing one of these keys are compared. Between them every key pair leaves out a
+    # different part of the name, so a single misread character still leaves one key intact.
+    tokens = name.split()
+    if not tokens or not company:
+        return []
+    company_token = company.split(" ", 1)[0]
+    last = tokens[-1]
+    keys = [f"{last[:4]}|{company_token}"]
+    if len(tokens) > 1:
+        first = tokens[0][:4]
+        keys.append(f"{first}~{last[:2]}|{company_token}")
+        keys.append(f"{first}~{last[-2:]}|{company_token}")
+    return list(dict.fromkeys(keys))
+
+def similarity(a: IndexedLead, b: IndexedLead, name_matcher: Optional[SequenceMatcher] = None) -> float:
+    if name_matcher is None:
+        name_matcher = SequenceMatcher(None, autojunk=False)
+        name_matcher.set_seq2(a.name)
+    name_matcher.set_seq1(b.name)
+    if not (a.company and b.company):
+        return 0.0
+    # real_quick_ratio and quick_ratio are cheap upper bounds; most of a block is rejected before the full ratio
+    if NAME_WEIGHT * name_matcher.real_quick_ratio() + COMPANY_WEIGHT < LEAD_MATCH_THRESHOLD:
+        return 0.0
+    if NAME_WEIGHT * name_matcher.quick_ratio() + COMPANY_WEIGHT < LEAD_MATCH_THRESHOLD:
+        return 0.0
+    name_score = name_matcher.ratio()
+    if NAME_WEIGHT * name_score + COMPANY_WEIGHT < LEAD_MATCH_THRESHOLD:
+        return 0.0
+    company_score = 1.0 if a.company == b.company else SequenceMatcher(None, a.company, b.company).ratio()
+    return NAME_WEIGHT * name_score + COMPANY_WEIGHT * company_score
+
+lead_index = LeadIndex(LEAD_INDEX_PATH)
@@ -0,0 +1,382 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from config import (
+    CRM_DEDUP_MODE,
+    LEAD_OUTBOX_PATH,
+    OUTBOX_SYNC_CRM,
+    OUTBOX_SYNC_TENANT,
+    OUTBOX_SYNC_BATCH_SIZE,
+    OUTBOX_SYNC_INTERVAL,
+    OUTBOX_SYNC_MAX_ATTEMPTS,
+    OUTBOX_SYNC_MAX_DELAY,
+    OUTBOX_SYNC_LEASE_SECONDS,
+)
+from models.lead import Lead
+from services.crm_integration import send_leads_to_crm
+from services.lead_index import indexed_lead, lead_index, lead_keys
+from services.telemetry import span
+from services.token_store import token_store
+
+logger = logging.getLogger(__name__)
+
+# Rows read per query when streaming an export
+EXPORT_PAGE_SIZE = 500
+
+@dataclass
+class OutboxEntry:
+    cursor: int
+    lead: Lead
+    # The previous attempt was cut off (the worker died mid-push), so the CRM may already have this lead
+    uncertain: bool
+
+class LeadOutbox:
+    # Append-only log of scanned leads. The cursor is the row's AUTOINCREMENT key, so it only ever grows
+    # and is never reused. Each consumer (CRM and tenant) keeps a checkpoint: every lead at or below it
+    # is settled, i.e. sent or set aside as failed. Leads above it have a delivery row once attempted.
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lead_outbox ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, lead TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox_consumers ("
+                "consumer TEXT PRIMARY KEY, checkpoint INTEGER NOT NULL DEFAULT 0, "
+                "lease_owner TEXT, lease_until REAL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox_deliveries ("
+                "consumer TEXT NOT NULL, seq INTEGER NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, "
+                "crm_id TEXT, error TEXT, next_attempt_at REAL, updated_at REAL NOT NULL, PRIMARY KEY (consumer, seq))"
+            )
+
+    async def append(self, lead: Lead) -> int:
+        return await asyncio.to_thread(self._append, lead.json())
+
+    async def last_cursor(self, since: int = 0, limit: Optional[int] = None) -> int:
+        # The cursor of the `limit`-th lead after `since` (or of the newest one), `since` if there are none
+        return await asyncio.to_thread(self._last_cursor, since, limit)
+
+    async def export(self, since: int, until: int) -> AsyncIterator[Tuple[int, float, Dict[str, Any]]]:
+        # (cursor, created_at, lead) for since < cursor <= until, a page at a time
+        while since < until:
+            rows = await asyncio.to_thread(self._read, since, until)
+            if not rows:
+                return
+            for seq, created_at, lead in rows:
+                yield seq, created_at, json.loads(lead)
+            since = rows[-1][0]
+
+    async def claim(self, consumer: str, owner: str, limit: int) -> Optional[List[OutboxEntry]]:
+        # None when another worker holds the consumer's lease
+        return await asyncio.to_thread(self._claim, consumer, owner, limit)
+
+    async def renew(self, consumer: str, owner: str) -> bool:
+        # False once another worker has taken the lease over
+        return await asyncio.to_thread(self._renew, consumer, owner)
+
+    async def settle(self, consumer: str, owner: str, outcomes: List[Tuple[int, Dict[str, Any]]], outage_delay: float = 0) -> bool:
+        # Leads that failed because the CRM was unavailable are retried after `outage_delay` without using up an attempt.
+        # False (and nothing recorded) when the lease was lost: the worker that took it over owns these leads now.
+        return await asyncio.to_thread(self._settle, consumer, owner, outcomes, outage_delay)
+
+    async def stats(self, consumer: Optional[str] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._stats, consumer)
+
+    def _append(self, lead: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO lead_outbox (lead, created_at) VALUES (?, ?)", (lead, time.time()))
+        return cursor.lastrowid
+
+    def _last_cursor(self, since: int, limit: Optional[int]) -> int:
+        with self._lock:
+            (last,) = self._conn.execute(
+                "SELECT max(seq) FROM (SELECT seq FROM lead_outbox WHERE seq > ? ORDER BY seq LIMIT ?)",
+                (since, limit if limit is not None else -1),
+            ).fetchone()
+        return last if last is not None else since
+
+    def _read(self, since: int, until: int) -> List[Tuple[int, float, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, created_at, lead FROM lead_outbox WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+                (since, until, EXPORT_PAGE_SIZE),
+            ).fetchall()
+
+    def _claim(self, consumer: str, owner: str, limit: int) -> Optional[List[OutboxEntry]]:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE serializes this against other workers; only the lease holder gets a batch
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO outbox_consumers (consumer, updated_at) VALUES (?, ?)", (consumer, now)
+                )
+                cursor = self._conn.execute(
+                    "UPDATE outbox_consumers SET lease_owner = ?, lease_until = ? "
+                    "WHERE consumer = ? AND (lease_owner = ? OR lease_owner IS NULL OR lease_until < ?)",
+                    (owner, now + OUTBOX_SYNC_LEASE_SECONDS, consumer, owner, now),
+                )
+                if cursor.rowcount == 0:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                rows = self._conn.execute(
+                    "SELECT o.seq, o.lead, d.status FROM lead_outbox o "
+                    "LEFT JOIN outbox_deliveries d ON d.consumer = ? AND d.seq = o.seq "
+                    "WHERE o.seq > (SELECT checkpoint FROM outbox_consumers WHERE consumer = ?) "
+                    "AND (d.status IS NULL OR d.status = 'sending' OR (d.status = 'retrying' AND d.next_attempt_at <= ?)) "
+                    "ORDER BY o.seq LIMIT ?",
+                    (consumer, consumer, now, limit),
+                ).fetchall()
+                # Marked before the push: a lead still "sending" on the next claim was cut off mid-push
+                self._conn.executemany(
+                    "INSERT INTO outbox_deliveries (consumer, seq, status, attempts, updated_at) VALUES (?, ?, 'sending', 1, ?) "
+                    "ON CONFLICT (consumer, seq) DO UPDATE SET status = 'sending', attempts = attempts + 1, updated_at = excluded.updated_at",
+                    [(consumer, seq, now) for seq, _, _ in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [OutboxEntry(cursor=seq, lead=Lead.parse_raw(lead), uncertain=status == "sending") for seq, lead, status in rows]
+
+    def _renew(self, consumer: str, owner: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE outbox_consumers SET lease_until = ? WHERE consumer = ? AND lease_owner = ?",
+                (time.time() + OUTBOX_SYNC_LEASE_SECONDS, consumer, owner),
+            )
+        return cursor.rowcount > 0
+
+    def _settle(self, consumer: str, owner: str, outcomes: List[Tuple[int, Dict[str, Any]]], outage_delay: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A lease that merely ran out is still this worker's until someone else claims it
+                (lease_owner,) = self._conn.execute(
+                    "SELECT lease_owner FROM outbox_consumers WHERE consumer = ?", (consumer,)
+                ).fetchone()
+                if lease_owner != owner:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                for seq, result in outcomes:
+                    if result.get("status") == "success":
+                        self._conn.execute(
+                            "UPDATE outbox_deliveries SET status = 'sent', crm_id = ?, error = NULL, updated_at = ? WHERE consumer = ? AND seq = ?",
+                            (str(result["id"]) if result.get("id") is not None else None, now, consumer, seq),
+                        )
+                        continue
+                    if result.get("outage"):
+                        # Says nothing about the lead: the attempt taken by the claim is given back
+                        self._conn.execute(
+                            "UPDATE outbox_deliveries SET status = 'retrying', attempts = attempts - 1, error = ?, next_attempt_at = ?, "
+                            "updated_at = ? WHERE consumer = ? AND seq = ?",
+                            (result.get("message") or "CRM unavailable", now + outage_delay, now, consumer, seq),
+                        )
+                        continue
+                    (attempts,) = self._conn.execute(
+                        "SELECT attempts FROM outbox_deliveries WHERE consumer = ? AND seq = ?", (consumer, seq)
+                    ).fetchone()
+                    status = "failed" if attempts >= OUTBOX_SYNC_MAX_ATTEMPTS else "retrying"
+                    self._conn.execute(
+                        "UPDATE outbox_deliveries SET status = ?, error = ?, next_attempt_at = ?, updated_at = ? WHERE consumer = ? AND seq = ?",
+                        (status, result.get("message") or "Unknown error", now + retry_delay(attempts), now, consumer, seq),
+                    )
+
+                # The checkpoint moves up to just below the first lead that is not settled yet
+                (checkpoint,) = self._conn.execute(
+                    "SELECT checkpoint FROM outbox_consumers WHERE consumer = ?", (consumer,)
+                ).fetchone()
+                (pending,) = self._conn.execute(
+                    "SELECT min(o.seq) FROM lead_outbox o LEFT JOIN outbox_deliveries d ON d.consumer = ? AND d.seq = o.seq "
+                    "WHERE o.seq > ? AND (d.status IS NULL OR d.status NOT IN ('sent', 'failed'))",
+                    (consumer, checkpoint),
+                ).fetchone()
+                if pending is None:
+                    (pending,) = self._conn.execute("SELECT coalesce(max(seq), 0) + 1 FROM lead_outbox").fetchone()
+                checkpoint = max(checkpoint, pending - 1)
+                self._conn.execute(
+                    "UPDATE outbox_consumers SET checkpoint = ?, updated_at = ?, "
+                    "lease_until = CASE WHEN lease_owner = ? THEN ? ELSE lease_until END WHERE consumer = ?",
+                    (checkpoint, now, owner, now + OUTBOX_SYNC_LEASE_SECONDS, consumer),
+                )
+                # Sent leads behind the checkpoint need no bookkeeping; failed ones stay for inspection
+                self._conn.execute(
+                    "DELETE FROM outbox_deliveries WHERE consumer = ? AND seq <= ? AND status = 'sent'", (consumer, checkpoint)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def _stats(self, consumer: Optional[str]) -> Dict[str, Any]:
+        with self._lock:
+            (entries, last) = self._conn.execute("SELECT count(*), coalesce(max(seq), 0) FROM lead_outbox").fetchone()
+            stats: Dict[str, Any] = {"entries": entries, "last_cursor": last}
+            if consumer is None:
+                return stats
+            row = self._conn.execute(
+                "SELECT checkpoint, lease_owner, lease_until FROM outbox_consumers WHERE consumer = ?", (consumer,)
+            ).fetchone()
+            checkpoint = row[0] if row else 0
+            counts = dict(self._conn.execute(
+                "SELECT status, count(*) FROM outbox_deliveries WHERE consumer = ? AND (seq > ? OR status = 'failed') GROUP BY status",
+                (consumer, checkpoint),
+            ).fetchall())
+            (pending,) = self._conn.execute("SELECT count(*) FROM lead_outbox WHERE seq > ?", (checkpoint,)).fetchone()
+        stats.update(
+            consumer=consumer,
+            checkpoint=checkpoint,
+            # Leads above the checkpoint, including ones already sent out of order behind a retrying lead
+            lag=pending,
+            sending=counts.get("sending", 0),
+            retrying=counts.get("retrying", 0),
+            failed=counts.get("failed", 0),
+            lease_held=bool(row and row[1] and row[2] and row[2] >= time.time()),
+        )
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class OutboxSync:
+    # Drains the outbox to one CRM, in cursor order and in batches. A lead is pushed at least once;
+    # a push whose outcome is unknown is repeated as an upsert, so the CRM still ends up with one record.
+    def __init__(self, outbox: LeadOutbox, crm_name: Optional[str], tenant_id: str):
+        self.outbox = outbox
+        self.crm_name = crm_name
+        self.tenant_id = tenant_id
+        self.consumer = f"{crm_name}:{tenant_id}"
+        self.owner = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        # Consecutive batches that found the CRM unavailable
+        self._outages = 0
+
+    def start(self):
+        if self.crm_name is not None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stats(self) -> Dict[str, Any]:
+        stats = await self.outbox.stats(self.consumer if self.crm_name is not None else None)
+        stats["sync_enabled"] = self.crm_name is not None
+        return stats
+
+    async def _run(self):
+        while True:
+            try:
+                synced = await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Outbox sync to %s failed: %s", self.crm_name, e)
+                synced = 0
+            if self._outages:
+                # New scans do not wake the sync while the CRM is down; it has to be given time to recover
+                await asyncio.sleep(retry_delay(self._outages))
+            elif synced < OUTBOX_SYNC_BATCH_SIZE:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_SYNC_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def sync_once(self) -> int:
+        credentials = await token_store.get(self.tenant_id, self.crm_name)
+        if credentials is None:
+            logger.debug("Outbox sync to %s waits for the tenant to connect the CRM", self.crm_name)
+            return 0
+        entries = await self.outbox.claim(self.consumer, self.owner, OUTBOX_SYNC_BATCH_SIZE)
+        if not entries:
+            return 0
+
+        # Rescans and retries put the same card in the outbox more than once. Within a batch only its first
+        # scan is pushed and the repeats share that result, so the CRM still gets a single record.
+        leads: List[Lead] = []
+        uncertain: List[bool] = []
+        pushed_as: List[int] = []
+        seen: Dict[str, int] = {}
+        for entry in entries:
+            keys = batch_keys(entry.lead)
+            position = next((seen[key] for key in keys if key in seen), None)
+            if position is None:
+                position = len(leads)
+                leads.append(entry.lead)
+                uncertain.append(False)
+            for key in keys:
+                seen.setdefault(key, position)
+            uncertain[position] = uncertain[position] or entry.uncertain
+            pushed_as.append(position)
+
+        duplicates = await lead_index.find_many(leads)
+        upsert = [flag or (match is not None and CRM_DEDUP_MODE == "upsert") for flag, match in zip(uncertain, duplicates)]
+        # A push can outlast the lease (a slow CRM, many upserts); it is renewed meanwhile so no other worker
+        # takes the same leads over and pushes them a second time
+        heartbeat = asyncio.ensure_future(self._keep_lease())
+        try:
+            with span("outbox_sync"):
+                results = await send_leads_to_crm(self.crm_name, leads, credentials, upsert=upsert)
+        finally:
+            heartbeat.cancel()
+        for lead, result in zip(leads, results):
+            if result.get("status") == "success":
+                await lead_index.add(lead)
+        self._outages = self._outages + 1 if any(result.get("outage") for result in results) else 0
+        settled = await self.outbox.settle(
+            self.consumer,
+            self.owner,
+            [(entry.cursor, results[position]) for entry, position in zip(entries, pushed_as)],
+            outage_delay=retry_delay(max(self._outages, 1)),
+        )
+        if not settled:
+            logger.warning("Outbox sync to %s lost its lease during a push; %d results were dropped", self.crm_name, len(entries))
+            return 0
+        return len(entries)
+
+    async def _keep_lease(self):
+        while True:
+            await asyncio.sleep(OUTBOX_SYNC_LEASE_SECONDS / 3)
+            if not await self.outbox.renew(self.consumer, self.owner):
+                return
+
+def batch_keys(lead: Lead) -> List[str]:
+    # Exact keys only: a fuzzy match against the index already turns a lead into an upsert
+    indexed = indexed_lead(lead)
+    keys = lead_keys(indexed)
+    if not keys and indexed.name and indexed.company:
+        keys.append(f"name:{indexed.name}|{indexed.company}")
+    return keys
+
+def retry_delay(attempt: int) -> float:
+    return min(OUTBOX_SYNC_MAX_DELAY, OUTBOX_SYNC_INTERVAL * 2 ** (attempt - 1))
+
+lead_outbox = LeadOutbox(LEAD_OUTBOX_PATH)
+outbox_sync = OutboxSync(lead_outbox, OUTBOX_SYNC_CRM, OUTBOX_SYNC_TENANT)
@@ -0,0 +1,181 @@
+import asyncio
+import io
+import statistics
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Tuple
+from PIL import Image, ImageOps
+from config import LOCAL_OCR_LANGUAGE, LOCAL_OCR_MIN_CONFIDENCE, LOCAL_OCR_REQUIRED_FIELDS
+from utils.normalization import (
+    COMPANY_SUFFIXES,
+    EMAIL_PATTERN,
+    LINKEDIN_PATTERN,
+    PHONE_PATTERN,
+    URL_PATTERN,
+    normalize_text,
+)
+
+try:
+    import pytesseract
+except ImportError:  # Local OCR is optional; without it every card goes to the model
+    pytesseract = None
+
+# Tesseract is tuned for roughly 300 dpi text; a card this wide gets there
+OCR_MIN_WIDTH = 1600
+ADDRESS_WORDS = {
+    "street", "st", "avenue", "ave", "road", "rd", "boulevard", "blvd", "suite", "ste", "floor", "fl",
+    "drive", "dr", "lane", "ln", "way", "plaza", "strasse", "str", "rue", "via", "po", "box",
+}
+TITLE_WORDS = {
+    "ceo", "cto", "cfo", "coo", "founder", "president", "director", "manager", "head", "lead", "engineer",
+    "developer", "consultant", "officer", "vp", "partner", "analyst", "designer", "architect", "sales",
+    "marketing", "account", "executive", "specialist", "associate", "owner", "principal",
+}
+# A cross-check that failed (e.g. no part of the name in the email address) scales confidence by this
+UNCONFIRMED_PENALTY = 0.9
+
+@dataclass
+class OCRLine:
+    text: str
+    confidence: float
+    height: float
+
+@dataclass
+class LocalOCRResult:
+    fields: Dict[str, str]
+    confidence: float
+    missing: List[str]
+
+    @property
+    def accepted(self) -> bool:
+        return not self.missing and self.confidence >= LOCAL_OCR_MIN_CONFIDENCE
+
+@dataclass
+class LocalOCRStats:
+    attempted: int = 0
+    accepted: int = 0
+    escalated: int = 0
+    failed: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        stats["avoided_model_ratio"] = round(self.accepted / self.attempted, 4) if self.attempted else 0.0
+        return stats
+
+_available = False
+
+def local_ocr_available() -> bool:
+    # Set once at startup by detect_local_ocr; until then every card goes to the model
+    return _available
+
+async def detect_local_ocr() -> bool:
+    # Finding tesseract runs its binary, so it happens once and off the event loop
+    global _available
+    _available = await asyncio.to_thread(find_tesseract)
+    return _available
+
+def find_tesseract() -> bool:
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return False
+    return True
+
+def read_card(image_content: bytes, language: str = LOCAL_OCR_LANGUAGE) -> LocalOCRResult:
+    # CPU-bound (tesseract itself runs as a child process); called on the preprocessing executor
+    with Image.open(io.BytesIO(image_content)) as image:
+        image = ImageOps.autocontrast(ImageOps.grayscale(image))
+        if image.width < OCR_MIN_WIDTH:
+            image = image.resize((OCR_MIN_WIDTH, round(image.height * OCR_MIN_WIDTH / image.width)), Image.LANCZOS)
+        data = pytesseract.image_to_data(image, lang=language, output_type=pytesseract.Output.DICT)
+    return parse_ocr_data(data)
+
+def ocr_lines(data: Dict[str, List[Any]]) -> List[OCRLine]:
+    grouped: Dict[Tuple[int, int, int], List[int]] = {}
+    for index, text in enumerate(data["text"]):
+        # Tesseract reports -1 for layout rows that carry no word
+        if text.strip() and float(data["conf"][index]) >= 0:
+            key = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+            grouped.setdefault(key, []).append(index)
+
+    lines = []
+    for indexes in grouped.values():
+        lines.append(OCRLine(
+            text=" ".join(data["text"][index].strip() for index in indexes),
+            confidence=statistics.fmean(float(data["conf"][index]) for index in indexes) / 100,
+            height=statistics.median(data["height"][index] for index in indexes),
+        ))
+    return lines
+
+def parse_ocr_data(data: Dict[str, List[Any]]) -> LocalOCRResult:
+    lines = ocr_lines(data)
+    fields: Dict[str, str] = {}
+    sources: Dict[str, OCRLine] = {}
+    text_lines: List[OCRLine] = []
+
+    def claim(field: str, value: str, line: OCRLine):
+        if field not in fields:
+            fields[field] = value.rstrip(".,;")
+            sources[field] = line
+
+    for line in lines:
+        email = EMAIL_PATTERN.search(line.text)
+        linkedin = LINKEDIN_PATTERN.search(line.text)
+        phone = PHONE_PATTERN.search(line.text)
+        if email:
+            claim("email", email.group(0), line)
+        elif linkedin:
+            claim("linkedin_profile", linkedin.group(0), line)
+        elif phone and sum(char.isdigit() for char in phone.group(0)) >= 7 and not is_address(line.text):
+            claim("phone", phone.group(0), line)
+        elif URL_PATTERN.fullmatch(line.text.split()[-1]) and len(line.text.split()) <= 2:
+            claim("website", line.text.split()[-1], line)
+        else:
+            text_lines.append(line)
+
+    address = [line for line in text_lines if is_address(line.text)]
+    if address:
+        claim("address", ", ".join(line.text for line in address), address[0])
+    text_lines = [line for line in text_lines if line not in address]
+
+    email_domain = fields.get("email", "").rpartition("@")[2].split(".")[0].lower()
+    for line in text_lines:
+        words = normalize_text(line.text).split()
+        if words and (words[-1] in COMPANY_SUFFIXES or (email_domain and email_domain in "".join(words))):
+            claim("company", line.text, line)
+            break
+
+    # The name is usually the largest text on the card: two to four words, letters only
+    names = [
+        line for line in text_lines
+        if line is not sources.get("company") and looks_like_name(line.text)
+        and not set(normalize_text(line.text).split()) & TITLE_WORDS
+    ]
+    if names:
+        name_line = max(names, key=lambda line: line.height)
+        claim("name", name_line.text, name_line)
+        following = text_lines.index(name_line) + 1
+        if following < len(text_lines) and text_lines[following] is not sources.get("company"):
+            claim("job_title", text_lines[following].text, text_lines[following])
+    for line in text_lines:
+        if "job_title" in fields:
+            break
+        if line is not sources.get("name") and set(normalize_text(line.text).split()) & TITLE_WORDS:
+            claim("job_title", line.text, line)
+
+    confidence = statistics.fmean(line.confidence for line in sources.values()) if sources else 0.0
+    if "name" in fields and "email" in fields:
+        local_part = fields["email"].split("@")[0].lower()
+        if not any(len(token) > 1 and token in local_part for token in normalize_text(fields["name"]).split()):
+            confidence *= UNCONFIRMED_PENALTY
+    missing = [field for field in LOCAL_OCR_REQUIRED_FIELDS if field not in fields]
+    return LocalOCRResult(fields=fields, confidence=round(confidence, 4), missing=missing)
+
+def is_address(text: str) -> bool:
+    words = set(normalize_text(text).split())
+    return any(char.isdigit() for char in text) and bool(words & ADDRESS_WORDS)
+
+def looks_like_name(text: str) -> bool:
+    words = text.split()
+    return 2 <= len(words) <= 4 and all(word.replace(".", "").replace("-", "").replace("'", "").isalpha() for word in words)
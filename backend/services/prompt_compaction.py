@@ -0,0 +1,171 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from config import SUMMARY_PROMPT_TOKEN_BUDGET, SUMMARY_MAX_SEARCH_RESULTS
+from utils.normalization import normalize_text
+
+try:
+    import tiktoken
+except ImportError:  # Optional; without it token counts are estimated from the text length
+    tiktoken = None
+
+# Below this many tokens of room left, a further item is dropped rather than cut down to a stub
+MIN_TRUNCATED_TOKENS = 24
+# A sentence this long that reappears inside a longer one is a repeat; shorter ones ("CEO", "Acme Inc")
+# are only repeats when they match a whole sentence
+MIN_CONTAINED_REPEAT_WORDS = 6
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+# Citation markers ("[3]"), emphasis and table pipes; list bullets and numbering at the start of a line
+MARKDOWN_NOISE = re.compile(r"\[\d+\]|[*`|]{1,3}(?=\S)|(?<=\S)[*`|]{1,3}")
+BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([.,;:!?])")
+
+@dataclass
+class CompactedData:
+    text: str
+    tokens: int
+    dropped_items: int
+
+# Each compactor turns one source's payload into short text items, most important first
+COMPACTORS: Dict[str, Callable[[Dict[str, Any]], List[Tuple[str, str]]]] = {}
+
+def register_compactor(source_key: str):
+    def decorator(compact: Callable[[Dict[str, Any]], List[Tuple[str, str]]]):
+        COMPACTORS[source_key] = compact
+        return compact
+    return decorator
+
+_encoding = None
+
+def estimate_tokens(text: str) -> int:
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    # About four characters per token for English prose; JSON punctuation and whitespace run denser
+    return math.ceil(len(text) / 4) + text.count("\n") + text.count('"') // 2
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    if estimate_tokens(text) <= tokens:
+        return text
+    # Cut at a word boundary, then shrink until the estimate fits
+    cut = text[: tokens * 4].rsplit(" ", 1)[0]
+    while cut and estimate_tokens(cut + " …") > tokens:
+        cut = cut[: int(len(cut) * 0.9)].rsplit(" ", 1)[0]
+    return f"{cut} …" if cut else ""
+
+def compact_public_data(source_data: Dict[str, Any], token_budget: int = SUMMARY_PROMPT_TOKEN_BUDGET) -> CompactedData:
+    items: Dict[str, List[str]] = {}
+    seen: List[str] = []
+    seen_exact = set()
+    for key, data in source_data.items():
+        # Error payloads and empty sources tell the model nothing about the person
+        if not data or (isinstance(data, dict) and "error" in data):
+            continue
+        compact = COMPACTORS.get(key, compact_generic)
+        kept = []
+        for label, text in compact(data):
+            # Search snippets and the research report often repeat the same sentence, sometimes
+            # inside a longer one; the first occurrence is kept
+            sentences = []
+            for sentence in split_sentences(text):
+                normalized = normalize_text(sentence)
+                if not normalized or is_repeat(normalized, seen_exact, seen):
+                    continue
+                seen_exact.add(normalized)
+                # Padded so containment only matches whole words
+                seen.append(f" {normalized} ")
+                sentences.append(sentence)
+            if sentences:
+                kept.append(f"{label}: {' '.join(sentences)}" if label else " ".join(sentences))
+        if kept:
+            items[key] = kept
+
+    # Sources take turns, so a long report cannot crowd the search results out of the budget
+    selected: Dict[str, List[str]] = {key: [] for key in items}
+    remaining = token_budget
+    dropped = 0
+    for rank in range(max((len(values) for values in items.values()), default=0)):
+        for key, values in items.items():
+            if rank >= len(values):
+                continue
+            line = f"- {values[rank]}"
+            tokens = estimate_tokens(line) + 1
+            if tokens <= remaining:
+                selected[key].append(line)
+                remaining -= tokens
+            elif remaining >= MIN_TRUNCATED_TOKENS:
+                selected[key].append(truncate_to_tokens(line, remaining - 1))
+                remaining = 0
+            else:
+                dropped += 1
+
+    sections = [f"{source_label(key)}:\n" + "\n".join(lines) for key, lines in selected.items() if lines]
+    text = "\n\n".join(sections)
+    return CompactedData(text=text, tokens=estimate_tokens(text), dropped_items=dropped)
+
+# Compactors return (label, text) items; only the text is checked for repeats
+@register_compactor("serper_data")
+def compact_serper(data: Dict[str, Any]) -> List[Tuple[str, str]]:
+    # searchParameters, peopleAlsoAsk, relatedSearches, sitelinks and credits are left out
+    items = []
+    graph = data.get("knowledgeGraph") or {}
+    if graph:
+        attributes = ". ".join(f"{name}: {value}" for name, value in (graph.get("attributes") or {}).items())
+        text = " ".join(clean_text(part) for part in (graph.get("description"), attributes) if part)
+        items.append((clean_text(", ".join(str(graph[field]) for field in ("title", "type") if graph.get(field))), text))
+    answer = data.get("answerBox") or {}
+    if answer.get("answer") or answer.get("snippet"):
+        items.append((clean_text(answer.get("title")), clean_text(answer.get("answer") or answer["snippet"])))
+    for result in (data.get("organic") or [])[:SUMMARY_MAX_SEARCH_RESULTS]:
+        host = urlsplit(result.get("link") or "").netloc.removeprefix("www.")
+        title = clean_text(result.get("title"))
+        items.append((f"{title} ({host})" if host else title, clean_text(result.get("snippet"))))
+    return items
+
+@register_compactor("perplexity_data")
+def compact_perplexity(data: Dict[str, Any]) -> List[Tuple[str, str]]:
+    # The report is markdown (or JSON when the model chose to answer that way); one item per line
+    items = []
+    for name, value in data.items():
+        if isinstance(value, str):
+            lines = [line for line in value.splitlines() if not line.lstrip().startswith("#")]
+            items.extend(("", clean_text(line)) for line in lines if len(line.split()) > 2)
+        elif name not in ("name", "email"):
+            items.extend(compact_generic(value, name))
+    return items
+
+def compact_generic(data: Any, name: str = "") -> List[Tuple[str, str]]:
+    # Flattens nested data into ("field name", value) items for sources without a compactor of their own
+    if isinstance(data, dict):
+        return [item for key, value in data.items() for item in compact_generic(value, key)]
+    label = name.replace("_", " ")
+    if isinstance(data, list):
+        scalars = [clean_text(str(value)) for value in data if not isinstance(value, (dict, list))]
+        nested = [item for value in data if isinstance(value, (dict, list)) for item in compact_generic(value, name)]
+        return ([(label, "; ".join(scalars))] if scalars else []) + nested
+    text = clean_text(str(data))
+    return [(label, text)] if text else []
+
+def is_repeat(normalized: str, seen_exact: Set[str], seen: List[str]) -> bool:
+    if normalized in seen_exact:
+        return True
+    if len(normalized.split()) < MIN_CONTAINED_REPEAT_WORDS:
+        return False
+    padded = f" {normalized} "
+    return any(padded in other for other in seen)
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+def clean_text(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    text = " ".join(MARKDOWN_NOISE.sub(" ", BULLET.sub("", text)).split())
+    return SPACE_BEFORE_PUNCTUATION.sub(r"\1", text)
+
+def source_label(key: str) -> str:
+    return key.removesuffix("_data").capitalize()
@@ -1,52 +1,155 @@
 import aiohttp
 import asyncio
-from typing import Optional, Dict, Any
-from config import SERPER_API_KEY, PERPLEXITY_API_KEY, OPENAI_API_KEY
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, AsyncIterator, Awaitable, Callable, Tuple
+from urllib.parse import urlsplit
+from config import (
+    OPENAI_API_KEY,
+    PERPLEXITY_API_KEY,
+    SERPER_API_KEY,
+    SERPER_URL,
+    SERPER_TIMEOUT,
+    PERPLEXITY_TIMEOUT,
+    ENRICHMENT_CACHE_BACKEND,
+    ENRICHMENT_CACHE_PATH,
+    ENRICHMENT_CACHE_MAX_ENTRIES,
+    ENRICHMENT_CACHE_STALE_TTL,
+    SERPER_CACHE_TTL,
+    PERPLEXITY_CACHE_TTL,
+    SUMMARY_CACHE_TTL,
+)
 import json
-from openai import AsyncOpenAI
+from services.cache import StaleWhileRevalidateCache, create_cache
+from services.http_clients import clients
+from services.prompt_compaction import compact_public_data
+from services.rate_limit import ProviderUnavailable, raise_for_throttling, rate_limits
+from services.telemetry import record_usage, span
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = "gpt-4o"
+
+enrichment_cache = StaleWhileRevalidateCache(
+    create_cache(
+        ENRICHMENT_CACHE_BACKEND,
+        path=ENRICHMENT_CACHE_PATH,
+        table="enrichment",
+        max_entries=ENRICHMENT_CACHE_MAX_ENTRIES,
+        ttl=max(SERPER_CACHE_TTL, PERPLEXITY_CACHE_TTL, SUMMARY_CACHE_TTL) + ENRICHMENT_CACHE_STALE_TTL,
+    ),
+    stale_ttl=ENRICHMENT_CACHE_STALE_TTL,
+)
+
+@dataclass
+class EnrichmentSource:
+    key: str
+    fetch: Callable[[str], Awaitable[Dict[str, Any]]]
+    timeout: float
+    cache_ttl: float
+    identifier: str = "email"
+
+ENRICHMENT_SOURCES: Dict[str, EnrichmentSource] = {}
+
+def register_enrichment_source(key: str, timeout: float, cache_ttl: float, identifier: str = "email"):
+    # `identifier` names the lookup value the source is called with: "email" or "linkedin_profile".
+    def decorator(fetch: Callable[[str], Awaitable[Dict[str, Any]]]):
+        ENRICHMENT_SOURCES[key] = EnrichmentSource(
+            key=key, fetch=fetch, timeout=timeout, cache_ttl=cache_ttl, identifier=identifier
+        )
+        return fetch
+    return decorator
+
+def normalize_identifier(identifier: str, value: str) -> str:
+    value = value.strip().lower()
+    if identifier == "linkedin_profile":
+        parts = urlsplit(value if "://" in value else f"https://{value}")
+        host = parts.netloc.removeprefix("www.")
+        return f"{host}{parts.path.rstrip('/')}"
+    return value
+
+async def gather_public_data(
+    email: Optional[str], linkedin_profile: Optional[str], summarize: bool = True
+) -> Dict[str, Any]:
+    public_data: Dict[str, Any] = {key: {} for key in ENRICHMENT_SOURCES}
+    public_data["combined_summary"] = ""
+    public_data["source_status"] = {}
+
+    identifiers = {"email": email, "linkedin_profile": linkedin_profile}
+    sources = [source for source in ENRICHMENT_SOURCES.values() if identifiers.get(source.identifier)]
+
+    if sources:
+        # Fan out to every source at once; each one is bounded by its own deadline
+        results = await asyncio.gather(
+            *(run_enrichment_source(source, identifiers[source.identifier]) for source in sources)
+        )
+        for source, (status, data) in zip(sources, results):
+            public_data[source.key] = data
+            public_data["source_status"][source.key] = status
+
+        # Generate summary from whatever sources answered in time; streaming callers do it themselves
+        if summarize:
+            public_data["combined_summary"] = await summarize_public_data(public_data)
 
-async def gather_public_data(email: Optional[str], linkedin_profile: Optional[str]) -> Dict[str, Any]:
-    public_data = {
-        "serper_data": {},
-        "perplexity_data": {},
-        "combined_summary": "",
-    }
-    
-    if email:
-        serper_data = await search_email_data(email)
-        perplexity_data = await search_perplexity_data(email)
-        
-        # Ensure we handle cases where `search_email_data` might return an error or empty response
-        public_data["serper_data"] = serper_data if isinstance(serper_data, dict) else {}
-        public_data["perplexity_data"] = perplexity_data if isinstance(perplexity_data, dict) else {}
-        
-        # Generate summary if we have data
-        public_data["combined_summary"] = await summarize_public_data(public_data)
-    
     return public_data
 
+async def run_enrichment_source(source: EnrichmentSource, value: str) -> Tuple[str, Dict[str, Any]]:
+    cache_key = f"{source.key}:{normalize_identifier(source.identifier, value)}"
+    try:
+        # Concurrent lookups for the same contact share one upstream call, which keeps running
+        # (and fills the cache) even if this request's deadline passes first
+        with span(f"enrich.{source.key}"):
+            data = await asyncio.wait_for(
+                enrichment_cache.get_or_load(
+                    cache_key,
+                    lambda: source.fetch(value),
+                    ttl=source.cache_ttl,
+                    should_cache=lambda result: isinstance(result, dict) and "error" not in result,
+                ),
+                timeout=source.timeout,
+            )
+    except asyncio.TimeoutError:
+        return "timed_out", {}
+    except Exception as e:
+        return "error", {"error": str(e)}
+
+    # Ensure we handle cases where a source might return an error or empty response
+    if not isinstance(data, dict):
+        return "error", {}
+    if "error" in data:
+        return "error", data
+    return "ok", data
+
+@register_enrichment_source("serper_data", timeout=SERPER_TIMEOUT, cache_ttl=SERPER_CACHE_TTL)
 async def search_email_data(email: str) -> Dict[str, Any]:
-    url = 'https://google.serper.dev/search'
+    url = SERPER_URL
     headers = {
         'X-API-KEY': SERPER_API_KEY,
         'Content-Type': 'application/json'
     }
     data = {'q': email}
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(url, json=data, headers=headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    return {"error": f"Failed to retrieve data, status code: {response.status}"}
-        except aiohttp.ClientError as e:
-            return {"error": f"Request to Serper API failed: {str(e)}"}
+    async def request():
+        session = clients.session()
+        async with session.post(url, json=data, headers=headers) as response:
+            rate_limits.observe("serper", response.headers, key=SERPER_API_KEY)
+            raise_for_throttling("serper", response.status, response.headers)
+            if response.status == 200:
+                return await response.json()
+            else:
+                return {"error": f"Failed to retrieve data, status code: {response.status}"}
 
+    try:
+        return await rate_limits.call("serper", request, key=SERPER_API_KEY)
+    except ProviderUnavailable as e:
+        return {"error": e.detail}
+    except aiohttp.ClientError as e:
+        return {"error": f"Request to Serper API failed: {str(e)}"}
+
+@register_enrichment_source("perplexity_data", timeout=PERPLEXITY_TIMEOUT, cache_ttl=PERPLEXITY_CACHE_TTL)
 async def search_perplexity_data(email: str) -> Dict[str, Any]:
-    perplexity_client = AsyncOpenAI(api_key=PERPLEXITY_API_KEY, base_url="https://api.perplexity.ai")
+    perplexity_client = clients.perplexity()
     
     messages = [
         {
@@ -60,9 +163,13 @@ async def search_perplexity_data(email: str) -> Dict[str, Any]:
     ]
     
     try:
-        response = await perplexity_client.chat.completions.create(
-            model="llama-3-sonar-large-32k-online",
-            messages=messages,
+        response = await rate_limits.call(
+            "perplexity",
+            lambda: perplexity_client.chat.completions.create(
+                model="llama-3-sonar-large-32k-online",
+                messages=messages,
+            ),
+            key=PERPLEXITY_API_KEY,
         )
         
         content = response.choices[0].message.content
@@ -75,7 +182,7 @@ async def search_perplexity_data(email: str) -> Dict[str, Any]:
         return clean_data(perplexity_data)
     
     except Exception as e:
-        print(f"Error querying Perplexity API: {e}")
+        logger.warning("Error querying Perplexity API: %s", e)
         return {"error": str(e)}
 
 def clean_data(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -87,19 +194,16 @@ def clean_data(data: Dict[str, Any]) -> Dict[str, Any]:
     else:
         return data
 
-async def summarize_public_data(data: Dict[str, Any]) -> str:
+def summary_source_data(data: Dict[str, Any]) -> Dict[str, Any]:
     # Ensure that we are accessing keys safely
-    serper_data = data.get("serper_data", {})
-    perplexity_data = data.get("perplexity_data", {})
-    
-    if not serper_data and not perplexity_data:
-        return "No public data available"
+    return {key: data.get(key, {}) for key in ENRICHMENT_SOURCES}
 
-    combined_data = json.dumps({
-        "serper_data": serper_data,
-        "perplexity_data": perplexity_data
-    }, indent=2)
+def summary_cache_key(compacted_data: str) -> str:
+    # Keyed on the compacted prompt data, so payloads that differ only in dropped fields share a summary
+    data_hash = hashlib.sha256(compacted_data.encode("utf-8")).hexdigest()
+    return f"summary:{SUMMARY_MODEL}:{data_hash}"
 
+def summary_messages(combined_data: str) -> List[Dict[str, str]]:
     prompt = f"""
     Summarize the following public data into a comprehensive yet concise and structured summary of 3-4 sentences only. 
     This data includes information from both Serper and Perplexity APIs.
@@ -111,18 +215,86 @@ async def summarize_public_data(data: Dict[str, Any]) -> str:
 
     Please provide a structured summary of this data, highlighting the most important and reliable information.
     """
+    return [
+        {
+            "role": "user",
+            "content": prompt,
+        }
+    ]
 
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
+async def summarize_public_data(data: Dict[str, Any]) -> str:
+    combined_data = compact_public_data(summary_source_data(data)).text
+    
+    if not combined_data:
+        return "No public data available"
+
+    with span("summarize"):
+        return await enrichment_cache.get_or_load(
+            summary_cache_key(combined_data),
+            lambda: generate_summary(combined_data),
+            ttl=SUMMARY_CACHE_TTL,
+            should_cache=lambda summary: not summary.startswith("Error:"),
         )
+
+async def generate_summary(combined_data: str) -> str:
+    try:
+        async def request():
+            async with clients.openai_slots:
+                return await clients.openai().chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=summary_messages(combined_data),
+                )
+
+        response = await rate_limits.call("openai", request, key=OPENAI_API_KEY)
         return response.choices[0].message.content.strip()
     except Exception as e:
-        print(f"Error summarizing public data: {e}")
+        logger.warning("Error summarizing public data: %s", e)
         return "Error: Unable to summarize public data"
+
+async def stream_summary(data: Dict[str, Any]) -> AsyncIterator[str]:
+    # Same summary as summarize_public_data, yielded token by token as the model produces it.
+    # A cached summary comes out as a single chunk; a completed stream is cached for both paths.
+    combined_data = compact_public_data(summary_source_data(data)).text
+    if not combined_data:
+        yield "No public data available"
+        return
+
+    cache_key = summary_cache_key(combined_data)
+    cached = await enrichment_cache.peek(cache_key, ttl=SUMMARY_CACHE_TTL)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        # The slot is held until the last token: the stream occupies the upstream connection throughout
+        async with clients.openai_slots:
+            with span("summarize"):
+                stream = await rate_limits.call(
+                    "openai",
+                    lambda: clients.openai().chat.completions.create(
+                        model=SUMMARY_MODEL,
+                        messages=summary_messages(combined_data),
+                        stream=True,
+                        # The final chunk then carries the token usage, which non-streamed calls always have
+                        stream_options={"include_usage": True},
+                    ),
+                    key=OPENAI_API_KEY,
+                )
+                async for chunk in stream:
+                    record_usage("openai", getattr(chunk, "usage", None))
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+    except Exception as e:
+        logger.warning("Error summarizing public data: %s", e)
+        if parts:
+            # Part of the summary is already out; the caller has to tell the client it is incomplete
+            raise
+        yield "Error: Unable to summarize public data"
+        return
+
+    summary = "".join(parts).strip()
+    if summary:
+        await enrichment_cache.put(cache_key, summary)
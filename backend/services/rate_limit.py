@@ -0,0 +1,383 @@
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+import aiohttp
+from fastapi import HTTPException
+from config import (
+    WORKERS,
+    RATE_LIMITS,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BASE_DELAY,
+    RATE_LIMIT_MAX_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RECOVERY_TIMEOUT,
+)
+from services.telemetry import record_provider_call, record_response_size
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Stands in for a status code when the request never got a response (connection reset, timeout)
+NO_RESPONSE = 0
+
+class UpstreamError(Exception):
+    def __init__(self, provider: str, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"{provider} returned status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+class ProviderUnavailable(HTTPException):
+    # An HTTPException so routers and the job queue pass it through as a 503 instead of a generic 500
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        super().__init__(
+            status_code=503,
+            detail=f"{provider} is unavailable: {reason}",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+        self.provider = provider
+        self.retry_after = retry_after
+
+@dataclass
+class RateLimitPolicy:
+    rate: float
+    burst: int
+    max_concurrency: Optional[int] = None
+
+@dataclass
+class LimiterStats:
+    requests: int = 0
+    throttled: int = 0
+    retries: int = 0
+    failures: int = 0
+    rejected: int = 0
+    queued: int = 0
+    wait_seconds: float = 0.0
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # asyncio.Lock wakes waiters in arrival order, so queued requests are served FIFO
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return now - start
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def sync(self, remaining: Optional[int], reset: Optional[float]):
+        # Trust the provider's own count when it is lower than ours (other processes share the key)
+        self._refill(time.monotonic())
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining <= 0 and reset:
+                self.pause(reset)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+        # Counts half-open probes, so a cancelled caller can tell whether the current probe is its own
+        self.probes = 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            # Only one probe request goes through until it tells us whether the provider recovered
+            if self._probing:
+                return False
+            self._probing = True
+            self.probes += 1
+        return True
+
+    def available(self) -> bool:
+        # Whether allow() could let a request through, without taking the half-open probe slot
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.recovery_timeout
+        return not (self.state == "half_open" and self._probing)
+
+    def release_probe(self, probe: Optional[int]):
+        # The probe ended without telling anything about the provider (it was cancelled). Only the caller
+        # holding the slot may free it; a request already in flight when the circuit went half-open may not.
+        if probe is not None and probe == self.probes and self.state == "half_open":
+            self._probing = False
+
+    def retry_after(self) -> float:
+        if self.state == "open":
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+        return self.recovery_timeout if self.state == "half_open" else 0.0
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+class ProviderLimiter:
+    def __init__(self, provider: str, key_id: str, policy: RateLimitPolicy):
+        self.provider = provider
+        self.key_id = key_id
+        self.policy = policy
+        self.bucket = TokenBucket(policy.rate, policy.burst)
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_TIMEOUT)
+        self.slots = asyncio.Semaphore(policy.max_concurrency) if policy.max_concurrency else None
+        self.stats = LimiterStats()
+
+    async def run(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        if self.slots is None:
+            return await func()
+        async with self.slots:
+            return await func()
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = asdict(self.stats)
+        stats.update(
+            provider=self.provider,
+            key=self.key_id,
+            rate=self.policy.rate,
+            burst=self.policy.burst,
+            tokens=round(self.bucket.tokens, 2),
+            circuit=self.breaker.state,
+            circuit_opened=self.breaker.times_opened,
+        )
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        return stats
+
+class RateLimiterRegistry:
+    def __init__(self):
+        self._policies: Dict[str, RateLimitPolicy] = {
+            provider: RateLimitPolicy(rate=rate, burst=burst) for provider, (rate, burst) in RATE_LIMITS.items()
+        }
+        self._limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+
+    def configure(self, provider: str, policy: RateLimitPolicy):
+        # Policies from config win over defaults registered in code (e.g. a CRM adapter's published limits)
+        self._policies.setdefault(provider, policy)
+
+    def limiter(self, provider: str, key: Optional[str] = None) -> ProviderLimiter:
+        # Keys are hashed so stats never expose credentials
+        key_id = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8] if key else "default"
+        limiter = self._limiters.get((provider, key_id))
+        if limiter is None:
+            policy = self._policies.get(provider)
+            if policy is None:
+                raise ValueError(f"No rate limit configured for {provider}")
+            limiter = ProviderLimiter(provider, key_id, worker_share(policy))
+            self._limiters[(provider, key_id)] = limiter
+        return limiter
+
+    def observe(self, provider: str, headers: Mapping[str, str], key: Optional[str] = None):
+        record_response_size(provider, headers)
+        remaining, reset = parse_rate_limit_headers(headers)
+        if remaining is not None:
+            self.limiter(provider, key).bucket.sync(remaining, reset)
+
+    async def call(
+        self,
+        provider: str,
+        func: Callable[[], Awaitable[Any]],
+        key: Optional[str] = None,
+        idempotent: bool = True,
+    ) -> Any:
+        limiter = self.limiter(provider, key)
+        attempt = 0
+        while True:
+            if not limiter.breaker.available():
+                limiter.stats.rejected += 1
+                raise ProviderUnavailable(provider, limiter.breaker.retry_after(), "circuit breaker is open")
+
+            limiter.stats.queued += 1
+            try:
+                limiter.stats.wait_seconds += await limiter.bucket.acquire()
+            finally:
+                limiter.stats.queued -= 1
+            # The half-open probe slot is only taken once the request is about to go out, so a caller
+            # cancelled while queued cannot hold it
+            if not limiter.breaker.allow():
+                limiter.stats.rejected += 1
+                raise ProviderUnavailable(provider, limiter.breaker.retry_after(), "circuit breaker is open")
+            probe = limiter.breaker.probes if limiter.breaker.state == "half_open" else None
+            limiter.stats.requests += 1
+
+            start = time.perf_counter()
+            try:
+                result = await limiter.run(func)
+            except Exception as e:
+                status, retry_after = classify_error(e)
+                record_provider_call(provider, status_label(status), time.perf_counter() - start)
+                if status not in RETRYABLE_STATUSES and status != NO_RESPONSE:
+                    # The provider answered; a client error says nothing about its health
+                    limiter.breaker.record_success()
+                    raise
+
+                delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                if status == 429:
+                    limiter.stats.throttled += 1
+                    limiter.breaker.record_success()
+                    # Everyone sharing this key waits out the provider's window, not just this caller
+                    limiter.bucket.pause(delay)
+                else:
+                    limiter.stats.failures += 1
+                    limiter.breaker.record_failure()
+                    if not idempotent:
+                        # The request may have been applied; only a 429 is known to be safe to resend
+                        raise
+
+                if attempt >= RATE_LIMIT_MAX_RETRIES:
+                    raise ProviderUnavailable(provider, delay, str(e) or type(e).__name__) from e
+                attempt += 1
+                limiter.stats.retries += 1
+                logger.info("%s request failed (%s); retry %d in %.2fs", provider, status or type(e).__name__, attempt, delay)
+                if status != 429:
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: the client went away or the app is shutting down, which says nothing about
+                # the provider, so a half-open probe hands its slot to the next caller
+                limiter.breaker.release_probe(probe)
+                raise
+
+            record_provider_call(provider, "ok", time.perf_counter() - start, result)
+            limiter.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {f"{provider}:{key_id}": limiter.snapshot() for (provider, key_id), limiter in self._limiters.items()}
+
+def classify_error(error: Exception) -> Tuple[Optional[int], Optional[float]]:
+    # Returns (status, retry_after); status is None for errors that did not come from the provider
+    if isinstance(error, UpstreamError):
+        return error.status, error.retry_after
+    # openai is imported lazily with the first client (see services.http_clients); before that no
+    # error can have come from it
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, openai.APIStatusError):
+        return error.status_code, parse_retry_after(error.response.headers)
+    if openai is not None and isinstance(error, openai.APIConnectionError):
+        return NO_RESPONSE, None
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return NO_RESPONSE, None
+    return None, None
+
+def is_outage(error: Exception) -> bool:
+    # The provider is down or throttling rather than rejecting the request, so the same request can succeed later
+    if isinstance(error, ProviderUnavailable):
+        return True
+    status, _ = classify_error(error)
+    return status in RETRYABLE_STATUSES or status == NO_RESPONSE
+
+def worker_share(policy: RateLimitPolicy) -> RateLimitPolicy:
+    # Buckets are per process; with several workers each one gets an even share of the provider's limits
+    if WORKERS == 1:
+        return policy
+    return RateLimitPolicy(
+        rate=policy.rate / WORKERS,
+        burst=max(1, policy.burst // WORKERS),
+        max_concurrency=max(1, policy.max_concurrency // WORKERS) if policy.max_concurrency else None,
+    )
+
+def status_label(status: Optional[int]) -> str:
+    if status is None:
+        return "error"
+    return "no_response" if status == NO_RESPONSE else str(status)
+
+def raise_for_throttling(provider: str, status: int, headers: Mapping[str, str]):
+    if status in RETRYABLE_STATUSES:
+        raise UpstreamError(provider, status, parse_retry_after(headers))
+
+def backoff_delay(attempt: int) -> float:
+    delay = min(RATE_LIMIT_MAX_DELAY, RATE_LIMIT_BASE_DELAY * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return min(float(retry_after_ms) / 1000, RATE_LIMIT_MAX_DELAY)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        seconds = float(retry_after)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), RATE_LIMIT_MAX_DELAY)
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Tuple[Optional[int], Optional[float]]:
+    # Covers the OpenAI-style (x-ratelimit-*-requests) and the common X-RateLimit-Remaining/Reset headers
+    remaining = headers.get("x-ratelimit-remaining-requests") or headers.get("x-ratelimit-remaining")
+    reset = headers.get("x-ratelimit-reset-requests") or headers.get("x-ratelimit-reset")
+    try:
+        remaining_count = int(float(remaining)) if remaining is not None else None
+    except ValueError:
+        remaining_count = None
+    return remaining_count, parse_reset(reset) if reset else None
+
+def parse_reset(value: str) -> Optional[float]:
+    try:
+        number = float(value)
+    except ValueError:
+        # Durations such as "1s", "6m0s" or "250ms"
+        parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+        if not parts:
+            return None
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        number = sum(float(amount) * units[unit] for amount, unit in parts)
+        return min(number, RATE_LIMIT_MAX_DELAY)
+    # Some providers send an epoch timestamp (seconds or milliseconds) instead of a delay
+    if number > 1e12:
+        number = number / 1000 - time.time()
+    elif number > 1e9:
+        number -= time.time()
+    return min(max(number, 0.0), RATE_LIMIT_MAX_DELAY)
+
+rate_limits = RateLimiterRegistry()
@@ -0,0 +1,201 @@
+import bisect
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from config import LOG_LEVEL, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+# (stage, seconds) for every span finished during the current request; None outside a request
+trace_var: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("trace", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket (plus +Inf), the sum and the total count
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any):
+        key = label_values(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    labels = format_labels((*self.labelnames, "le"), (*key, format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+metrics = MetricsRegistry()
+
+http_request_seconds = metrics.histogram(
+    "scanner_http_request_duration_seconds", "Time to handle an HTTP request, until the last body byte", ("method", "route", "status")
+)
+stage_seconds = metrics.histogram(
+    "scanner_stage_duration_seconds", "Time spent in one stage of the scan pipeline", ("stage", "outcome")
+)
+provider_request_seconds = metrics.histogram(
+    "scanner_provider_request_duration_seconds", "Latency of a single call to an upstream provider, per attempt", ("provider", "status")
+)
+provider_response_bytes = metrics.histogram(
+    "scanner_provider_response_bytes", "Size of upstream responses, from Content-Length", ("provider",), buckets=BYTES_BUCKETS
+)
+provider_tokens = metrics.histogram(
+    "scanner_provider_tokens", "Model tokens per call", ("provider", "kind"), buckets=TOKEN_BUCKETS
+)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    # Works around sync and async code alike: `with span("transcribe"): await ...`
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage, outcome=outcome)
+        trace = trace_var.get()
+        if trace is not None:
+            trace.append((stage, elapsed))
+
+def record_provider_call(provider: str, status: str, seconds: float, result: Any = None):
+    provider_request_seconds.observe(seconds, provider=provider, status=status)
+    record_usage(provider, getattr(result, "usage", None))
+
+def record_usage(provider: str, usage: Any):
+    # OpenAI-compatible responses (OpenAI, Perplexity) report token usage; other providers do not
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens is not None:
+            provider_tokens.observe(tokens, provider=provider, kind=kind.removesuffix("_tokens"))
+
+def record_response_size(provider: str, headers: Any):
+    content_length = headers.get("content-length")
+    if content_length and content_length.isdigit():
+        provider_response_bytes.observe(int(content_length), provider=provider)
+
+def summarize_trace(trace: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+    # Stages that ran more than once (a batch, the enrichment fan-out) are added up
+    totals: Dict[str, float] = {}
+    for stage, seconds in trace:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return list(totals.items())
+
+_profile_lock = threading.Lock()
+
+def start_profile() -> Optional[cProfile.Profile]:
+    # One profile at a time; cProfile cannot be enabled twice in the same interpreter
+    if not _profile_lock.acquire(blocking=False):
+        logger.info("Profiling skipped: another request is being profiled")
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop_profile(profiler: cProfile.Profile, request_id: str) -> str:
+    try:
+        profiler.disable()
+    finally:
+        _profile_lock.release()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{request_id}.prof")
+    profiler.dump_stats(path)
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(15)
+    logger.info("Profile of request %s saved to %s\n%s", request_id, path, report.getvalue())
+    return path
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+def configure_logging():
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RequestIdFilter())
+
+def label_values(labelnames: Tuple[str, ...], labels: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def format_labels(labelnames: Sequence[str], values: Sequence[str]) -> str:
+    if not labelnames:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, escaped)) + "}"
+
+def format_value(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
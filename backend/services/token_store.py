@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from cryptography.fernet import Fernet
+from config import (
+    TOKEN_STORE_PATH,
+    TOKEN_STORE_KEY,
+    TOKEN_REFRESH_MARGIN,
+    TOKEN_REFRESH_INTERVAL,
+    TOKEN_CACHE_TTL,
+    TOKEN_REFRESH_LEASE,
+    OAUTH_STATE_TTL,
+)
+from models.oauth import OAuthCredentials
+from services.cache import SingleFlight
+from services.crm_integration import get_adapter
+
+logger = logging.getLogger(__name__)
+
+# How often a worker waiting on another worker's token refresh checks the store again (seconds)
+REFRESH_POLL_INTERVAL = 0.25
+
+class TokenStore:
+    def __init__(self, path: str, key: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fernet = Fernet(key or load_or_create_key(f"{path}.key"))
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS oauth_tokens ("
+                "tenant_id TEXT NOT NULL, crm_name TEXT NOT NULL, credentials BLOB NOT NULL, "
+                "expires_at INTEGER, refreshable INTEGER NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (tenant_id, crm_name))"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(oauth_tokens)")]
+            if "refresh_lease_until" not in columns:
+                self._conn.execute("ALTER TABLE oauth_tokens ADD COLUMN refresh_lease_until REAL")
+            # OAuth flows in progress: the random `state` handed to the provider, and the tenant that started it
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS oauth_states ("
+                "state TEXT PRIMARY KEY, tenant_id TEXT NOT NULL, crm_name TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        # Read-through cache: credential lookups on the request path do no I/O once warm. Entries are
+        # re-read after TOKEN_CACHE_TTL, so a token another worker process refreshed or replaced is picked up
+        self._memory: Dict[Tuple[str, str], Tuple[float, OAuthCredentials]] = {}
+        self._refreshes = SingleFlight()
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def get(self, tenant_id: str, crm_name: str) -> Optional[OAuthCredentials]:
+        credentials = self._cached(tenant_id, crm_name)
+        if credentials is None:
+            credentials = await asyncio.to_thread(self._load, tenant_id, crm_name)
+            if credentials is None:
+                return None
+            self._remember(tenant_id, crm_name, credentials)
+
+        if needs_refresh(credentials, margin=0) and credentials.refresh_token:
+            # Already expired (the background refresher fell behind); refresh inline before use
+            credentials = await self.refresh(tenant_id, crm_name)
+        return credentials
+
+    async def save(self, tenant_id: str, crm_name: str, credentials: OAuthCredentials):
+        await asyncio.to_thread(self._save, tenant_id, crm_name, credentials)
+        self._remember(tenant_id, crm_name, credentials)
+
+    async def delete(self, tenant_id: str, crm_name: str):
+        await asyncio.to_thread(self._delete, tenant_id, crm_name)
+        self._memory.pop((tenant_id, crm_name), None)
+
+    async def create_oauth_state(self, tenant_id: str, crm_name: str) -> str:
+        state = secrets.token_urlsafe(32)
+        await asyncio.to_thread(self._create_state, state, tenant_id, crm_name)
+        return state
+
+    async def consume_oauth_state(self, state: str, crm_name: str) -> Optional[str]:
+        # The tenant that started the flow; None for a state that is unknown, expired, already used or
+        # issued for another CRM, so a callback cannot store tokens for a tenant of the caller's choosing
+        return await asyncio.to_thread(self._consume_state, state, crm_name)
+
+    async def refresh(self, tenant_id: str, crm_name: str) -> OAuthCredentials:
+        # Concurrent pushes that all find an expiring token share one call to the token endpoint
+        credentials, _ = await self._refreshes.do(
+            f"{tenant_id}:{crm_name}", lambda: self._refresh(tenant_id, crm_name)
+        )
+        return credentials
+
+    async def _refresh(self, tenant_id: str, crm_name: str) -> OAuthCredentials:
+        # Across worker processes, a lease on the row makes sure only one of them spends the refresh
+        # token (most CRMs rotate it, so a second refresh with the old one fails); the others wait for
+        # the stored copy to be updated. The stored copy is always read first, since it may be newer.
+        while True:
+            current = await asyncio.to_thread(self._load, tenant_id, crm_name)
+            if current is None:
+                raise ValueError(f"No stored credentials for {crm_name}")
+            if not needs_refresh(current):
+                self._remember(tenant_id, crm_name, current)
+                return current
+            if await asyncio.to_thread(self._claim_refresh, tenant_id, crm_name):
+                break
+            await asyncio.sleep(REFRESH_POLL_INTERVAL)
+
+        try:
+            refreshed = await get_adapter(crm_name).refresh_access_token(current)
+        except BaseException:
+            await asyncio.to_thread(self._release_refresh, tenant_id, crm_name)
+            raise
+        # Saving replaces the row, which also clears the lease
+        await self.save(tenant_id, crm_name, refreshed)
+        return refreshed
+
+    def _cached(self, tenant_id: str, crm_name: str) -> Optional[OAuthCredentials]:
+        entry = self._memory.get((tenant_id, crm_name))
+        if entry is None or time.monotonic() - entry[0] > TOKEN_CACHE_TTL:
+            return None
+        return entry[1]
+
+    def _remember(self, tenant_id: str, crm_name: str, credentials: OAuthCredentials):
+        self._memory[(tenant_id, crm_name)] = (time.monotonic(), credentials)
+
+    def start_refresher(self):
+        self._refresher = asyncio.ensure_future(self._refresh_loop())
+
+    async def stop_refresher(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    async def _refresh_loop(self):
+        while True:
+            expiring = await asyncio.to_thread(self._expiring, time.time() + TOKEN_REFRESH_MARGIN)
+            for tenant_id, crm_name in expiring:
+                try:
+                    await self.refresh(tenant_id, crm_name)
+                except Exception as e:
+                    logger.warning("Proactive refresh of %s token for tenant %s failed: %s", crm_name, tenant_id, e)
+            await asyncio.sleep(TOKEN_REFRESH_INTERVAL)
+
+    def _load(self, tenant_id: str, crm_name: str) -> Optional[OAuthCredentials]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT credentials FROM oauth_tokens WHERE tenant_id = ? AND crm_name = ?", (tenant_id, crm_name)
+            ).fetchone()
+        if row is None:
+            return None
+        return OAuthCredentials.parse_raw(self._fernet.decrypt(row[0]))
+
+    def _save(self, tenant_id: str, crm_name: str, credentials: OAuthCredentials):
+        encrypted = self._fernet.encrypt(credentials.json().encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO oauth_tokens (tenant_id, crm_name, credentials, expires_at, refreshable, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (tenant_id, crm_name, encrypted, credentials.expires_at, bool(credentials.refresh_token), time.time()),
+            )
+
+    def _create_state(self, state: str, tenant_id: str, crm_name: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM oauth_states WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "INSERT INTO oauth_states (state, tenant_id, crm_name, expires_at) VALUES (?, ?, ?, ?)",
+                (state, tenant_id, crm_name, now + OAUTH_STATE_TTL),
+            )
+
+    def _consume_state(self, state: str, crm_name: str) -> Optional[str]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT tenant_id, crm_name, expires_at FROM oauth_states WHERE state = ?", (state,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM oauth_states WHERE state = ?", (state,))
+        tenant_id, issued_for, expires_at = row
+        if issued_for != crm_name or expires_at < time.time():
+            return None
+        return tenant_id
+
+    def _claim_refresh(self, tenant_id: str, crm_name: str) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE oauth_tokens SET refresh_lease_until = ? "
+                "WHERE tenant_id = ? AND crm_name = ? AND coalesce(refresh_lease_until, 0) < ?",
+                (now + TOKEN_REFRESH_LEASE, tenant_id, crm_name, now),
+            )
+            return cursor.rowcount == 1
+
+    def _release_refresh(self, tenant_id: str, crm_name: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE oauth_tokens SET refresh_lease_until = NULL WHERE tenant_id = ? AND crm_name = ?",
+                (tenant_id, crm_name),
+            )
+
+    def _delete(self, tenant_id: str, crm_name: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM oauth_tokens WHERE tenant_id = ? AND crm_name = ?", (tenant_id, crm_name))
+
+    def _expiring(self, before: float) -> List[Tuple[str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT tenant_id, crm_name FROM oauth_tokens WHERE refreshable AND expires_at IS NOT NULL AND expires_at <= ?",
+                (before,),
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def needs_refresh(credentials: OAuthCredentials, margin: float = TOKEN_REFRESH_MARGIN) -> bool:
+    return credentials.expires_at is not None and credentials.expires_at <= time.time() + margin
+
+def load_or_create_key(path: str) -> bytes:
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read().strip()
+    # Workers started together all get here on first boot. The key is written in full to a file of this
+    # process's own and linked into place, which fails if a key is already there, so every worker ends up
+    # reading the same complete key.
+    key = Fernet.generate_key()
+    temp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        os.link(temp_path, path)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    finally:
+        os.unlink(temp_path)
+    return key
+
+token_store = TokenStore(TOKEN_STORE_PATH, TOKEN_STORE_KEY)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import pytest
+from aiohttp import web
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+MOCK_CRM_URL = f"http://127.0.0.1:{free_port()}"
+
+# config reads its settings once at import, so every CRM is pointed at the mock server before any app module loads
+os.environ.update(
+    DATA_DIR=tempfile.mkdtemp(prefix="backend-tests-"),
+    SALESFORCE_CLIENT_ID="salesforce-client",
+    SALESFORCE_CLIENT_SECRET="salesforce-secret",
+    SALESFORCE_REDIRECT_URI="http://localhost/oauth/salesforce/callback",
+    SALESFORCE_LOGIN_URL=f"{MOCK_CRM_URL}/salesforce-login",
+    HUBSPOT_CLIENT_ID="hubspot-client",
+    HUBSPOT_CLIENT_SECRET="hubspot-secret",
+    HUBSPOT_REDIRECT_URI="http://localhost/oauth/hubspot/callback",
+    HUBSPOT_API_BASE_URL=f"{MOCK_CRM_URL}/hubspot",
+    DYNAMICS_CLIENT_ID="dynamics-client",
+    DYNAMICS_CLIENT_SECRET="dynamics-secret",
+    DYNAMICS_REDIRECT_URI="http://localhost/oauth/dynamics/callback",
+    DYNAMICS_TENANT_ID="contoso",
+    DYNAMICS_LOGIN_URL=f"{MOCK_CRM_URL}/dynamics-login",
+    DYNAMICS_ORG_URL=f"{MOCK_CRM_URL}/dynamics",
+    ZOHO_CLIENT_ID="zoho-client",
+    ZOHO_CLIENT_SECRET="zoho-secret",
+    ZOHO_REDIRECT_URI="http://localhost/oauth/zoho/callback",
+    ZOHO_API_BASE_URL=f"{MOCK_CRM_URL}/zoho",
+    ZOHO_ACCOUNTS_URL=f"{MOCK_CRM_URL}/zoho-accounts",
+)
+
+Handler = Callable[[web.Request, Any], Tuple[int, Any]]
+
+class MockCRM:
+    # Serves canned answers per (method, path) and records every request it got as (method, path, request, body),
+    # where body is the parsed JSON or form data
+    def __init__(self):
+        self.url = MOCK_CRM_URL
+        self.handlers: Dict[Tuple[str, str], Handler] = {}
+        self.requests: List[Tuple[str, str, web.Request, Any]] = []
+
+    def on(self, method: str, path: str, handler: Handler):
+        self.handlers[(method, path)] = handler
+
+    def calls(self, method: str, path: str) -> List[Tuple[web.Request, Any]]:
+        return [(request, body) for m, p, request, body in self.requests if (m, p) == (method, path)]
+
+    async def dispatch(self, request: web.Request) -> web.Response:
+        if request.content_type == "application/x-www-form-urlencoded":
+            body: Any = dict(await request.post())
+        else:
+            body = await request.json() if request.can_read_body else None
+        self.requests.append((request.method, request.path, request, body))
+        handler = self.handlers.get((request.method, request.path))
+        if handler is None:
+            return web.json_response({"message": f"No mock for {request.method} {request.path}"}, status=404)
+        status, answer = handler(request, body)
+        if answer is None:
+            return web.Response(status=status)
+        return web.json_response(answer, status=status)
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        # The adapter call runs while the server is up; the shared HTTP session is closed before the loop goes away
+        from services.http_clients import clients
+
+        async def serve():
+            app = web.Application()
+            app.router.add_route("*", "/{path:.*}", self.dispatch)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", int(self.url.rsplit(":", 1)[1])).start()
+            try:
+                return await coro
+            finally:
+                await clients.close()
+                await runner.cleanup()
+
+        return asyncio.run(serve())
+
+@pytest.fixture
+def mock_crm() -> MockCRM:
+    return MockCRM()
@@ -0,0 +1,316 @@
+import time
+from urllib.parse import parse_qs, urlparse
+from models.lead import Lead
+from models.oauth import OAuthCredentials
+from services.crm_integration import get_adapter
+
+ANN = Lead(name="Ann Lee", email="ann@example.com", phone="+1 555 0100", company="Acme", position="CTO")
+BOB = Lead(name="Bob Stone", email="bob@example.com", company="Globex")
+NO_EMAIL = Lead(name="Cy Young", phone="+1 555 0199", company="Initech")
+
+def credentials(mock_crm, instance_path=None):
+    return OAuthCredentials(
+        access_token="access-1",
+        refresh_token="refresh-1",
+        expires_at=int(time.time()) + 3600,
+        instance_url=f"{mock_crm.url}{instance_path}" if instance_path else None,
+    )
+
+def token_answer(access_token, **extra):
+    return lambda request, body: (200, {"access_token": access_token, "token_type": "Bearer", "expires_in": 3600, **extra})
+
+def test_salesforce_send_lead(mock_crm):
+    mock_crm.on("POST", "/salesforce/services/data/v59.0/sobjects/Lead/", lambda request, body: (201, {"id": "00Q1", "success": True, "errors": []}))
+
+    body = mock_crm.run(get_adapter("salesforce").send_lead(ANN, credentials(mock_crm, "/salesforce")))
+
+    assert body["id"] == "00Q1"
+    assert get_adapter("salesforce").send_result(body) == {"status": "success", "id": "00Q1"}
+    ((request, record),) = mock_crm.calls("POST", "/salesforce/services/data/v59.0/sobjects/Lead/")
+    assert request.headers["Authorization"] == "Bearer access-1"
+    assert record == {"FirstName": "Ann", "LastName": "Lee", "Email": "ann@example.com", "Phone": "+1 555 0100", "Company": "Acme", "Title": "CTO"}
+
+def test_salesforce_send_leads_maps_each_save_result(mock_crm):
+    mock_crm.on("POST", "/salesforce/services/data/v59.0/composite/sobjects", lambda request, body: (200, [
+        {"id": "00Q1", "success": True, "errors": []},
+        {"success": False, "errors": [{"statusCode": "REQUIRED_FIELD_MISSING", "message": "Required fields are missing: [Email]"}]},
+        {"id": "00Q3", "success": True, "errors": []},
+    ]))
+
+    results = mock_crm.run(get_adapter("salesforce").send_leads([ANN, NO_EMAIL, BOB], credentials(mock_crm, "/salesforce")))
+
+    assert [(result["index"], result["status"], result.get("id")) for result in results] == [(0, "success", "00Q1"), (1, "error", None), (2, "success", "00Q3")]
+    assert results[1]["message"] == "Required fields are missing: [Email]"
+    ((_, data),) = mock_crm.calls("POST", "/salesforce/services/data/v59.0/composite/sobjects")
+    assert data["allOrNone"] is False
+    assert [record["Email"] for record in data["records"]] == ["ann@example.com", None, "bob@example.com"]
+
+def test_salesforce_upsert_patches_the_lead_found_by_email(mock_crm):
+    mock_crm.on("GET", "/salesforce/services/data/v59.0/query", lambda request, body: (200, {"totalSize": 1, "records": [{"Id": "00Q9"}]}))
+    mock_crm.on("PATCH", "/salesforce/services/data/v59.0/sobjects/Lead/00Q9", lambda request, body: (204, None))
+
+    result = mock_crm.run(get_adapter("salesforce").upsert_lead(ANN, credentials(mock_crm, "/salesforce")))
+
+    assert result == {"status": "success", "id": "00Q9", "action": "update"}
+    ((query, _),) = mock_crm.calls("GET", "/salesforce/services/data/v59.0/query")
+    assert query.query["q"] == "SELECT Id FROM Lead WHERE Email = 'ann@example.com' LIMIT 1"
+    ((_, record),) = mock_crm.calls("PATCH", "/salesforce/services/data/v59.0/sobjects/Lead/00Q9")
+    assert record["Email"] == "ann@example.com"
+
+def test_salesforce_upsert_inserts_when_no_lead_matches(mock_crm):
+    mock_crm.on("GET", "/salesforce/services/data/v59.0/query", lambda request, body: (200, {"totalSize": 0, "records": []}))
+    mock_crm.on("POST", "/salesforce/services/data/v59.0/sobjects/Lead/", lambda request, body: (201, {"id": "00Q2", "success": True, "errors": []}))
+
+    result = mock_crm.run(get_adapter("salesforce").upsert_lead(ANN, credentials(mock_crm, "/salesforce")))
+
+    assert result == {"status": "success", "id": "00Q2", "action": "insert"}
+    assert not [call for call in mock_crm.requests if call[0] == "PATCH"]
+
+def test_salesforce_token_exchange_and_refresh(mock_crm):
+    adapter = get_adapter("salesforce")
+    mock_crm.on("POST", "/salesforce-login/services/oauth2/token", lambda request, body: (200, {
+        "access_token": f"access-for-{body['grant_type']}",
+        "instance_url": f"{mock_crm.url}/salesforce",
+        **({"refresh_token": "refresh-1"} if body["grant_type"] == "authorization_code" else {}),
+    }))
+
+    async def exchange_then_refresh():
+        issued = await adapter.exchange_code_for_token("code-1")
+        return issued, await adapter.refresh_access_token(issued)
+
+    issued, refreshed = mock_crm.run(exchange_then_refresh())
+
+    assert (issued.access_token, issued.refresh_token, issued.instance_url) == ("access-for-authorization_code", "refresh-1", f"{mock_crm.url}/salesforce")
+    # Salesforce does not send the refresh token again; the one already held is kept
+    assert (refreshed.access_token, refreshed.refresh_token) == ("access-for-refresh_token", "refresh-1")
+    (_, code_grant), (_, refresh_grant) = mock_crm.calls("POST", "/salesforce-login/services/oauth2/token")
+    assert code_grant == {
+        "client_id": "salesforce-client",
+        "client_secret": "salesforce-secret",
+        "redirect_uri": "http://localhost/oauth/salesforce/callback",
+        "code": "code-1",
+        "grant_type": "authorization_code",
+    }
+    assert refresh_grant["refresh_token"] == "refresh-1"
+
+def test_hubspot_send_lead(mock_crm):
+    mock_crm.on("POST", "/hubspot/crm/v3/objects/contacts", lambda request, body: (201, {"id": "501", "properties": body["properties"]}))
+
+    body = mock_crm.run(get_adapter("hubspot").send_lead(ANN, credentials(mock_crm)))
+
+    assert body["id"] == "501"
+    assert get_adapter("hubspot").send_result(body) == {"status": "success", "id": "501", "action": "insert"}
+    ((_, data),) = mock_crm.calls("POST", "/hubspot/crm/v3/objects/contacts")
+    assert data == {"properties": {"firstname": "Ann", "lastname": "Lee", "email": "ann@example.com", "phone": "+1 555 0100", "company": "Acme", "jobtitle": "CTO"}}
+
+def test_hubspot_send_leads_matches_results_by_email(mock_crm):
+    # Results come back out of order, and Ann's create failed: her result must not be taken from the lead without an email
+    mock_crm.on("POST", "/hubspot/crm/v3/objects/contacts/batch/create", lambda request, body: (207, {
+        "status": "COMPLETE",
+        "results": [
+            {"id": "503", "properties": {"email": "bob@example.com"}},
+            {"id": "502", "properties": {"phone": "+1 555 0199"}},
+        ],
+        "errors": [{"status": "error", "category": "CONFLICT", "message": "Contact already exists"}],
+    }))
+
+    results = mock_crm.run(get_adapter("hubspot").send_leads([ANN, NO_EMAIL, BOB], credentials(mock_crm)))
+
+    assert [(result["index"], result["status"], result.get("id")) for result in results] == [(0, "error", None), (1, "success", "502"), (2, "success", "503")]
+    assert results[0]["message"] == "Contact already exists"
+    ((_, data),) = mock_crm.calls("POST", "/hubspot/crm/v3/objects/contacts/batch/create")
+    assert len(data["inputs"]) == 3
+
+def test_hubspot_upsert_by_email(mock_crm):
+    mock_crm.on("POST", "/hubspot/crm/v3/objects/contacts/batch/upsert", lambda request, body: (200, {
+        "status": "COMPLETE",
+        "results": [{"id": "501", "new": False, "properties": {"email": "ann@example.com"}}],
+    }))
+
+    result = mock_crm.run(get_adapter("hubspot").upsert_lead(ANN, credentials(mock_crm)))
+
+    assert result == {"status": "success", "id": "501", "action": "update"}
+    ((_, data),) = mock_crm.calls("POST", "/hubspot/crm/v3/objects/contacts/batch/upsert")
+    assert data["inputs"][0]["idProperty"] == "email"
+    assert data["inputs"][0]["id"] == "ann@example.com"
+
+def test_hubspot_token_exchange_and_refresh(mock_crm):
+    adapter = get_adapter("hubspot")
+    mock_crm.on("POST", "/hubspot/oauth/v1/token", token_answer("hubspot-access", refresh_token="hubspot-refresh"))
+
+    async def exchange_then_refresh():
+        issued = await adapter.exchange_code_for_token("code-1")
+        return issued, await adapter.refresh_access_token(issued)
+
+    issued, refreshed = mock_crm.run(exchange_then_refresh())
+
+    assert (issued.access_token, issued.refresh_token) == ("hubspot-access", "hubspot-refresh")
+    assert issued.expires_at is not None and issued.expires_at > time.time() + 3000
+    assert refreshed.refresh_token == "hubspot-refresh"
+    grants = [body["grant_type"] for _, body in mock_crm.calls("POST", "/hubspot/oauth/v1/token")]
+    assert grants == ["authorization_code", "refresh_token"]
+
+def test_dynamics_send_lead(mock_crm):
+    mock_crm.on("POST", "/dynamics/api/data/v9.2/leads", lambda request, body: (201, {"leadid": "L1"}))
+
+    body = mock_crm.run(get_adapter("dynamics").send_lead(ANN, credentials(mock_crm)))
+
+    assert body == {"leadid": "L1"}
+    assert get_adapter("dynamics").send_result(body) == {"status": "success", "id": "L1", "action": "insert"}
+    ((request, record),) = mock_crm.calls("POST", "/dynamics/api/data/v9.2/leads")
+    assert request.query["$select"] == "leadid"
+    assert request.headers["OData-Version"] == "4.0"
+    assert record["emailaddress1"] == "ann@example.com"
+    assert record["lastname"] == "Lee"
+
+def test_dynamics_send_leads_creates_each_lead(mock_crm):
+    def create(request, record):
+        if record["emailaddress1"] is None:
+            return 400, {"error": {"code": "0x80040203", "message": "emailaddress1 is required"}}
+        return 201, {"leadid": f"L-{record['lastname']}"}
+
+    mock_crm.on("POST", "/dynamics/api/data/v9.2/leads", create)
+
+    results = mock_crm.run(get_adapter("dynamics").send_leads([ANN, NO_EMAIL, BOB], credentials(mock_crm)))
+
+    assert [(result["index"], result["status"], result.get("id")) for result in results] == [(0, "success", "L-Lee"), (1, "error", None), (2, "success", "L-Stone")]
+    assert results[1]["message"] == "emailaddress1 is required"
+    assert len(mock_crm.calls("POST", "/dynamics/api/data/v9.2/leads")) == 3
+
+def test_dynamics_upsert_patches_the_lead_found_by_email(mock_crm):
+    mock_crm.on("GET", "/dynamics/api/data/v9.2/leads", lambda request, body: (200, {"value": [{"leadid": "L9"}]}))
+    mock_crm.on("PATCH", "/dynamics/api/data/v9.2/leads(L9)", lambda request, body: (204, None))
+
+    result = mock_crm.run(get_adapter("dynamics").upsert_lead(ANN, credentials(mock_crm)))
+
+    assert result == {"status": "success", "id": "L9", "action": "update"}
+    ((query, _),) = mock_crm.calls("GET", "/dynamics/api/data/v9.2/leads")
+    assert query.query["$filter"] == "emailaddress1 eq 'ann@example.com'"
+    ((patch, record),) = mock_crm.calls("PATCH", "/dynamics/api/data/v9.2/leads(L9)")
+    assert patch.headers["If-Match"] == "*"
+    assert record["companyname"] == "Acme"
+
+def test_dynamics_token_exchange_and_refresh(mock_crm):
+    adapter = get_adapter("dynamics")
+    mock_crm.on("POST", "/dynamics-login/contoso/oauth2/v2.0/token", token_answer("dynamics-access", refresh_token="dynamics-refresh-2"))
+
+    async def exchange_then_refresh():
+        issued = await adapter.exchange_code_for_token("code-1")
+        return issued, await adapter.refresh_access_token(issued)
+
+    issued, refreshed = mock_crm.run(exchange_then_refresh())
+
+    assert issued.refresh_token == "dynamics-refresh-2"
+    assert refreshed.access_token == "dynamics-access"
+    (_, code_grant), (_, refresh_grant) = mock_crm.calls("POST", "/dynamics-login/contoso/oauth2/v2.0/token")
+    assert (code_grant["client_id"], code_grant["code"]) == ("dynamics-client", "code-1")
+    assert (refresh_grant["grant_type"], refresh_grant["refresh_token"]) == ("refresh_token", "dynamics-refresh-2")
+
+    scope = parse_qs(urlparse(mock_crm.run(adapter.initiate_oauth("state-1"))).query)["scope"]
+    assert scope == [f"{mock_crm.url}/dynamics/user_impersonation offline_access"]
+
+def test_zoho_send_lead(mock_crm):
+    mock_crm.on("POST", "/zoho/crm/v2/Leads", lambda request, body: (201, {"data": [
+        {"code": "SUCCESS", "details": {"id": "Z1"}, "message": "record added", "status": "success"},
+    ]}))
+
+    body = mock_crm.run(get_adapter("zoho").send_lead(ANN, credentials(mock_crm)))
+
+    assert get_adapter("zoho").send_result(body)["id"] == "Z1"
+    ((request, data),) = mock_crm.calls("POST", "/zoho/crm/v2/Leads")
+    assert request.headers["Authorization"] == "Bearer access-1"
+    assert data == {"data": [{"Last_Name": "Ann Lee", "Email": "ann@example.com", "Phone": "+1 555 0100", "Company": "Acme", "Designation": "CTO"}]}
+
+def test_zoho_send_lead_rejected(mock_crm):
+    # Zoho answers a rejected record with a 4xx body instead of an error
+    mock_crm.on("POST", "/zoho/crm/v2/Leads", lambda request, body: (400, {"data": [
+        {"code": "MANDATORY_NOT_FOUND", "details": {"api_name": "Last_Name"}, "message": "required field not found", "status": "error"},
+    ]}))
+
+    body = mock_crm.run(get_adapter("zoho").send_lead(ANN, credentials(mock_crm)))
+
+    assert get_adapter("zoho").send_result(body)["status"] == "error"
+    assert get_adapter("zoho").send_result({"code": "INVALID_TOKEN", "message": "invalid oauth token"}) == {"status": "error", "message": "invalid oauth token"}
+
+def test_zoho_send_leads_maps_each_record(mock_crm):
+    mock_crm.on("POST", "/zoho/crm/v2/Leads", lambda request, body: (202, {"data": [
+        {"code": "SUCCESS", "details": {"id": "Z1"}, "message": "record added", "status": "success"},
+        {"code": "INVALID_DATA", "details": {"api_name": "Email"}, "message": "invalid data", "status": "error"},
+        {"code": "SUCCESS", "details": {"id": "Z3"}, "message": "record added", "status": "success"},
+    ]}))
+
+    results = mock_crm.run(get_adapter("zoho").send_leads([ANN, NO_EMAIL, BOB], credentials(mock_crm)))
+
+    assert [(result["index"], result["status"], result["id"]) for result in results] == [(0, "success", "Z1"), (1, "error", None), (2, "success", "Z3")]
+    assert (results[1]["code"], results[1]["message"]) == ("INVALID_DATA", "invalid data")
+
+def test_zoho_send_leads_flags_an_outage(mock_crm):
+    mock_crm.on("POST", "/zoho/crm/v2/Leads", lambda request, body: (503, {"message": "Service unavailable"}))
+
+    results = mock_crm.run(get_adapter("zoho").send_leads([ANN, BOB], credentials(mock_crm)))
+
+    assert [(result["status"], result["outage"]) for result in results] == [("error", True), ("error", True)]
+
+def test_zoho_upsert_checks_duplicates_on_email(mock_crm):
+    mock_crm.on("POST", "/zoho/crm/v2/Leads/upsert", lambda request, body: (200, {"data": [
+        {"code": "SUCCESS", "action": "update", "details": {"id": "Z1"}, "message": "record updated", "status": "success"},
+    ]}))
+
+    result = mock_crm.run(get_adapter("zoho").upsert_lead(ANN, credentials(mock_crm)))
+
+    assert (result["status"], result["id"], result["action"]) == ("success", "Z1", "update")
+    ((_, data),) = mock_crm.calls("POST", "/zoho/crm/v2/Leads/upsert")
+    assert data["duplicate_check_fields"] == ["Email"]
+
+def test_zoho_upsert_without_a_single_result_is_an_error(mock_crm):
+    answers = [{"data": []}, {"data": [{"status": "success"}, {"status": "success"}]}, {"code": "INVALID_TOKEN", "message": "invalid oauth token"}]
+    mock_crm.on("POST", "/zoho/crm/v2/Leads/upsert", lambda request, body: (200, answers.pop(0)))
+
+    results = [mock_crm.run(get_adapter("zoho").upsert_lead(ANN, credentials(mock_crm))) for _ in range(3)]
+
+    assert [result["status"] for result in results] == ["error"] * 3
+    assert "invalid oauth token" in results[2]["message"]
+
+def test_zoho_token_exchange_and_refresh(mock_crm):
+    adapter = get_adapter("zoho")
+    mock_crm.on("POST", "/zoho-accounts/oauth/v2/token", lambda request, body: (200, {
+        "access_token": f"zoho-{body['grant_type']}",
+        "expires_in": 3600,
+        **({"refresh_token": "zoho-refresh"} if body["grant_type"] == "authorization_code" else {}),
+    }))
+
+    async def exchange_then_refresh():
+        issued = await adapter.exchange_code_for_token("code-1")
+        return issued, await adapter.refresh_access_token(issued)
+
+    issued, refreshed = mock_crm.run(exchange_then_refresh())
+
+    assert (issued.access_token, issued.refresh_token) == ("zoho-authorization_code", "zoho-refresh")
+    assert (refreshed.access_token, refreshed.refresh_token) == ("zoho-refresh_token", "zoho-refresh")
+    assert parse_qs(urlparse(mock_crm.run(adapter.initiate_oauth("state-1"))).query)["access_type"] == ["offline"]
+
+def test_zoho_token_error_is_raised(mock_crm):
+    mock_crm.on("POST", "/zoho-accounts/oauth/v2/token", lambda request, body: (200, {"error": "invalid_code"}))
+
+    try:
+        mock_crm.run(get_adapter("zoho").exchange_code_for_token("expired"))
+    except ValueError as e:
+        assert "invalid_code" in str(e)
+    else:
+        raise AssertionError("A token answer without an access token must fail")
+
+def test_expired_stored_credentials_are_refreshed_before_use(mock_crm):
+    from services.token_store import token_store
+
+    mock_crm.on("POST", "/salesforce-login/services/oauth2/token", token_answer("access-2"))
+    expired = OAuthCredentials(access_token="access-1", refresh_token="refresh-1", expires_at=int(time.time()) - 60, instance_url=f"{mock_crm.url}/salesforce")
+
+    async def save_then_get():
+        await token_store.save("acme", "salesforce", expired)
+        return await token_store.get("acme", "salesforce")
+
+    current = mock_crm.run(save_then_get())
+
+    assert (current.access_token, current.refresh_token, current.instance_url) == ("access-2", "refresh-1", f"{mock_crm.url}/salesforce")
+    ((_, grant),) = mock_crm.calls("POST", "/salesforce-login/services/oauth2/token")
+    assert (grant["grant_type"], grant["refresh_token"]) == ("refresh_token", "refresh-1")
@@ -0,0 +1,67 @@
+import asyncio
+import io
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from services import image_processing
+from services.image_processing import TranscriptionParseError, parse_gpt_response
+
+def test_parse_gpt_response_reads_a_bare_object():
+    assert parse_gpt_response('{"name": "Ann Lee", "email": "ann@example.com", "phone": null}') == {"name": "Ann Lee", "email": "ann@example.com"}
+
+def test_parse_gpt_response_reads_fenced_json_with_trailing_commas():
+    content = 'Here is the card:\n```json\n{"name": "Ann Lee", "company": "Acme",}\n```'
+    assert parse_gpt_response(content) == {"name": "Ann Lee", "company": "Acme"}
+
+def test_parse_gpt_response_unwraps_a_wrapper_key():
+    assert parse_gpt_response('{"business_card": {"name": "Ann Lee", "job_title": "CTO"}}') == {"name": "Ann Lee", "job_title": "CTO"}
+
+def test_parse_gpt_response_keeps_a_single_structured_field():
+    # A field with an object value is not a wrapper around the card
+    assert parse_gpt_response('{"name": {"first": "Ann", "last": "Lee"}}') == {"name": {"first": "Ann", "last": "Lee"}}
+
+def test_parse_gpt_response_keeps_an_unknown_single_key_object():
+    assert parse_gpt_response('{"meta": {"confidence": 0.4}}') == {"meta": {"confidence": 0.4}}
+
+def test_parse_gpt_response_rejects_content_without_an_object():
+    with pytest.raises(TranscriptionParseError):
+        parse_gpt_response("I could not read this card.")
+
+def test_structured_name_survives_normalization():
+    from utils.normalization import normalize_transcription
+
+    record = normalize_transcription(parse_gpt_response('{"name": {"first": "Ann", "last": "Lee"}}'))
+    assert (record["first_name"], record["last_name"]) == ("Ann", "Lee")
+
+def test_a_decompression_bomb_is_refused_as_too_large(monkeypatch):
+    buffer = io.BytesIO()
+    Image.new("L", (100, 100)).save(buffer, format="PNG")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    # The default pool is a process pool, which would not see the lowered limit
+    monkeypatch.setattr(image_processing, "get_preprocess_executor", lambda: None)
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(image_processing.preprocess_image_async(buffer.getvalue()))
+
+    assert raised.value.status_code == 413
+
+def card_photo(card, description):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010e] = description  # ImageDescription
+    card.save(buffer, format="JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+def test_a_rescan_with_different_metadata_hits_the_transcription_cache(monkeypatch):
+    monkeypatch.setattr(image_processing, "get_preprocess_executor", lambda: None)
+    monkeypatch.setattr(image_processing, "LOCAL_OCR_ENABLED", False)
+    card = Image.effect_noise((400, 250), 40).convert("RGB")
+    first, rescan = card_photo(card, "booth scanner"), card_photo(card, "phone retry")
+    assert first != rescan
+
+    async def scenario():
+        processed, _ = await image_processing.preprocess_image_async(first)
+        await image_processing.transcription_cache.set(image_processing.transcription_cache_key(processed), {"name": "Ann Lee"})
+        return await image_processing.transcribe_image(rescan)
+
+    assert asyncio.run(scenario()) == {"name": "Ann Lee"}
@@ -0,0 +1,145 @@
+import asyncio
+import sqlite3
+import pytest
+from fastapi import HTTPException
+from services import jobs
+from services.jobs import JobQueue, JobWorkerPool, register_job_handler
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    yield queue
+    queue.close()
+
+def expire_leases(queue):
+    queue._conn.execute("UPDATE jobs SET locked_until = 0 WHERE status = 'running'")
+
+def make_due(queue):
+    queue._conn.execute("UPDATE jobs SET run_at = 0 WHERE status = 'retrying'")
+
+def test_submit_is_idempotent(queue):
+    async def scenario():
+        first, created = await queue.submit("scan", b"card", idempotency_key="upload-1")
+        again, created_again = await queue.submit("scan", b"card", idempotency_key="upload-1")
+        return first, created, again, created_again
+
+    first, created, again, created_again = asyncio.run(scenario())
+
+    assert (created, created_again) == (True, False)
+    assert again["job_id"] == first["job_id"]
+
+def test_an_expired_lease_hands_the_job_over_and_the_stale_outcome_is_dropped(queue):
+    async def scenario():
+        job, _ = await queue.submit("scan", b"card")
+        stalled = await queue.claim()
+        assert await queue.claim() is None
+        expire_leases(queue)
+        reclaimed = await queue.claim()
+        current = await queue.complete(job["job_id"], reclaimed["attempts"], {"lead": "from the second worker"})
+        stale = await queue.fail(job["job_id"], stalled["attempts"], "the stalled worker finally gave up")
+        return stalled, reclaimed, current, stale, await queue.get(job["job_id"])
+
+    stalled, reclaimed, current, stale, settled = asyncio.run(scenario())
+
+    assert (stalled["attempts"], reclaimed["attempts"]) == (1, 2)
+    assert (current, stale) == (True, False)
+    assert (settled["status"], settled["result"], settled["error"]) == ("succeeded", {"lead": "from the second worker"}, None)
+
+def test_a_job_that_keeps_killing_its_worker_is_failed(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+
+    async def scenario():
+        job, _ = await queue.submit("scan", b"poison")
+        claims = []
+        for _ in range(3):
+            claims.append(await queue.claim())
+            expire_leases(queue)
+        return claims, await queue.get(job["job_id"])
+
+    claims, job = asyncio.run(scenario())
+
+    assert [claim and claim["attempts"] for claim in claims] == [1, 2, None]
+    assert (job["status"], job["attempts"]) == ("failed", 2)
+    assert "stopped" in job["error"]
+
+def run_pool(queue, submit, until, concurrency=1):
+    # Runs a worker pool until `until(job)` holds for the submitted job
+    async def scenario():
+        pool = JobWorkerPool(queue, concurrency)
+        pool.start()
+        try:
+            job, _ = await queue.submit(*submit)
+            for _ in range(200):
+                job = await queue.get(job["job_id"])
+                if until(job):
+                    break
+                make_due(queue)
+                await asyncio.sleep(0.02)
+            return job, pool
+        finally:
+            await pool.stop()
+
+    return asyncio.run(scenario())
+
+def test_a_failing_job_is_retried_until_it_succeeds(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.01)
+    calls = []
+
+    @register_job_handler("flaky")
+    async def flaky(payload):
+        calls.append(payload)
+        if len(calls) < 3:
+            raise ConnectionError("provider went away")
+        return {"ok": True}
+
+    job, _ = run_pool(queue, ("flaky", b"card"), lambda job: job["status"] in jobs.TERMINAL_STATUSES)
+
+    assert (job["status"], job["attempts"], job["result"]) == ("succeeded", 3, {"ok": True})
+
+def test_a_client_error_fails_the_job_at_once(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.01)
+    calls = []
+
+    @register_job_handler("unreadable")
+    async def unreadable(payload):
+        calls.append(payload)
+        raise HTTPException(status_code=422, detail="No business card found in the image")
+
+    job, _ = run_pool(queue, ("unreadable", b"card"), lambda job: job["status"] in jobs.TERMINAL_STATUSES)
+
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 1, "No business card found in the image")
+    assert len(calls) == 1
+
+def test_a_job_is_failed_after_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+
+    @register_job_handler("broken")
+    async def broken(payload):
+        raise RuntimeError("still broken")
+
+    job, _ = run_pool(queue, ("broken", b"card"), lambda job: job["status"] in jobs.TERMINAL_STATUSES)
+
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 2, "still broken")
+
+def test_a_worker_survives_queue_errors(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.01)
+    claim = queue.claim
+    failures = [2]
+
+    async def locked_database():
+        if failures[0]:
+            failures[0] -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return await claim()
+
+    monkeypatch.setattr(queue, "claim", locked_database)
+
+    @register_job_handler("quick")
+    async def quick(payload):
+        return {"ok": True}
+
+    job, _ = run_pool(queue, ("quick", b"card"), lambda job: job["status"] == "succeeded")
+
+    assert job["status"] == "succeeded"
+    assert failures == [0]
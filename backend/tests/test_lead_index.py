@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from models.lead import Lead
+from services.lead_index import LeadIndex
+
+@pytest.fixture
+def index(tmp_path):
+    index = LeadIndex(str(tmp_path / "leads.sqlite3"))
+    yield index
+    index.close()
+
+ANN = Lead(name="Ann Lee", email="ann@acme.com", phone="+1 415 555 0100", company="Acme Inc")
+
+def test_find_matches_on_email_and_phone(index):
+    async def scenario():
+        lead_id, match = await index.add(ANN)
+        by_email = await index.find(Lead(name="A. Lee", email="ANN+expo@acme.com"))
+        by_phone = await index.find(Lead(name="Someone", phone="(415) 555-0100"))
+        unknown = await index.find(Lead(name="Bob Stone", email="bob@globex.com", company="Globex"))
+        return lead_id, match, by_email, by_phone, unknown
+
+    lead_id, match, by_email, by_phone, unknown = asyncio.run(scenario())
+
+    assert match is None
+    assert (by_email.lead_id, by_email.matched_on) == (lead_id, "email")
+    assert (by_phone.lead_id, by_phone.matched_on) == (lead_id, "phone")
+    assert unknown is None
+
+def test_find_matches_a_misread_name_at_the_same_company(index):
+    async def scenario():
+        await index.add(ANN)
+        return await index.find_many([
+            Lead(name="Ann Lea", company="ACME"),
+            Lead(name="Ann Lea", company="Globex"),
+        ])
+
+    same_company, other_company = asyncio.run(scenario())
+
+    assert same_company.matched_on == "name_company"
+    assert other_company is None
+
+def test_add_merges_a_duplicate_and_keeps_all_its_keys(index):
+    async def scenario():
+        first, _ = await index.add(ANN)
+        second, match = await index.add(Lead(name="Ann Lee", email="ann.lee@gmail.com", phone="+1 415 555 0100"))
+        return first, second, match, await index.find(Lead(name="Ann", email="ann.lee@gmail.com"))
+
+    first, second, match, by_new_email = asyncio.run(scenario())
+
+    assert second == first and match.matched_on == "phone"
+    assert by_new_email.lead_id == first
+    assert index.stats()["leads"] == 1
+
+def test_find_sees_leads_added_by_another_worker(tmp_path):
+    path = str(tmp_path / "leads.sqlite3")
+    writer, reader = LeadIndex(path), LeadIndex(path)
+
+    async def scenario():
+        assert await reader.find(ANN) is None
+        lead_id, _ = await writer.add(ANN)
+        return lead_id, await reader.find(ANN)
+
+    try:
+        lead_id, match = asyncio.run(scenario())
+    finally:
+        writer.close()
+        reader.close()
+
+    assert match.lead_id == lead_id
+
+def test_a_name_alone_is_not_a_duplicate(index):
+    async def scenario():
+        await index.add(Lead(name="John Smith"))
+        await index.add(Lead(name="Maria Garcia", company="Acme"))
+        return await index.find_many([
+            Lead(name="John Smith"),
+            Lead(name="John Smith", company="Globex"),
+            Lead(name="Maria Garcia"),
+        ])
+
+    assert asyncio.run(scenario()) == [None, None, None]
+    assert index.stats()["leads"] == 2
+
+def test_two_namesakes_without_company_are_kept_apart(index):
+    async def scenario():
+        first, _ = await index.add(Lead(name="John Smith", phone="555-0100"))
+        second, match = await index.add(Lead(name="John Smith", phone="555-0199"))
+        return first, second, match
+
+    first, second, match = asyncio.run(scenario())
+
+    assert match is None and first != second
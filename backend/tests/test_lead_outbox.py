@@ -0,0 +1,177 @@
+import asyncio
+import time
+import pytest
+from models.lead import Lead
+from models.oauth import OAuthCredentials
+from services import lead_outbox
+from services.lead_index import LeadIndex
+from services.lead_outbox import LeadOutbox, OutboxSync
+
+CONSUMER = "zoho:acme"
+
+class FakeCRM:
+    # Stands in for send_leads_to_crm; `answer` gives the result for each lead of a push
+    def __init__(self):
+        self.pushes = []
+        self.delay = 0.0
+        self.answer = lambda lead: {"status": "success", "id": f"id-{lead.name}"}
+
+    async def __call__(self, crm_name, leads, credentials, upsert=None):
+        self.pushes.append(([lead.name for lead in leads], list(upsert or [False] * len(leads))))
+        await asyncio.sleep(self.delay)
+        return [{"index": index, **self.answer(lead)} for index, lead in enumerate(leads)]
+
+@pytest.fixture
+def crm(monkeypatch, tmp_path):
+    fake = FakeCRM()
+
+    async def stored_credentials(tenant_id, crm_name):
+        return OAuthCredentials(access_token="token")
+
+    monkeypatch.setattr(lead_outbox, "send_leads_to_crm", fake)
+    monkeypatch.setattr(lead_outbox.token_store, "get", stored_credentials)
+    monkeypatch.setattr(lead_outbox, "lead_index", LeadIndex(str(tmp_path / "leads.sqlite3")))
+    return fake
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = LeadOutbox(str(tmp_path / "outbox.sqlite3"))
+    yield outbox
+    outbox.close()
+
+def lead(name, **fields):
+    return Lead(name=name, **fields)
+
+def deliveries(outbox):
+    return outbox._conn.execute(
+        "SELECT seq, status, attempts, next_attempt_at FROM outbox_deliveries WHERE consumer = ? ORDER BY seq", (CONSUMER,)
+    ).fetchall()
+
+def make_due(outbox):
+    outbox._conn.execute("UPDATE outbox_deliveries SET next_attempt_at = 0")
+
+def test_checkpoint_waits_for_a_retrying_lead(crm, outbox):
+    sync = OutboxSync(outbox, "zoho", "acme")
+    crm.answer = lambda lead: {"status": "error", "message": "INVALID_DATA"} if lead.name == "Bo Bad" else {"status": "success", "id": "1"}
+
+    async def scenario():
+        for name in ("Ann Lee", "Bo Bad", "Cy Young"):
+            await outbox.append(lead(name, email=f"{name.split()[0].lower()}@example.com"))
+        first = await sync.sync_once()
+        after_first = await outbox.stats(CONSUMER)
+        crm.answer = lambda lead: {"status": "success", "id": "2"}
+        make_due(outbox)
+        second = await sync.sync_once()
+        return first, after_first, second, await outbox.stats(CONSUMER)
+
+    first, after_first, second, after_second = asyncio.run(scenario())
+
+    assert first == 3
+    # Cy was sent out of order behind Bo, so the checkpoint stays below Bo
+    assert (after_first["checkpoint"], after_first["retrying"], after_first["lag"]) == (1, 1, 2)
+    assert second == 1 and crm.pushes[-1][0] == ["Bo Bad"]
+    assert (after_second["checkpoint"], after_second["retrying"], after_second["lag"]) == (3, 0, 0)
+    # Sent leads behind the checkpoint need no bookkeeping
+    assert deliveries(outbox) == []
+
+def test_a_rejected_lead_is_set_aside_after_max_attempts(crm, outbox, monkeypatch):
+    monkeypatch.setattr(lead_outbox, "OUTBOX_SYNC_MAX_ATTEMPTS", 2)
+    sync = OutboxSync(outbox, "zoho", "acme")
+    crm.answer = lambda lead: {"status": "error", "message": "INVALID_DATA"}
+
+    async def scenario():
+        await outbox.append(lead("Bo Bad"))
+        for _ in range(3):
+            make_due(outbox)
+            await sync.sync_once()
+        return await outbox.stats(CONSUMER)
+
+    stats = asyncio.run(scenario())
+
+    assert len(crm.pushes) == 2
+    assert (stats["checkpoint"], stats["failed"], stats["retrying"]) == (1, 1, 0)
+
+def test_an_outage_uses_up_no_attempts_and_backs_off(crm, outbox, monkeypatch):
+    monkeypatch.setattr(lead_outbox, "OUTBOX_SYNC_MAX_ATTEMPTS", 2)
+    sync = OutboxSync(outbox, "zoho", "acme")
+    crm.answer = lambda lead: {"status": "error", "message": "zoho is unavailable: circuit breaker is open", "outage": True}
+
+    async def scenario():
+        await outbox.append(lead("Ann Lee", email="ann@example.com"))
+        delays = []
+        for _ in range(5):
+            make_due(outbox)
+            started = time.time()
+            await sync.sync_once()
+            ((_, status, attempts, next_attempt_at),) = deliveries(outbox)
+            assert (status, attempts) == ("retrying", 0)
+            delays.append(next_attempt_at - started)
+        crm.answer = lambda lead: {"status": "success", "id": "1"}
+        make_due(outbox)
+        await sync.sync_once()
+        return delays, await outbox.stats(CONSUMER)
+
+    delays, stats = asyncio.run(scenario())
+
+    assert all(later > earlier for earlier, later in zip(delays, delays[1:]))
+    assert sync._outages == 0
+    assert (stats["checkpoint"], stats["failed"]) == (1, 0)
+
+def test_repeats_within_a_batch_are_pushed_once(crm, outbox):
+    sync = OutboxSync(outbox, "zoho", "acme")
+
+    async def scenario():
+        await outbox.append(lead("Ann Lee", email="ann@example.com"))
+        await outbox.append(lead("Ann Lee", email="ANN@example.com", phone="+1 415 555 0100"))
+        await outbox.append(lead("Ann L.", phone="(415) 555-0100"))
+        await outbox.append(lead("John Smith"))
+        await outbox.append(lead("John Smith"))
+        await outbox.append(lead("Maria Garcia", company="Acme"))
+        await outbox.append(lead("Maria Garcia", company="Acme Inc."))
+        synced = await sync.sync_once()
+        return synced, await outbox.stats(CONSUMER)
+
+    synced, stats = asyncio.run(scenario())
+
+    # Namesakes without a company are different people; the same name at the same company is one card
+    assert crm.pushes == [(["Ann Lee", "John Smith", "John Smith", "Maria Garcia"], [False, False, False, False])]
+    assert synced == 7 and stats["checkpoint"] == 7
+
+def test_settle_is_dropped_once_another_worker_took_the_lease(crm, outbox):
+    first, second = OutboxSync(outbox, "zoho", "acme"), OutboxSync(outbox, "zoho", "acme")
+
+    async def scenario():
+        await outbox.append(lead("Ann Lee", email="ann@example.com"))
+        claimed = await outbox.claim(CONSUMER, first.owner, 10)
+        # The first worker stalls past its lease and the second one takes over
+        outbox._conn.execute("UPDATE outbox_consumers SET lease_until = 0")
+        taken_over = await outbox.claim(CONSUMER, second.owner, 10)
+        stale = await outbox.settle(CONSUMER, first.owner, [(claimed[0].cursor, {"status": "error", "message": "late"})])
+        current = await outbox.settle(CONSUMER, second.owner, [(taken_over[0].cursor, {"status": "success", "id": "1"})])
+        return claimed, taken_over, stale, current, await outbox.stats(CONSUMER)
+
+    claimed, taken_over, stale, current, stats = asyncio.run(scenario())
+
+    assert [entry.cursor for entry in claimed] == [entry.cursor for entry in taken_over] == [1]
+    # The second claim saw the first push cut off, so it goes out as an upsert
+    assert taken_over[0].uncertain
+    assert (stale, current) == (False, True)
+    assert (stats["checkpoint"], stats["retrying"], stats["failed"]) == (1, 0, 0)
+
+def test_the_lease_is_renewed_during_a_slow_push(crm, outbox, monkeypatch):
+    monkeypatch.setattr(lead_outbox, "OUTBOX_SYNC_LEASE_SECONDS", 0.3)
+    crm.delay = 0.8
+    first, second = OutboxSync(outbox, "zoho", "acme"), OutboxSync(outbox, "zoho", "acme")
+
+    async def scenario():
+        await outbox.append(lead("Ann Lee", email="ann@example.com"))
+        push = asyncio.ensure_future(first.sync_once())
+        await asyncio.sleep(0.6)
+        # Well past the original lease, but the first worker is still pushing
+        competing = await second.sync_once()
+        return await push, competing
+
+    pushed, competing = asyncio.run(scenario())
+
+    assert (pushed, competing) == (1, 0)
+    assert len(crm.pushes) == 1
@@ -0,0 +1,59 @@
+import pytest
+from utils.normalization import normalize_email, normalize_phone, normalize_transcription, split_person_name
+
+@pytest.mark.parametrize("raw, expected", [
+    ("+1 (415) 555-0100", "+14155550100"),
+    ("415.555.0100", "+14155550100"),
+    ("1-415-555-0100 ext. 12", "+14155550100"),
+    ("0044 20 7946 0958", "+442079460958"),
+    ("+49 (0)30 1234567", "+49301234567"),
+    ("+44 (0)20 7946 0958", "+442079460958"),
+    ("+33 6 12 34 56 78", "+33612345678"),
+])
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
+
+@pytest.mark.parametrize("raw", [
+    # A local number or a fragment is no full number; nothing is made up for it
+    "555-0100",
+    "0100",
+    "+1 555 0100",
+    "+33 6 12 34",
+    None,
+    "",
+])
+def test_normalize_phone_rejects_incomplete_numbers(raw):
+    assert normalize_phone(raw) is None
+
+def test_normalize_phone_uses_the_given_country_code():
+    assert normalize_phone("030 1234567", default_country_code="49") == "+49301234567"
+    assert normalize_phone("030 1234567", default_country_code="") is None
+
+def test_normalize_email_drops_sub_addresses():
+    assert normalize_email(" Jane+Expo@Acme.COM") == "jane@acme.com"
+    assert normalize_email("not an email") is None
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Doe, Jane", ("Jane", "Doe")),
+    ("Dr. Jane Doe, PhD", ("Jane", "Doe")),
+    ("Jane van der Berg", ("Jane", "van der Berg")),
+])
+def test_split_person_name(raw, expected):
+    assert split_person_name(raw) == expected
+
+def test_transcription_keeps_a_phone_it_cannot_complete():
+    record = normalize_transcription({"name": "Ann Lee", "phone": "555-0100"})
+    assert record["phone"] == "555-0100"
+
+def test_transcription_does_not_take_an_email_for_the_website():
+    assert normalize_transcription({"name": "Ann Lee", "website": "info@acme.com"})["website"] is None
+    assert normalize_transcription({"name": "Ann Lee", "website": "www.acme.com"})["website"] == "https://www.acme.com"
+    assert normalize_transcription({"name": "Ann Lee", "website": "https://acme.com/team"})["website"] == "https://acme.com/team"
+
+def test_transcription_finds_contact_details_in_other_fields():
+    record = normalize_transcription({
+        "name": "Ann Lee",
+        "address": "1 Main St, Austin TX - ANN@ACME.COM - linkedin.com/in/annlee",
+        "phone": ["+1 415 555 0100", "+1 415 555 0101"],
+    })
+    assert (record["email"], record["linkedin_profile"], record["phone"]) == ("ann@acme.com", "https://linkedin.com/in/annlee", "+14155550100")
@@ -0,0 +1,27 @@
+from services.prompt_compaction import compact_public_data
+
+REPORT = "Ann Lee is the CEO of Acme Inc, a robotics firm based in Austin."
+
+def test_a_sentence_repeated_across_sources_is_kept_once():
+    compacted = compact_public_data({
+        "serper_data": {"organic": [{"title": "Ann Lee", "link": "https://acme.com/team", "snippet": REPORT}]},
+        "perplexity_data": {"report": f"{REPORT} She previously led engineering at Initech."},
+    })
+
+    assert compacted.text.count("robotics firm") == 1
+    assert "She previously led engineering at Initech." in compacted.text
+
+def test_a_long_sentence_inside_a_longer_one_is_a_repeat():
+    compacted = compact_public_data({
+        "perplexity_data": {"report": f"{REPORT[:-1]} and a former Tesla engineer."},
+        "serper_data": {"organic": [{"title": "Ann Lee", "link": "https://acme.com/team", "snippet": REPORT}]},
+    })
+
+    assert compacted.text.count("robotics firm") == 1
+
+def test_short_values_inside_longer_text_are_not_repeats():
+    compacted = compact_public_data({
+        "serper_data": {"organic": [{"title": "Acme Inc", "link": "https://acme.com", "snippet": f"{REPORT} Acme Inc. CEO. Austin."}]},
+    })
+
+    assert "Acme Inc. CEO. Austin." in compacted.text
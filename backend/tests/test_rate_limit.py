@@ -0,0 +1,178 @@
+import asyncio
+import time
+import pytest
+from services import rate_limit
+from services.rate_limit import CircuitBreaker, ProviderUnavailable, RateLimitPolicy, RateLimiterRegistry, TokenBucket, UpstreamError
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(rate_limit, "WORKERS", 1)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_MAX_RETRIES", 2)
+    monkeypatch.setattr(rate_limit, "backoff_delay", lambda attempt: 0.0)
+    registry = RateLimiterRegistry()
+    registry.configure("test", RateLimitPolicy(rate=1000, burst=10))
+    return registry
+
+class Provider:
+    # Answers each call with the next outcome; an exception instance is raised, anything else returned
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.opened_at -= breaker.recovery_timeout
+
+def test_the_bucket_spends_its_burst_then_waits_for_the_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=20, burst=3)
+        waits = [await bucket.acquire() for _ in range(4)]
+        return waits
+
+    waits = asyncio.run(scenario())
+
+    assert all(wait < 0.01 for wait in waits[:3])
+    assert 0.03 < waits[3] < 0.2
+
+def test_a_paused_bucket_waits_out_the_pause():
+    async def scenario():
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.pause(0.1)
+        return await bucket.acquire()
+
+    assert asyncio.run(scenario()) >= 0.09
+
+def test_the_bucket_trusts_a_lower_count_from_the_provider():
+    bucket = TokenBucket(rate=1, burst=10)
+
+    bucket.sync(remaining=2, reset=None)
+    assert bucket.tokens <= 2.01
+    bucket.sync(remaining=50, reset=None)
+    assert bucket.tokens <= 2.01
+
+    bucket.sync(remaining=0, reset=5)
+    assert bucket.blocked_until - time.monotonic() > 4
+
+def test_the_breaker_opens_after_the_threshold_and_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow() and not breaker.available()
+
+    breaker.opened_at -= 30
+    assert breaker.available()
+    assert breaker.allow() and breaker.state == "half_open"
+    # Everyone else waits for the probe
+    assert not breaker.allow() and not breaker.available()
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_a_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    open_breaker(breaker)
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert (breaker.state, breaker.times_opened) == ("open", 2)
+    assert not breaker.allow()
+
+def test_only_the_probe_can_give_its_slot_back():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    open_breaker(breaker)
+    assert breaker.allow()
+    probe = breaker.probes
+
+    breaker.release_probe(None)
+    assert not breaker.allow()
+    breaker.release_probe(probe - 1)
+    assert not breaker.allow()
+    breaker.release_probe(probe)
+    assert breaker.allow()
+
+def test_server_errors_are_retried(registry):
+    provider = Provider(UpstreamError("test", 502), UpstreamError("test", 503), "ok")
+
+    assert asyncio.run(registry.call("test", provider)) == "ok"
+    assert provider.calls == 3
+    stats = registry.limiter("test").stats
+    assert (stats.retries, stats.failures) == (2, 2)
+
+def test_the_provider_is_unavailable_after_max_retries(registry):
+    provider = Provider(*[UpstreamError("test", 500)] * 3)
+
+    with pytest.raises(ProviderUnavailable) as raised:
+        asyncio.run(registry.call("test", provider))
+
+    assert provider.calls == 3
+    assert raised.value.status_code == 503
+
+def test_a_non_idempotent_request_is_not_resent_after_a_server_error(registry):
+    provider = Provider(UpstreamError("test", 500), "ok")
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(registry.call("test", provider, idempotent=False))
+
+    assert provider.calls == 1
+
+def test_a_429_pauses_everyone_on_the_key_and_is_resent(registry):
+    provider = Provider(UpstreamError("test", 429, retry_after=0.1), "ok")
+
+    async def scenario():
+        started = time.monotonic()
+        result = await registry.call("test", provider, idempotent=False)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(scenario())
+
+    assert (result, provider.calls) == ("ok", 2)
+    assert elapsed >= 0.09
+    limiter = registry.limiter("test")
+    assert (limiter.stats.throttled, limiter.breaker.failures) == (1, 0)
+
+def test_a_client_error_is_raised_without_a_retry(registry):
+    provider = Provider(UpstreamError("test", 400), "ok")
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(registry.call("test", provider))
+
+    assert provider.calls == 1
+    assert registry.limiter("test").breaker.state == "closed"
+
+def test_a_cancelled_caller_frees_the_probe_only_if_it_held_it(registry):
+    breaker = registry.limiter("test").breaker
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def scenario():
+        # Already in flight when the breaker opens
+        in_flight = asyncio.ensure_future(registry.call("test", hang))
+        await asyncio.sleep(0.01)
+        open_breaker(breaker)
+        probe = asyncio.ensure_future(registry.call("test", hang))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open" and not breaker.available()
+
+        in_flight.cancel()
+        await asyncio.gather(in_flight, return_exceptions=True)
+        held_after_in_flight = not breaker.available()
+
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        return held_after_in_flight, breaker.available()
+
+    held_after_in_flight, freed_after_probe = asyncio.run(scenario())
+
+    assert held_after_in_flight
+    assert freed_after_probe
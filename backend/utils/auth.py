@@ -0,0 +1,6 @@
+from fastapi import Header, HTTPException
+
+async def get_api_key(api_key: str = Header(...)):
+    expected_api_key = "test"
+    if api_key != expected_api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from typing import Any, Dict, Optional, Tuple
+from config import DEFAULT_PHONE_COUNTRY_CODE
+
+COMPANY_SUFFIXES = {
+    "inc", "incorporated", "llc", "llp", "ltd", "limited", "corp", "corporation", "co", "company",
+    "gmbh", "ag", "sa", "sas", "srl", "bv", "nv", "plc", "pty", "pvt", "oy", "ab", "kk",
+}
+PHONE_EXTENSION = re.compile(r"\s*(?:ext\.?|extension|x|#)\s*\d+\s*$", re.IGNORECASE)
+
+TRANSCRIPTION_FIELDS = ("name", "job_title", "company", "email", "phone", "website", "address", "linkedin_profile")
+EMAIL_PATTERN = re.compile(r"[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}", re.IGNORECASE)
+URL_PATTERN = re.compile(r"(?<![@\w.-])(?:https?://)?(?:[a-z0-9-]+\.)+[a-z]{2,}(?:/[^\s,;]*)?", re.IGNORECASE)
+LINKEDIN_PATTERN = re.compile(r"(?:https?://)?(?:[a-z]{2,3}\.)?linkedin\.com/(?:in|pub)/[^\s/?#,;]+", re.IGNORECASE)
+PHONE_PATTERN = re.compile(r"\+?\(?\d[\d\s().-]{5,}\d")
+TRUNK_PREFIX = re.compile(r"\(0\)")
+# Digits in a complete national number, for countries where that length is fixed (or nearly)
+NATIONAL_NUMBER_DIGITS = {"1": (10, 10), "7": (10, 10), "33": (9, 9), "44": (9, 10), "61": (9, 9), "91": (10, 10)}
+NAME_PREFIXES = {"mr", "mrs", "ms", "miss", "mx", "dr", "prof", "sir"}
+NAME_SUFFIXES = {"jr", "sr", "ii", "iii", "iv", "phd", "md", "mba", "cpa", "esq"}
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    if not email or "@" not in email:
+        return None
+    local, _, domain = email.strip().lower().rpartition("@")
+    # Sub-addresses ("jane+expo@acme.com") reach the same inbox
+    local = local.split("+", 1)[0]
+    if not local or not domain:
+        return None
+    return f"{local}@{domain}"
+
+def normalize_phone(phone: Optional[str], default_country_code: str = DEFAULT_PHONE_COUNTRY_CODE) -> Optional[str]:
+    # Best-effort E.164 ("+14155550100") without a numbering-plan database; None when the input cannot be
+    # a complete number (a local "555-0100"), so no number is made up
+    if not phone:
+        return None
+    phone = PHONE_EXTENSION.sub("", phone.strip())
+    digits = re.sub(r"\D", "", phone)
+    if phone.startswith("+") or digits.startswith("00"):
+        # The national trunk prefix some cards print after the country code ("+49 (0)30 ...") is not dialled
+        digits = re.sub(r"\D", "", TRUNK_PREFIX.sub("", phone))
+        number = digits[2:] if digits.startswith("00") else digits
+    elif default_country_code and digits.startswith(default_country_code) and len(digits) > 10:
+        number = digits
+    elif default_country_code:
+        # Drop the national trunk prefix ("020 ..." in the UK, "0 6 ..." in France)
+        number = default_country_code + digits.lstrip("0")
+    else:
+        return None
+    if not 8 <= len(number) <= 15:
+        return None
+    # Country codes are prefix-free, so at most one of them starts the number
+    for country_code, (shortest, longest) in NATIONAL_NUMBER_DIGITS.items():
+        if number.startswith(country_code) and not shortest <= len(number) - len(country_code) <= longest:
+            return None
+    return f"+{number}"
+
+def normalize_text(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    value = re.sub(r"[^\w\s]", " ", value.lower())
+    return " ".join(value.split())
+
+def normalize_name(name: Optional[str]) -> str:
+    return normalize_text(name)
+
+def normalize_company(company: Optional[str]) -> str:
+    tokens = normalize_text(company).split()
+    # Keep the suffix if it is the whole name ("The Company")
+    while len(tokens) > 1 and tokens[-1] in COMPANY_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)
+
+def split_person_name(name: Optional[str]) -> Tuple[str, str]:
+    name = " ".join((name or "").split())
+    if "," in name:
+        # "Doe, Jane" as printed on some cards, unless the comma only introduces a suffix ("Jane Doe, PhD")
+        last, _, first = name.partition(",")
+        if first.strip().strip(".").lower() not in NAME_SUFFIXES:
+            name = f"{first.strip()} {last.strip()}"
+        else:
+            name = last
+    tokens = name.replace(",", " ").split()
+    while tokens and tokens[0].strip(".").lower() in NAME_PREFIXES:
+        tokens.pop(0)
+    while len(tokens) > 1 and tokens[-1].strip(".").lower() in NAME_SUFFIXES:
+        tokens.pop()
+    if not tokens:
+        return "", ""
+    return tokens[0], " ".join(tokens[1:])
+
+def normalize_transcription(transcription: Dict[str, Any]) -> Dict[str, Any]:
+    record = {field: field_text(transcription.get(field)) for field in TRANSCRIPTION_FIELDS}
+    # The email and LinkedIn URL are also looked for in the other fields, where the model sometimes puts them
+    text = " ".join(value for value in record.values() if value)
+
+    first_name, last_name = split_person_name(record["name"])
+    email = first_match(EMAIL_PATTERN, record["email"]) or first_match(EMAIL_PATTERN, text)
+    linkedin = first_match(LINKEDIN_PATTERN, record["linkedin_profile"]) or first_match(LINKEDIN_PATTERN, text)
+    phone = first_match(PHONE_PATTERN, record["phone"])
+    return {
+        "first_name": first_name,
+        "last_name": last_name,
+        "name": f"{first_name} {last_name}".strip(),
+        "email": email.lower() if email else None,
+        "phone": normalize_phone(phone) or phone,
+        "company": record["company"],
+        "job_title": record["job_title"],
+        "address": record["address"],
+        "website": with_scheme(first_match(URL_PATTERN, record["website"])),
+        "linkedin_profile": with_scheme(linkedin),
+    }
+
+def field_text(value: Any) -> Optional[str]:
+    # The model occasionally returns a list (several phone numbers), an object ({"first": ..., "last": ...})
+    # or a number for a field
+    if isinstance(value, dict):
+        value = " ".join(str(item) for item in value.values() if item)
+    if isinstance(value, list):
+        value = next((item for item in value if item), None)
+    if value is None:
+        return None
+    value = " ".join(str(value).split())
+    return value or None
+
+def first_match(pattern: "re.Pattern[str]", value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    match = pattern.search(value)
+    return match.group(0).rstrip(".") if match else None
+
+def with_scheme(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    return url if url.lower().startswith(("http://", "https://")) else f"https://{url}"
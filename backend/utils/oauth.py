@@ -1,16 +1,30 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from models.oauth import OAuthCredentials
+from services.token_store import token_store
+from utils.auth import get_api_key
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-async def get_oauth_credentials(token: str = Depends(oauth2_scheme)) -> OAuthCredentials:
-    # In a real-world scenario, you would validate the token and retrieve the corresponding credentials
-    # This is a simplified example
-    if token == "fake_token":
+async def get_tenant_id(x_tenant_id: str = Header("default"), api_key: None = Depends(get_api_key)) -> str:
+    # A tenant's stored CRM credentials are only used on behalf of callers holding the API key
+    return x_tenant_id
+
+async def get_oauth_credentials(
+    crm_name: str,
+    tenant_id: str = Depends(get_tenant_id),
+    token: Optional[str] = Depends(oauth2_scheme),
+) -> OAuthCredentials:
+    # Stored (and automatically refreshed) credentials for the tenant win; a bearer
+    # token is passed through as caller-managed credentials when none are stored
+    credentials = await token_store.get(tenant_id, crm_name)
+    if credentials is not None:
+        return credentials
+    if token:
         return OAuthCredentials(access_token=token)
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid authentication credentials",
+        detail=f"No {crm_name} credentials for this tenant. Connect the CRM through /oauth/{crm_name}/initiate first.",
         headers={"WWW-Authenticate": "Bearer"},
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,25 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Optional
+from fastapi.encoders import jsonable_encoder
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+SSE_MEDIA_TYPE = "text/event-stream"
+# Keeps proxies (nginx in particular) from buffering the events until the response ends
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def ndjson_line(payload: Any) -> str:
+    return json.dumps(jsonable_encoder(payload)) + "\n"
+
+def sse_event(payload: Any, event: Optional[str] = None) -> str:
+    data = json.dumps(jsonable_encoder(payload))
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
+
+def csv_line(values: Iterable[Any]) -> str:
+    # csv.writer quotes and escapes; None becomes an empty field
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
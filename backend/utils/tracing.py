@@ -0,0 +1,83 @@
+import logging
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Tuple
+from config import PROFILING_ENABLED, SLOW_REQUEST_SECONDS
+from services.telemetry import (
+    http_request_seconds,
+    request_id_var,
+    start_profile,
+    stop_profile,
+    summarize_trace,
+    trace_var,
+)
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+PROFILE_HEADER_VALUES = (b"1", b"true")
+
+class TracingMiddleware:
+    # Gives every request an ID (the caller's X-Request-ID when it is sane), collects the spans it
+    # runs, reports them as Server-Timing and in the request histogram, and profiles the request
+    # when profiling is enabled and the caller sends X-Profile: 1.
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        trace: List[Tuple[str, float]] = []
+        request_id_token = request_id_var.set(request_id)
+        trace_token = trace_var.set(trace)
+        # Profiles the event loop thread, so concurrent requests show up in the profile too;
+        # meant for reproducing a slow scan on a quiet instance, not for production traffic
+        profiler = start_profile() if PROFILING_ENABLED and headers.get(b"x-profile", b"").lower() in PROFILE_HEADER_VALUES else None
+
+        start = time.perf_counter()
+        status = 500
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"x-request-id", request_id.encode("latin-1"))]
+                if trace:
+                    # Streaming responses start before the later stages run; those only reach the logs
+                    extra.append((b"server-timing", server_timing(trace).encode("latin-1")))
+                message = {**message, "headers": [*message.get("headers", []), *extra]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_request_seconds.observe(elapsed, method=scope["method"], route=self.route(scope), status=status)
+            if profiler is not None:
+                stop_profile(profiler, request_id)
+            if elapsed >= SLOW_REQUEST_SECONDS:
+                stages = " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in summarize_trace(trace))
+                logger.warning("Slow request %s %s: %d in %.0fms %s", scope["method"], scope["path"], status, elapsed * 1000, stages)
+            trace_var.reset(trace_token)
+            request_id_var.reset(request_id_token)
+
+    def route(self, scope: Dict[str, Any]) -> str:
+        # The path template ("/jobs/{job_id}") rather than the raw path keeps the label set bounded
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            paths = [route.path for route in scope["app"].routes if getattr(route, "endpoint", None) is endpoint]
+            self._routes[endpoint] = paths[0] if paths else "unmatched"
+        return self._routes[endpoint]
+
+def server_timing(trace: List[Tuple[str, float]]) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in summarize_trace(trace))